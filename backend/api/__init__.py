@@ -24,6 +24,9 @@ api_router.include_router(history_router, tags=["history"])
 
 # Let's mount auth_router separately in backend_server.py to ensure /login at root.
 
+# The /api/analyze handlers are plain `def`, not `async def`: their blocking
+# requests.post to the services run in FastAPI's threadpool instead of stalling
+# the event loop for every other in-flight request. Keep new ones that way.
 api_router.include_router(message_router, prefix="/api/analyze", tags=["analyze-message"])
 api_router.include_router(link_router, prefix="/api/analyze", tags=["analyze-link"])
 api_router.include_router(file_router, prefix="/api/analyze", tags=["analyze-file"])
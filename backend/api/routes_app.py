@@ -17,7 +17,7 @@ import requests
 app_router = APIRouter()
 
 @app_router.post("/app", summary="Analyze a suspicious app")
-async def analyze_app(request: AppRequest):
+def analyze_app(request: AppRequest):
     url = "http://services:8001/analyze_app"
     payload = {"app_ref": request.app, "instructions": request.instructions}
 
@@ -11,7 +11,8 @@ def login(username: str = Body(...), password: str = Body(...)):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        query = "SELECT * FROM Accounts WHERE Username=%s AND Password=%s"
+        # Only the id is needed; Username is UNIQUE so this is a single index lookup
+        query = "SELECT AccountID FROM Accounts WHERE Username=%s AND Password=%s LIMIT 1"
         cursor.execute(query, (username, password))
         user = cursor.fetchone()
         if user:
@@ -17,7 +17,7 @@ import requests
 file_router = APIRouter()
 
 @file_router.post("/file", summary="Analyze a suspicious file")
-async def analyze_file(request: FileRequest):
+def analyze_file(request: FileRequest):
     url = "http://services:8001/analyze_file"
     payload = {"file": request.file}
 
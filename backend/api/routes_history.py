@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional
+import orjson
+import pymysql
 from core.db import get_db_connection
 
 ###############################################################################
@@ -8,12 +11,14 @@ from core.db import get_db_connection
 #
 # Purpose:
 # Implements:
-# - GET /search_history?AccountID=... : Retrieve user’s history records
+# - GET /search_history?AccountID=...&limit=...&offset=... : Retrieve user’s history records
+#   (paged by HistoryID; served by the idx_hist_acc (AccountID, HistoryID) index)
 # - POST /add_history : Add a new history record
 #
 # Design & Philosophy:
 # - Similar to the original Flask code given by the user, but now in FastAPI style.
 # - If no records found, return 404.
+# - /search_history streams its JSON body (SSDictCursor + orjson + StreamingResponse).
 # - On DB or server errors, return 500.
 # - POST /add_history expects JSON with AccountID, isMalicious, analysisType, Report,
 #   Confidence, and analysisContent.
@@ -24,26 +29,56 @@ from core.db import get_db_connection
 
 history_router = APIRouter()
 
+# Columns returned by /search_history
+HISTORY_COLUMNS = "HistoryID, AccountID, analysisType, analysisContent, isMalicious, Confidence, Report"
+# Rows serialized per chunk written to the client
+HISTORY_STREAM_BATCH = 100
+
 @history_router.get("/search_history")
-def search_history(AccountID: int = Query(..., description="AccountID to query history for")):
+def search_history(AccountID: int = Query(..., description="AccountID to query history for"),
+                   limit: int = Query(500, ge=1, le=5000, description="Maximum number of records to return"),
+                   offset: int = Query(0, ge=0, description="Number of records to skip")):
+    # Rows are read through a server-side cursor and streamed to the client as
+    # they arrive, so the full history is never held in memory at once.
+    conn = None
+    cursor = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        query = "SELECT * FROM Historys WHERE AccountID = %s"
-        cursor.execute(query, (AccountID,))
-        histories = cursor.fetchall()
-        if not histories:
-            # No history records found
-            return {"success": False, "message": "No history records found for this AccountID"}, 404
-        return {"success": True, "histories": histories}
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        query = (f"SELECT {HISTORY_COLUMNS} FROM Historys WHERE AccountID = %s "
+                 "ORDER BY HistoryID LIMIT %s OFFSET %s")
+        cursor.execute(query, (AccountID, limit, offset))
+        first = cursor.fetchone()
     except Exception as e:
-        # Log or raise an HTTPException(500)
+        _close(cursor, conn)
         raise HTTPException(status_code=500, detail="Server error")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+
+    if first is None:
+        _close(cursor, conn)
+        # No history records found
+        return JSONResponse(status_code=404,
+                            content={"success": False, "message": "No history records found for this AccountID"})
+
+    def stream_rows():
+        try:
+            chunk = [b'{"success":true,"histories":[', orjson.dumps(first)]
+            for row in cursor:
+                chunk.append(b"," + orjson.dumps(row))
+                if len(chunk) >= HISTORY_STREAM_BATCH:
+                    yield b"".join(chunk)
+                    chunk = []
+            chunk.append(b"]}")
+            yield b"".join(chunk)
+        finally:
+            _close(cursor, conn)
+
+    return StreamingResponse(stream_rows(), media_type="application/json")
+
+def _close(cursor, conn):
+    if cursor:
+        cursor.close()
+    if conn:
+        conn.close()
 
 
 class AddHistoryRequest(BaseModel):
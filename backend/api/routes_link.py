@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from data_models.schemas import LinkRequest
+from core.background_tasks import submit_analysis
+from core.hot_cache import TTLCache
 import requests
 
 ###############################################################################
@@ -12,19 +15,46 @@ import requests
 # 1) Validate LinkRequest
 # 2) requests.post(...) to services:8001/analyze_link
 # 3) Return services JSON
+#
+# With ?background=true the services call runs on the background pool
+# instead: the response is 202 {"task_id":...,"status":"pending"} and the
+# result is polled at GET /api/task/{task_id}.
+#
+# Synchronous calls are remembered for HOT_CACHE_TTL seconds per
+# (client IP, url, visual_verify), so a client retrying the same link gets
+# the earlier answer without another services call.
 ###############################################################################
 
 link_router = APIRouter()
 
+# Recent successful results, keyed by (client IP, url, visual_verify)
+_hot = TTLCache()
+
 @link_router.post("/link", summary="Analyze a suspicious link")
-async def analyze_link(request: LinkRequest):
-    url = "http://services:8001/analyze_link"
+def analyze_link(request: LinkRequest, http_request: Request,
+                 background: bool = Query(False, description="Return a task_id immediately and analyze in the background")):
     link_url = str(request.url).rstrip('/')
     payload = {"url": link_url, "visual_verify": request.visual_verify}
 
+    if background:
+        task_id = submit_analysis("link", link_url, lambda: call_link_service(payload))
+        return JSONResponse(status_code=202, content={"task_id": task_id, "status": "pending"})
+
+    client_ip = http_request.client.host if http_request.client else ""
+    key = (client_ip, link_url, request.visual_verify)
+    cached = _hot.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.post(url, json=payload, timeout=60)
-        response.raise_for_status()
-        return response.json()
+        result = call_link_service(payload)
     except requests.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+    if result.get("status") != "error":
+        _hot.set(key, result)
+    return result
+
+def call_link_service(payload: dict) -> dict:
+    response = requests.post("http://services:8001/analyze_link", json=payload, timeout=60)
+    response.raise_for_status()
+    return response.json()
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from data_models.schemas import MessageRequest
+from core.background_tasks import submit_analysis
+from core.hot_cache import TTLCache
 import requests
 
 ###############################################################################
@@ -14,21 +17,48 @@ import requests
 # 2) requests.post(...) to services:8001/analyze_message
 # 3) Return services JSON
 #
+# With ?background=true the services call runs on the background pool and
+# the response is 202 {"task_id":...,"status":"pending"}; poll
+# GET /api/task/{task_id} for the result.
+#
+# Synchronous calls are remembered for HOT_CACHE_TTL seconds per
+# (client IP, message), so a client retrying the same message gets the
+# earlier answer without another services call.
+#
 # Maintanability:
 # - If services endpoint changes, just update the URL or payload.
 ###############################################################################
 
 message_router = APIRouter()
 
+# Recent successful results, keyed by (client IP, message)
+_hot = TTLCache()
+
 @message_router.post("/message", summary="Analyze a suspicious message")
-async def analyze_message(request: MessageRequest):
+def analyze_message(request: MessageRequest, http_request: Request,
+                    background: bool = Query(False, description="Return a task_id immediately and analyze in the background")):
     content = request.message
-    url = "http://services:8001/analyze_message"
     payload = {"message": content}
 
+    if background:
+        task_id = submit_analysis("message", content, lambda: call_message_service(payload))
+        return JSONResponse(status_code=202, content={"task_id": task_id, "status": "pending"})
+
+    client_ip = http_request.client.host if http_request.client else ""
+    key = (client_ip, content)
+    cached = _hot.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.post(url, json=payload, timeout=60)
-        response.raise_for_status()
-        return response.json()
+        result = call_message_service(payload)
     except requests.RequestException as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+    if result.get("status") != "error":
+        _hot.set(key, result)
+    return result
+
+def call_message_service(payload: dict) -> dict:
+    response = requests.post("http://services:8001/analyze_message", json=payload, timeout=60)
+    response.raise_for_status()
+    return response.json()
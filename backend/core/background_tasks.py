@@ -0,0 +1,55 @@
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from core.request_handler import RequestHandler
+
+###############################################################################
+# File: core/background_tasks.py
+#
+# Purpose:
+# Run slow analyses (services -> workers -> LLM) off the request thread.
+# An analyze endpoint can call submit_analysis(...) instead of waiting for
+# the services call; the client gets a task_id right away and polls
+# GET /api/task/{task_id} for the result.
+#
+# Steps:
+# 1) Create a task_id and store {"status":"pending"} via RequestHandler.enqueue_task.
+# 2) Run the analysis function on a shared ThreadPoolExecutor.
+# 3) When it finishes, store status "completed" with its JSON, or "error"
+#    with the error message, via RequestHandler.update_task_status.
+#
+# Maintainability:
+# - Pool size comes from ANALYSIS_WORKERS (default 16).
+# - Task state lives in Redis (same keys as the rest of /api/task), so any
+#   backend worker process can answer the poll.
+###############################################################################
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "16"))
+
+EXECUTOR = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+
+
+def _run(task_id: str, fn: Callable[[], Dict[str, Any]]) -> None:
+    rh = RequestHandler()
+    try:
+        result = fn()
+        rh.update_task_status(task_id, "completed", result)
+    except Exception as e:
+        logger.error(f"Background analysis {task_id} failed: {e}")
+        rh.update_task_status(task_id, "error", {"message": str(e)})
+
+
+def submit_analysis(task_type: str, content: str, fn: Callable[[], Dict[str, Any]]) -> str:
+    """
+    Register a pending task and run fn() in the background.
+    Returns the task_id to poll at GET /api/task/{task_id}.
+    """
+    task_id = uuid.uuid4().hex
+    RequestHandler().enqueue_task(task_id, {"type": task_type, "content": content})
+    EXECUTOR.submit(_run, task_id, fn)
+    return task_id
@@ -1,4 +1,5 @@
 import os
+import threading
 import pymysql
 
 ###############################################################################
@@ -9,39 +10,65 @@ import pymysql
 # to the MySQL database. The login route and other DB-related endpoints
 # will use this to interact with `Accounts` and `Historys` tables.
 #
+# Connections come from a DBUtils PooledDB pool instead of a fresh
+# pymysql.connect() per request, so /login and /search_history skip the
+# TCP + auth handshake. Callers keep calling conn.close(); for a pooled
+# connection that hands it back to the pool rather than closing the socket.
+#
 # Design & Philosophy:
 # - Rely on environment variables: DB_HOST, DB_USER, DB_PASSWORD, DB_NAME.
 # - Use pymysql with DictCursor for convenience when fetching rows.
 # - If environment variables are missing, we can either default or raise an error.
+# - Pool size is tunable with DB_POOL_MIN_CACHED, DB_POOL_MAX_CACHED and
+#   DB_POOL_MAX_CONNECTIONS; when all connections are busy callers block
+#   until one is returned.
 #
 # Maintainability:
 # - If DB credentials change, just update environment variables.
 # - If we switch to another DB library, just update this file.
 ###############################################################################
 
+# Created on first use so importing the app does not open DB connections
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from dbutils.pooled_db import PooledDB
+
+                _pool = PooledDB(
+                    creator=pymysql,
+                    mincached=int(os.environ.get("DB_POOL_MIN_CACHED", "2")),
+                    maxcached=int(os.environ.get("DB_POOL_MAX_CACHED", "10")),
+                    maxconnections=int(os.environ.get("DB_POOL_MAX_CONNECTIONS", "20")),
+                    blocking=True,
+                    # Cheap liveness check when a connection is handed out
+                    ping=1,
+                    host=os.environ.get("DB_HOST", "mysql"),
+                    user=os.environ.get("DB_USER", "root"),
+                    password=os.environ.get("DB_PASSWORD", "123456"),
+                    database=os.environ.get("DB_NAME", "phishing"),
+                    cursorclass=pymysql.cursors.DictCursor
+                )
+    return _pool
+
+
 def get_db_connection():
     """
-    Returns a pymysql connection using credentials from environment variables.
+    Returns a pooled pymysql connection using credentials from environment variables.
     Expected environment variables:
     - DB_HOST
     - DB_USER
     - DB_PASSWORD
     - DB_NAME
 
+    Calling close() on the returned connection returns it to the pool.
+
     Raises:
-        KeyError if any variable is missing or ValueError if invalid credentials.
+        pymysql errors if the pool cannot establish a connection.
     """
-    host = os.environ.get("DB_HOST", "mysql")
-    user = os.environ.get("DB_USER", "root")
-    password = os.environ.get("DB_PASSWORD", "123456")
-    database = os.environ.get("DB_NAME", "phishing")
-
-    # Create and return the connection
-    # If any issue, pymysql will raise an error at connect time.
-    return pymysql.connect(
-        host=host,
-        user=user,
-        password=password,
-        database=database,
-        cursorclass=pymysql.cursors.DictCursor
-    )
\ No newline at end of file
+    return _get_pool().connection()
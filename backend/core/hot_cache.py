@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+###############################################################################
+# File: core/hot_cache.py
+#
+# Purpose:
+# Short-lived in-process cache for analyze responses, keyed per client.
+# The same client re-posting the same URL/message within a minute is almost
+# always a retry or a bot; answering it from memory skips the whole
+# services -> workers -> LLM round trip and throttles the repeats.
+#
+# Steps:
+# 1) Route builds a key like (client_ip, url, visual_verify).
+# 2) get(key) returns the stored response if it is younger than ttl.
+# 3) After a successful services call the route stores it with set(key, value).
+#
+# Maintainability:
+# - Size and lifetime come from HOT_CACHE_MAXSIZE / HOT_CACHE_TTL.
+# - Per worker process only; the longer-lived LLM cache lives in providers.
+# - Only successful responses should be stored, so errors are retried.
+###############################################################################
+
+HOT_CACHE_MAXSIZE = 4096
+HOT_CACHE_TTL = 60.0
+
+
+class TTLCache:
+    """Bounded LRU dict whose entries expire ttl seconds after being set."""
+
+    def __init__(self, maxsize: int = HOT_CACHE_MAXSIZE, ttl: float = HOT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -5,5 +5,11 @@
 if [ "$MODE" = "unit-test" ]; then
   pytest --maxfail=1 --disable-warnings -q
 else
-  uvicorn backend_server:create_app --factory --host 0.0.0.0 --port 8000
+  # Several uvicorn worker processes under gunicorn so slow services/DB calls
+  # in one worker do not hold up the rest. Tune with WEB_CONCURRENCY.
+  gunicorn "backend_server:create_app()" \
+    -k uvicorn.workers.UvicornWorker \
+    -w "${WEB_CONCURRENCY:-4}" \
+    --bind 0.0.0.0:8000 \
+    --timeout 120
 fi
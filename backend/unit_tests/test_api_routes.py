@@ -1,4 +1,5 @@
 import os
+import time
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch
@@ -216,6 +217,72 @@ def test_analyze_link_endpoint_external_api_failure(test_client, mocker):
     mock_fail.assert_called_once_with("http://normal.url", True)
 
 
+###############################################################################
+# T-Backend-Background-001
+#
+# Purpose:
+# With ?background=true the message endpoint returns a task_id at once and the
+# services call finishes on the background pool, writing the result to the task store.
+#
+# Steps:
+# Step 1: Mock RequestHandler (task store) and the services HTTP call.
+# Step 2: POST /api/analyze/message?background=true
+# Step 3: Expect 202 with task_id and status pending.
+# Step 4: Wait for the pool; the task is stored as completed with the services JSON.
+###############################################################################
+def test_analyze_message_background(test_client, mocker):
+    store = {}
+
+    class FakeRequestHandler:
+        def enqueue_task(self, task_id, task_data):
+            store[task_id] = {"status": "pending", "result": None}
+
+        def update_task_status(self, task_id, status, result):
+            store[task_id] = {"status": status, "result": result}
+
+    mocker.patch("core.background_tasks.RequestHandler", FakeRequestHandler)
+    services_json = {"status": "completed", "result": {"suspicious": "yes"}}
+    mock_post = mocker.patch("api.routes_message.requests.post")
+    mock_post.return_value.json.return_value = services_json
+
+    response = test_client.post("/api/analyze/message?background=true", json={"message": "Win a prize"})
+    assert response.status_code == 202
+    task_id = response.json()["task_id"]
+    assert response.json()["status"] == "pending"
+
+    for _ in range(100):
+        if store[task_id]["status"] != "pending":
+            break
+        time.sleep(0.05)
+    assert store[task_id] == {"status": "completed", "result": services_json}
+
+
+###############################################################################
+# T-Backend-HotCache-001
+#
+# Purpose:
+# The same client posting the same link twice within the hot-cache TTL gets the
+# first answer back without a second services call.
+#
+# Steps:
+# Step 1: Mock the services HTTP call.
+# Step 2: POST /api/analyze/link twice with the same payload.
+# Step 3: Both responses match; requests.post was called once.
+###############################################################################
+def test_analyze_link_hot_cache(test_client, mocker):
+    services_json = {"status": "completed", "result": {"suspicious": "no"}}
+    mock_post = mocker.patch("api.routes_link.requests.post")
+    mock_post.return_value.json.return_value = services_json
+
+    payload = {"url": "http://repeat.url", "visual_verify": False}
+    first = test_client.post("/api/analyze/link", json=payload)
+    second = test_client.post("/api/analyze/link", json=payload)
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json() == second.json() == services_json
+    assert mock_post.call_count == 1
+
+
 ###############################################################################
 # Additional Notes:
 #
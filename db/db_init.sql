@@ -21,6 +21,10 @@ CREATE TABLE Historys (
     FOREIGN KEY (AccountID) REFERENCES Accounts (AccountID)
 );
 
+-- /search_history filters by AccountID and pages by HistoryID.
+-- Accounts.Username is already indexed by its UNIQUE constraint.
+CREATE INDEX idx_hist_acc ON Historys (AccountID, HistoryID);
+
 INSERT INTO Accounts (Username, Password)
 VALUES ('123', '123456'),
        ('wopa', 'wopa'),
@@ -1,13 +1,18 @@
 import os
 import sys
-import json
+import orjson
 import re
+import math
 import time
+import ipaddress
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+import tiktoken
+from selectolax.lexbor import LexborHTMLParser
+from urllib.parse import urljoin, urlsplit
 from openai import OpenAI
 
 ###############################################################################
@@ -20,13 +25,74 @@ API_KEY = os.environ.get("OPENAI_API_KEY")
 client = OpenAI(api_key=API_KEY)
 
 MODEL_NAME = "gpt-4o-mini"
+# Prompts are cut to this many tokens before being sent (gpt-4o-mini has a 128k context)
+MAX_PROMPT_TOKENS = 100000
 DATASET_FILE = "phishing.csv"
 OUTPUT_DIR = "./outputs_link_openai"
+# All processed rows are appended here as each batch completes
+RESULTS_CSV = os.path.join(OUTPUT_DIR, "link_out_results.csv")
+RESULT_COLUMNS = ["label","URL","suspicious","outcome","time"]
 
 # Set this to the row index you want to resume from. If 0, start fresh.
 RESUME_FROM_INDEX = 251  # For example, start from row 250
 CHOSEN_END_INDEX = 501
 
+# Script bodies are truncated before they reach the model anyway, so stop
+# downloading once this many bytes have been read.
+MAX_SCRIPT_BYTES = 256 * 1024
+
+# One pooled session for page and script downloads so repeat hosts reuse their
+# TCP/TLS connections. Transient 429/5xx answers are retried with backoff; the
+# final status is still returned (raise_on_status=False) for the accessibility check.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504], raise_on_status=False)
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# Minimum seconds between progress bar redraws
+PROGRESS_INTERVAL = 0.25
+
+# Step 3 scores the URL locally and only asks the LLM when the local risk
+# falls inside this band.
+URL_RISK_BORDERLINE = (0.35, 0.65)
+
+# TLDs and hosting suffixes that show up disproportionately in phishing feeds
+SUSPECT_TLDS = {
+    "tk", "ml", "ga", "cf", "gq", "xyz", "top", "ru", "cn", "zip", "mov",
+    "click", "link", "buzz", "rest", "cyou", "icu", "monster", "shop", "live",
+}
+SUSPECT_HOST_SUFFIXES = (
+    "firebaseapp.com", "web.app", "weeblysite.com", "weebly.com", "000webhostapp.com",
+    "ipfs.io", "glitch.me", "vercel.app", "netlify.app", "pages.dev", "duckdns.org",
+    "ngrok.io", "blogspot.com", "wixsite.com", "github.io", "r2.dev",
+)
+SUSPECT_KEYWORDS = (
+    "login", "signin", "verify", "account", "update", "secure", "bank", "wallet",
+    "confirm", "password", "webscr", "support", "billing", "unlock",
+)
+
+# Hand-set logistic weights over extract_url_features(); positive = phishier
+URL_RISK_BIAS = -3.5
+URL_RISK_WEIGHTS = {
+    "length": 0.02,
+    "num_dots": 0.3,
+    "num_hyphens": 0.35,
+    "num_digits_host": 0.2,
+    "has_at": 2.0,
+    "has_ip": 3.0,
+    "entropy": 0.3,
+    "num_subdomains": 0.6,
+    "tld_in_suspect_list": 2.5,
+    "suspect_host": 3.0,
+    "has_punycode": 2.0,
+    "no_https": 1.2,
+    "num_keywords": 1.0,
+}
+
 ###############################################################################
 # JSON Schemas (same as before)
 ###############################################################################
@@ -94,14 +160,32 @@ AGGREGATOR_SCHEMA = {
 # Helper Functions
 ###############################################################################
 
+_encoder = None
+
+def trim_to_tokens(prompt: str, max_tokens: int = MAX_PROMPT_TOKENS) -> str:
+    """
+    Cut the prompt to at most max_tokens tokens of MODEL_NAME's tokenizer.
+    The encoder is loaded on first use (tiktoken downloads it once, then caches it).
+    """
+    global _encoder
+    # Byte-level BPE tokens cover at least one UTF-8 byte each (emoji/CJK can take
+    # several tokens per character), so a prompt this short needs no encoding
+    if len(prompt.encode("utf-8")) <= max_tokens:
+        return prompt
+    if _encoder is None:
+        _encoder = tiktoken.encoding_for_model(MODEL_NAME)
+    tokens = _encoder.encode(prompt, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return prompt
+    return _encoder.decode(tokens[:max_tokens])
+
 def call_model(prompt: str, schema: dict):
     """
     Call the OpenAI model with given prompt and a JSON schema response_format.
     Returns a Python dict already validated.
     """
 
-    MAX_TOKENS = 120000
-    prompt_trim = prompt[:MAX_TOKENS]
+    prompt_trim = trim_to_tokens(prompt)
 
     completion = client.chat.completions.create(
         model=MODEL_NAME,
@@ -118,7 +202,7 @@ def call_model(prompt: str, schema: dict):
     # The content should be directly valid JSON. Load it into Python dict.
     # response_format ensures the returned content is JSON and validated.
     # completion.choices[0].message.content is guaranteed to be JSON per schema.
-    return json.loads(completion.choices[0].message.content)
+    return orjson.loads(completion.choices[0].message.content)
 
 def analyze_content(content_text: str, source_name: str) -> dict:
     prompt = (
@@ -130,7 +214,71 @@ def analyze_content(content_text: str, source_name: str) -> dict:
     )
     return call_model(prompt, CONTENT_ANALYSIS_SCHEMA)
 
+def extract_url_features(url: str) -> dict:
+    """
+    Cheap lexical features for a URL, all numeric so they can be weighted directly.
+    """
+    parts = urlsplit(url if "://" in url else "http://" + url)
+    host = (parts.hostname or "").lower()
+    labels = [l for l in host.split(".") if l]
+    if labels and labels[0] == "www":
+        labels = labels[1:]
+
+    try:
+        ipaddress.ip_address(host)
+        has_ip = 1
+    except ValueError:
+        has_ip = 0
+
+    entropy = 0.0
+    if host:
+        for c in set(host):
+            p = host.count(c) / len(host)
+            entropy -= p * math.log2(p)
+
+    lowered = url.lower()
+    return {
+        "length": len(url),
+        "num_dots": host.count("."),
+        "num_hyphens": host.count("-"),
+        "num_digits_host": sum(c.isdigit() for c in host),
+        "has_at": int("@" in url),
+        "has_ip": has_ip,
+        "entropy": entropy,
+        "num_subdomains": max(0, len(labels) - 2) if not has_ip else 0,
+        "tld_in_suspect_list": int(bool(labels) and labels[-1] in SUSPECT_TLDS),
+        "suspect_host": int(host.endswith(SUSPECT_HOST_SUFFIXES)),
+        "has_punycode": int("xn--" in host),
+        "no_https": int(parts.scheme != "https"),
+        "num_keywords": sum(k in lowered for k in SUSPECT_KEYWORDS),
+    }
+
+def score_url_features(features: dict) -> float:
+    """
+    Logistic score in [0, 1]; higher means more likely phishing.
+    """
+    z = URL_RISK_BIAS + sum(URL_RISK_WEIGHTS[k] * features[k] for k in URL_RISK_WEIGHTS)
+    return 1.0 / (1.0 + math.exp(-z))
+
 def analyze_link_suspiciousness(url: str) -> dict:
+    """
+    Score the URL locally and only fall back to the LLM for borderline scores.
+    Returns the same {risk_level, confidence, reason} shape as the LLM call.
+    """
+    features = extract_url_features(url)
+    risk = score_url_features(features)
+    low, high = URL_RISK_BORDERLINE
+    if low <= risk <= high:
+        return llm_link_suspiciousness(url)
+
+    flagged = [k for k in URL_RISK_WEIGHTS if features[k] and k not in ("length", "entropy", "num_dots")]
+    return {
+        "risk_level": "high" if risk > high else "low",
+        "confidence": round(max(risk, 1.0 - risk), 3),
+        "reason": f"Local URL heuristic score={risk:.3f}; signals: {', '.join(flagged) or 'none'}"
+    }
+
+def llm_link_suspiciousness(url: str) -> dict:
     prompt = (
         "Analyze the given URL for suspiciousness. Return ONLY JSON:\n"
         "{\"risk_level\":\"high|low\",\"confidence\":float,\"reason\":\"...\"}\n"
@@ -139,6 +287,23 @@ def analyze_link_suspiciousness(url: str) -> dict:
     )
     return call_model(prompt, LINK_SUSPICIOUSNESS_SCHEMA)
 
+def fetch_script(s_url: str):
+    """
+    Fetch a script with a streamed, size-capped read.
+    Returns (status_code, text). text is None unless status_code is 200.
+    """
+    with SESSION.get(s_url, stream=True, timeout=10) as r:
+        if r.status_code != 200:
+            return r.status_code, None
+        chunks = []
+        total = 0
+        for chunk in r.iter_content(65536):
+            chunks.append(chunk)
+            total += len(chunk)
+            if total >= MAX_SCRIPT_BYTES:
+                break
+        return r.status_code, b"".join(chunks)[:MAX_SCRIPT_BYTES].decode("utf-8", "ignore")
+
 def process_link(url: str) -> dict:
     steps_data = {
         "Step1_Page_Accessibility": [],
@@ -164,7 +329,7 @@ def process_link(url: str) -> dict:
     main_page_fetched = False
 
     try:
-        page_resp = requests.get(url, timeout=10)
+        page_resp = SESSION.get(url, timeout=10)
         if page_resp.status_code == 200:
             main_html = page_resp.text
             main_page_fetched = True
@@ -184,14 +349,18 @@ def process_link(url: str) -> dict:
 
     script_contents = []
     if main_page_fetched:
-        soup = BeautifulSoup(main_html, 'html.parser')
-        script_urls = [ urljoin(url, s['src']) for s in soup.find_all('script', src=True) ]
+        # Only <script src> is needed, so use the lightweight selectolax parser instead of a full soup
+        tree = LexborHTMLParser(main_html)
+        # dict.fromkeys drops repeated tags (same analytics snippet twice, etc.) but keeps page order
+        script_urls = list(dict.fromkeys(
+            urljoin(url, n.attributes['src']) for n in tree.css('script[src]') if n.attributes.get('src')
+        ))
 
         for s_url in script_urls:
             try:
-                s_resp = requests.get(s_url, timeout=10)
-                if s_resp.status_code == 200:
-                    script_contents.append((s_url, s_resp.text))
+                s_status, s_text = fetch_script(s_url)
+                if s_status == 200:
+                    script_contents.append((s_url, s_text))
                 else:
                     steps_data["Step2_Content_Analysis"].append({
                         "check_id":"check_2_script_fetch",
@@ -199,7 +368,7 @@ def process_link(url: str) -> dict:
                         "weight":0.05,
                         "risk_level":"low",
                         "confidence":0.5,
-                        "explanation":f"Script {s_url} fetch {s_resp.status_code}, ignored."
+                        "explanation":f"Script {s_url} fetch {s_status}, ignored."
                     })
             except requests.RequestException:
                 steps_data["Step2_Content_Analysis"].append({
@@ -270,7 +439,7 @@ def process_link(url: str) -> dict:
         "risk_level=high if ANY check is high else low.\n"
         "confidence=weighted avg of all checks.\n"
         "Include all checks from steps_data unchanged.\n"
-        f"{json.dumps(steps_data)}"
+        f"{orjson.dumps(steps_data).decode()}"
     )
 
     final_res = call_model(aggregator_prompt, AGGREGATOR_SCHEMA)
@@ -299,6 +468,16 @@ def load_partial_results(start_index: int):
     # and have a file 'link_out_batchX.csv' that contains at least that many rows.
     # We'll just try to find the largest batch file covering processed<start_index.
 
+    # Newer runs append everything to a single cumulative CSV. Keep its first start_index rows
+    # and rewrite it once so later appends continue right after them.
+    if os.path.exists(RESULTS_CSV):
+        df = pd.read_csv(RESULTS_CSV)
+        if len(df) > start_index:
+            df = df.iloc[:start_index]
+            df.to_csv(RESULTS_CSV, index=False)
+        return RESULTS_CSV, df
+
+    # Older runs wrote a full copy per batch: link_out_batch{num}.csv
     files = [f for f in os.listdir(OUTPUT_DIR) if f.startswith("link_out_batch") and f.endswith(".csv")]
     if not files:
         return None, None
@@ -370,18 +549,13 @@ def run_batch_test():
             print(f"[INFO] Loaded partial results from {chosen_file}. Processed={processed}")
             results = chosen_df.values.tolist()
 
-            # Recount success/fail/error
+            # Recount success/fail/error straight from the frame instead of looping in Python
             # success: outcome=success, fail=fail, error=error_status or error_exception
-            for row in results:
-                outcome = row[3]
-                if outcome == "success":
-                    success += 1
-                elif outcome == "fail":
-                    fail += 1
-                elif outcome.startswith("error"):
-                    error_count += 1
-                # sum times
-                total_time += row[4]
+            vc = chosen_df["outcome"].value_counts()
+            success = int(vc.get("success", 0))
+            fail = int(vc.get("fail", 0))
+            error_count = int(chosen_df["outcome"].astype(str).str.startswith("error").sum())
+            total_time = float(chosen_df["time"].sum())
             print(f"[INFO] Loaded partial results from {chosen_file}. Processed={processed}, success={success}, fail={fail}, error={error_count}")
         else:
             print("[WARN] No suitable partial results found. Will attempt to start from scratch at start_index anyway.")
@@ -397,15 +571,23 @@ def run_batch_test():
         with open(general_log_path, "w") as gf:
             gf.write("timestamp,batch,processed,total,success,fail,error,accuracy,avg_time\n")
 
+    # Rows already on disk in RESULTS_CSV. A resume from the cumulative file starts with all of
+    # them saved; a resume from a legacy batch file has to write them out on the first save.
+    last_saved_len = len(results) if start_index > 0 and chosen_file == RESULTS_CSV else 0
+    if last_saved_len == 0 and os.path.exists(RESULTS_CSV):
+        os.remove(RESULTS_CSV)
+
     def save_partial(processed_now, final=False):
-        nonlocal batch_number, success, fail, error_count, total_time
+        nonlocal batch_number, success, fail, error_count, total_time, last_saved_len
         accuracy = (success / processed_now) * 100 if processed_now > 0 else 0.0
         avg_time = total_time / processed_now if processed_now > 0 else 0.0
 
         batch_number += 1
-        batch_csv = os.path.join(OUTPUT_DIR, f"link_out_batch{batch_number}.csv")
-        batch_df = pd.DataFrame(results, columns=["label","URL","suspicious","outcome","time"])
-        batch_df.to_csv(batch_csv, index=False)
+        # Append only the rows added since the previous save instead of rewriting all of them
+        new_rows = results[last_saved_len:]
+        header = not os.path.exists(RESULTS_CSV)
+        pd.DataFrame(new_rows, columns=RESULT_COLUMNS).to_csv(RESULTS_CSV, mode="a", header=header, index=False)
+        last_saved_len = len(results)
 
         with open(general_log_path, "a") as gf:
             ts = datetime.now().isoformat()
@@ -419,9 +601,12 @@ def run_batch_test():
             lf.write(f"Avg Time: {avg_time:.4f}s\n")
 
         if final:
-            print(f"\nFinal Results Saved to {batch_csv}")
+            print(f"\nFinal Results Saved to {RESULTS_CSV}")
         else:
-            print(f"\nPartial Results Saved to {batch_csv}")
+            print(f"\nPartial Results Saved to {RESULTS_CSV}")
+
+    bar_length = 50
+    last_print = 0.0
 
     try:
         # Start loop from start_index
@@ -476,19 +661,21 @@ def run_batch_test():
             results.append([label, url, suspicious, outcome, elapsed])
             processed = i + 1
 
-            percent = (processed / total) * 100
-            bar_length = 50
-            completed = int((processed / total) * bar_length)
-            bar = '*' * completed + '.' * (bar_length - completed)
-
-            elapsed_so_far = time.time() - start_time
-            avg_per_req = elapsed_so_far / processed if processed > 0 else 0.0
-            remaining = total - processed
-            remaining_time = avg_per_req * remaining
-            estimated_end = datetime.fromtimestamp(time.time() + remaining_time).isoformat()
-
-            progress_str = (f"[{percent:3.0f}%]{bar} [Processed:{processed}/{total}] [ETA:{estimated_end}]")
-            print(progress_str, end='\r', flush=True)
+            # Redraw at most once every PROGRESS_INTERVAL seconds; always draw the last row
+            now = time.time()
+            if now - last_print >= PROGRESS_INTERVAL or processed == total:
+                last_print = now
+                percent = (processed / total) * 100
+                completed = int((processed / total) * bar_length)
+                bar = '*' * completed + '.' * (bar_length - completed)
+
+                elapsed_so_far = now - start_time
+                avg_per_req = elapsed_so_far / processed if processed > 0 else 0.0
+                remaining = total - processed
+                estimated_end = time.strftime("%H:%M:%S", time.localtime(now + avg_per_req * remaining))
+
+                progress_str = (f"[{percent:3.0f}%]{bar} [Processed:{processed}/{total}] [ETA:{estimated_end}]")
+                print(progress_str, end='\r', flush=True)
 
             if processed >= next_batch and processed < total:
                 save_partial(processed)
@@ -1,30 +1,90 @@
+import io
 import os
 import sys
-import json
+import orjson
 import re
 import time
+import asyncio
+import hashlib
+import shelve
 from datetime import datetime
-import requests
+import aiohttp
+import zstandard
 import pandas as pd
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from openai import OpenAI
+import tiktoken
+from bs4 import BeautifulSoup, SoupStrainer
+from urllib.parse import urljoin, urlsplit
+import openai
+from openai import AsyncOpenAI, DefaultAioHttpClient
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 ###############################################################################
 # Configuration
 ###############################################################################
 # Insert your OpenAI API key here
 API_KEY = os.environ.get("OPENAI_API_KEY")
-# Initialize the OpenAI client
-client = OpenAI(api_key=API_KEY)
+# Initialize the OpenAI client (async so the per-link calls can overlap).
+# The default httpx transport degrades badly with hundreds of concurrent requests,
+# so the client runs on aiohttp instead.
+# Retries are handled by create_completion, so the SDK's own retry loop is turned off.
+client = AsyncOpenAI(api_key=API_KEY, http_client=DefaultAioHttpClient(), max_retries=0)
 
 MODEL_NAME = "gpt-4o-mini"
+# Prompts are cut to this many tokens before being sent (gpt-4o-mini has a 128k context)
+MAX_PROMPT_TOKENS = 100000
 DATASET_FILE = "phishing.csv"
 OUTPUT_DIR = "./outputs_link_openai_detailed"
+# Results CSV and the per-URL logs are zstd-compressed; the logs go to one JSONL
+# stream (one line per URL) instead of one small file per URL.
+RESULTS_CSV = os.path.join(OUTPUT_DIR, "link_analysis_10_tests.csv.zst")
+PARTIAL_RESULTS_CSV = os.path.join(OUTPUT_DIR, "link_analysis_10_tests_partial.csv.zst")
+LOG_FILE = os.path.join(OUTPUT_DIR, "comprehensive_outputs.jsonl.zst")
+CSV_COMPRESSION = {"method": "zstd", "level": 3}
+log_writer = None
 
 START_INDEX = 0
 END_INDEX = 10
 
+# How many URLs are analyzed at the same time (keeps us under the account RPM)
+MAX_CONCURRENT_LINKS = 5
+
+# Account rate limits for MODEL_NAME; every real-time call waits on both buckets
+MAX_REQUESTS_PER_MINUTE = 500
+MAX_TOKENS_PER_MINUTE = 200000
+request_limiter = AsyncLimiter(MAX_REQUESTS_PER_MINUTE, 60)
+token_limiter = AsyncLimiter(MAX_TOKENS_PER_MINUTE, 60)
+
+# Send every LLM call through the OpenAI Batch API instead of real-time requests.
+# Half the price and no RPM/TPM pressure, but results can take up to 24h.
+USE_BATCH_API = False
+BATCH_POLL_SECONDS = 30
+
+SCRIPT_SRC_STRAINER = SoupStrainer("script", src=True)
+
+# Per page, analyze at most MAX_SCRIPTS scripts and only the first MAX_SCRIPT_CHARS of each
+MAX_SCRIPTS = 8
+MAX_SCRIPT_CHARS = 8192
+# Scripts served from these well-known CDNs are skipped without fetching or analysis
+TRUSTED_SCRIPT_HOSTS = (
+    "googletagmanager.com", "google-analytics.com", "gstatic.com", "googleapis.com",
+    "cdn.jsdelivr.net", "cdnjs.cloudflare.com", "code.jquery.com", "unpkg.com",
+    "connect.facebook.net", "static.cloudflareinsights.com",
+)
+
+# On-disk caches, opened by open_caches() for the duration of a run.
+# LLM results are keyed by model + schema + prompt; CDN scripts (jQuery, analytics, ...)
+# repeat across many rows, so fetched scripts are kept for FETCH_CACHE_TTL seconds.
+LLM_CACHE_FILE = "./.llm_cache"
+FETCH_CACHE_FILE = "./.fetch_cache"
+FETCH_CACHE_TTL = 24 * 3600
+llm_cache = None
+fetch_cache = None
+
+# Shared HTTP session for page/script downloads, opened in run_batch_test's main()
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=10)
+session = None
+
 ###############################################################################
 # JSON Schemas
 ###############################################################################
@@ -56,361 +116,692 @@ LINK_SUSPICIOUSNESS_SCHEMA = {
     }
 }
 
-AGGREGATOR_SCHEMA = {
-    "name": "link_aggregator_schema",
-    "schema": {
-        "type":"object",
-        "properties":{
-            "risk_level":{"type":"string","enum":["high","low"]},
-            "confidence":{"type":"number"},
-            "reasons":{
-                "type":"object",
-                "properties":{
-                    "Step1_Page_Accessibility":{
-                        "type":"array",
-                        "items":{"type":"object"}
-                    },
-                    "Step2_Content_Analysis":{
-                        "type":"array",
-                        "items":{"type":"object"}
-                    },
-                    "Step3_LLM_Link_Suspiciousness":{
-                        "type":"array",
-                        "items":{"type":"object"}
-                    }
-                },
-                "required":["Step1_Page_Accessibility","Step2_Content_Analysis","Step3_LLM_Link_Suspiciousness"],
-                "additionalProperties":False
-            }
-        },
-        "required":["risk_level","confidence","reasons"],
-        "additionalProperties":False
-    }
-}
-
 ###############################################################################
 # Helper Functions
 ###############################################################################
 
-def call_model(prompt: str, schema: dict):
+_encoder = None
+
+def trim_to_tokens(prompt: str, max_tokens: int = MAX_PROMPT_TOKENS) -> str:
     """
-    Call the OpenAI model with given prompt and a JSON schema response_format.
-    Returns a Python dict already validated.
+    Cut the prompt to at most max_tokens tokens of MODEL_NAME's tokenizer.
+    The encoder is loaded on first use (tiktoken downloads it once, then caches it).
     """
+    global _encoder
+    # Byte-level BPE tokens cover at least one UTF-8 byte each (emoji/CJK can take
+    # several tokens per character), so a prompt this short needs no encoding
+    if len(prompt.encode("utf-8")) <= max_tokens:
+        return prompt
+    if _encoder is None:
+        _encoder = tiktoken.encoding_for_model(MODEL_NAME)
+    tokens = _encoder.encode(prompt, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return prompt
+    return _encoder.decode(tokens[:max_tokens])
+
+def chat_body(prompt: str, schema: dict) -> dict:
+    """
+    Chat completion request body for a prompt + JSON schema.
+    Shared by the real-time calls and the Batch API request lines.
+    """
+    prompt_trim = trim_to_tokens(prompt)
 
-    MAX_TOKENS = 120000
-    prompt_trim = prompt[:MAX_TOKENS]
-
-    completion = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
+    return {
+        "model": MODEL_NAME,
+        "messages": [
             {"role": "system", "content": "You are a professional security expert. Return ONLY the requested JSON."},
             {"role":"user","content":prompt_trim}
         ],
-        response_format={
+        "response_format": {
             "type": "json_schema",
             "json_schema": schema
         }
-    )
+    }
+
+def llm_cache_key(body: dict) -> str:
+    schema_name = body["response_format"]["json_schema"]["name"]
+    prompt_trim = body["messages"][-1]["content"]
+    return hashlib.sha256((body["model"] + schema_name + prompt_trim).encode("utf-8", "replace")).hexdigest()
+
+def open_caches():
+    global llm_cache, fetch_cache
+    llm_cache = shelve.open(LLM_CACHE_FILE)
+    fetch_cache = shelve.open(FETCH_CACHE_FILE)
+
+def close_caches():
+    global llm_cache, fetch_cache
+    for cache in (llm_cache, fetch_cache):
+        if cache is not None:
+            cache.close()
+    llm_cache = None
+    fetch_cache = None
+
+@retry(
+    retry=retry_if_exception_type((
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )),
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    reraise=True
+)
+async def create_completion(body: dict):
+    """
+    One chat completion, throttled to the RPM/TPM budget and retried with
+    exponential backoff on rate limits, timeouts and 5xx answers.
+    """
+    # ~4 characters per token is close enough for budgeting
+    est_tokens = len(body["messages"][-1]["content"]) // 4
+    await request_limiter.acquire()
+    await token_limiter.acquire(min(max(est_tokens, 1), MAX_TOKENS_PER_MINUTE))
+    return await client.chat.completions.create(**body)
+
+async def call_model(prompt: str, schema: dict):
+    """
+    Call the OpenAI model with given prompt and a JSON schema response_format.
+    Returns a Python dict already validated. Identical requests are answered from llm_cache.
+    """
+    body = chat_body(prompt, schema)
+    key = llm_cache_key(body)
+    if llm_cache is not None and key in llm_cache:
+        return llm_cache[key]
+
+    completion = await create_completion(body)
 
     # The content should be directly valid JSON. Load it into Python dict.
     # response_format ensures the returned content is JSON and validated.
     # completion.choices[0].message.content is guaranteed to be JSON per schema.
-    return json.loads(completion.choices[0].message.content)
+    result = orjson.loads(completion.choices[0].message.content)
+    if llm_cache is not None:
+        llm_cache[key] = result
+    return result
 
-def analyze_content(content_text: str, source_name: str) -> dict:
-    prompt = (
+def content_prompt(content_text: str, source_name: str) -> str:
+    return (
         "Analyze the given content and return ONLY JSON:\n"
         "{\"risk_level\":\"high|low\",\"confidence\":float,\"reason\":\"...\"}\n"
         f"Source: {source_name}\n"
         f"Content:\n{content_text}\n"
         "No extra text."
     )
-    return call_model(prompt, CONTENT_ANALYSIS_SCHEMA)
 
-def analyze_link_suspiciousness(url: str) -> dict:
-    prompt = (
+def link_prompt(url: str) -> str:
+    return (
         "Analyze the given URL for suspiciousness. Return ONLY JSON:\n"
         "{\"risk_level\":\"high|low\",\"confidence\":float,\"reason\":\"...\"}\n"
         f"URL:\n{url}\n"
         "No extra text."
     )
-    return call_model(prompt, LINK_SUSPICIOUSNESS_SCHEMA)
 
-def process_link(url: str, file_name: str) -> dict:
+def aggregate_steps(steps_data: dict) -> dict:
+    """
+    Final verdict from all checks: high if ANY check is high, confidence is the
+    weighted average of the check confidences. Checks are returned unchanged as reasons.
+    """
+    checks = [c for step in steps_data.values() for c in step]
+    final_risk = "high" if any(c["risk_level"] == "high" for c in checks) else "low"
+    total_weight = sum(c["weight"] for c in checks)
+    confidence = sum(c["weight"] * c["confidence"] for c in checks) / total_weight if total_weight else 0.0
+    return {"risk_level": final_risk, "confidence": confidence, "reasons": steps_data}
 
-    log_path = os.path.join(OUTPUT_DIR, file_name)
-    with open(log_path, "w", encoding="utf-8", errors='replace') as f:
+async def analyze_content(content_text: str, source_name: str) -> dict:
+    return await call_model(content_prompt(content_text, source_name), CONTENT_ANALYSIS_SCHEMA)
 
-        steps_data = {
-            "Step1_Page_Accessibility": [],
-            "Step2_Content_Analysis": [],
-            "Step3_LLM_Link_Suspiciousness": []
-        }
+async def analyze_link_suspiciousness(url: str) -> dict:
+    return await call_model(link_prompt(url), LINK_SUSPICIOUSNESS_SCHEMA)
 
-        w_page = 0.3
-        # w_main_html = 0.3 (not explicitly needed here)
-        # scripts total = 0.2
-        # direct link suspiciousness step weight = 0.5
-
-        check_1_A = {
-            "check_id":"check_1_A",
-            "analysis_agent":"page_accessibility_checker",
-            "weight":w_page,
-            "risk_level":"low",
-            "confidence":0.5,
-            "explanation":"Attempt to fetch main page"
-        }
+async def fetch_text(target_url: str):
+    """
+    GET a URL on the shared session.
+    Returns (status, text). text is None unless status is 200.
+    """
+    async with session.get(target_url, timeout=FETCH_TIMEOUT) as r:
+        if r.status != 200:
+            return r.status, None
+        return r.status, await r.text(errors="replace")
 
-        main_html = None
-        main_page_fetched = False
+async def fetch_page(url: str, f):
+    """
+    Step 1: fetch the page itself.
+    Returns (steps_data, main_html); main_html is None unless the page answered 200.
+    """
+    steps_data = {
+        "Step1_Page_Accessibility": [],
+        "Step2_Content_Analysis": [],
+        "Step3_LLM_Link_Suspiciousness": []
+    }
 
-        try:
-            page_resp = requests.get(url, timeout=10)
-            if page_resp.status_code == 200:
-                main_html = page_resp.text
-                main_page_fetched = True
-                check_1_A["risk_level"] = "low"
-                check_1_A["confidence"] = 0.7
-                check_1_A["explanation"] += " - Page fetched (200)."
-            else:
-                check_1_A["risk_level"] = "high"
-                check_1_A["confidence"] = 1.0
-                check_1_A["explanation"] += f" - Failed status={page_resp.status_code}, suspicious."
-        except requests.RequestException as e:
-            check_1_A["risk_level"] = "high"
-            check_1_A["confidence"] = 1.0
-            check_1_A["explanation"] += f" - Network error: {str(e)}, suspicious."
+    w_page = 0.3
+    # w_main_html = 0.3 (not explicitly needed here)
+    # scripts total = 0.2
+    # direct link suspiciousness step weight = 0.5
+
+    check_1_A = {
+        "check_id":"check_1_A",
+        "analysis_agent":"page_accessibility_checker",
+        "weight":w_page,
+        "risk_level":"low",
+        "confidence":0.5,
+        "explanation":"Attempt to fetch main page"
+    }
 
-        steps_data["Step1_Page_Accessibility"].append(check_1_A)
-        f.write(f"[STEP 1] Page Accessibility Checker: {check_1_A}\n")
-        f.write("\n\n************************************************\n\n")
+    main_html = None
+    main_page_fetched = False
 
-        script_contents = []
-        if main_page_fetched:
-            soup = BeautifulSoup(main_html, 'html.parser')
-            script_urls = [ urljoin(url, s['src']) for s in soup.find_all('script', src=True) ]
-
-            f.write(f"[INFO] Found script URLs: {script_urls}\n")
-
-            for s_url in script_urls:
-                try:
-                    s_resp = requests.get(s_url, timeout=10)
-                    if s_resp.status_code == 200:
-                        script_contents.append((s_url, s_resp.text))
-                    else:
-                        steps_data["Step2_Content_Analysis"].append({
-                            "check_id":"check_2_script_fetch",
-                            "analysis_agent":"script_fetcher",
-                            "weight":0.05,
-                            "risk_level":"low",
-                            "confidence":0.5,
-                            "explanation":f"Script {s_url} fetch {s_resp.status_code}, ignored."
-                        })
-                except requests.RequestException as e:
-                    steps_data["Step2_Content_Analysis"].append({
-                        "check_id":"check_2_script_fetch",
-                        "analysis_agent":"script_fetcher",
-                        "weight":0.05,
-                        "risk_level":"low",
-                        "confidence":0.5,
-                        "explanation":f"Network error fetching script {s_url}, ignored. Err: {e}"
-                    })
+    try:
+        page_status, page_text = await fetch_text(url)
+        if page_status == 200:
+            main_html = page_text
+            main_page_fetched = True
+            check_1_A["risk_level"] = "low"
+            check_1_A["confidence"] = 0.7
+            check_1_A["explanation"] += " - Page fetched (200)."
         else:
-            steps_data["Step2_Content_Analysis"].append({
-                "check_id":"check_2_no_main_html",
-                "analysis_agent":"html_parser",
-                "weight":0.1,
-                "risk_level":"high",
-                "confidence":0.6,
-                "explanation":"No main HTML, can't parse scripts, suspicious."
-            })
+            check_1_A["risk_level"] = "high"
+            check_1_A["confidence"] = 1.0
+            check_1_A["explanation"] += f" - Failed status={page_status}, suspicious."
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        check_1_A["risk_level"] = "high"
+        check_1_A["confidence"] = 1.0
+        check_1_A["explanation"] += f" - Network error: {str(e)}, suspicious."
 
-        main_html_text = main_html if main_html else "No main HTML."
-        f.write(f"[STEP 2] Content Analysis - main_html:\n{main_html_text[:500]}\n")
-        mh = analyze_content(main_html_text, "main_html")
-        f.write(f"Main HTML Analysis Result: {mh}\n")
-        f.write("\n\n************************************************\n\n")
+    steps_data["Step1_Page_Accessibility"].append(check_1_A)
+    f.write(f"[STEP 1] Page Accessibility Checker: {check_1_A}\n")
+    f.write("\n\n************************************************\n\n")
 
+    return steps_data, main_html
+
+async def fetch_scripts(url: str, main_html, steps_data: dict, f):
+    """
+    Non-LLM part of Step 2: download the page's external scripts.
+    Fetch problems are recorded in steps_data. Returns [(script_url, text), ...].
+    """
+    script_contents = []
+    if main_html is not None:
+        # Only <script src> tags are needed; the strainer keeps every other element out of the tree
+        soup = BeautifulSoup(main_html, 'html.parser', parse_only=SCRIPT_SRC_STRAINER)
+        # dict.fromkeys drops repeated tags but keeps page order
+        script_urls = list(dict.fromkeys(urljoin(url, s['src']) for s in soup.find_all('script', src=True)))
+
+        f.write(f"[INFO] Found script URLs: {script_urls}\n")
+
+        trusted = [u for u in script_urls if is_trusted_script(u)]
+        if trusted:
+            f.write(f"[INFO] Skipping trusted CDN scripts: {trusted}\n")
+        script_urls = [u for u in script_urls if u not in trusted][:MAX_SCRIPTS]
+
+        # Download every script at once; errors come back in place of (status, text)
+        fetched = await asyncio.gather(*[fetch_script(s_url) for s_url in script_urls], return_exceptions=True)
+        for s_url, res in zip(script_urls, fetched):
+            if isinstance(res, BaseException):
+                steps_data["Step2_Content_Analysis"].append({
+                    "check_id":"check_2_script_fetch",
+                    "analysis_agent":"script_fetcher",
+                    "weight":0.05,
+                    "risk_level":"low",
+                    "confidence":0.5,
+                    "explanation":f"Network error fetching script {s_url}, ignored. Err: {res!r}"
+                })
+                continue
+            s_status, s_text = res
+            if s_status == 200:
+                script_contents.append((s_url, s_text[:MAX_SCRIPT_CHARS]))
+            else:
+                steps_data["Step2_Content_Analysis"].append({
+                    "check_id":"check_2_script_fetch",
+                    "analysis_agent":"script_fetcher",
+                    "weight":0.05,
+                    "risk_level":"low",
+                    "confidence":0.5,
+                    "explanation":f"Script {s_url} fetch {s_status}, ignored."
+                })
+    else:
         steps_data["Step2_Content_Analysis"].append({
-            "check_id":"check_2_main_html_llm",
-            "analysis_agent":"LLM_html_analyzer",
-            "weight":0.3,
-            "risk_level":mh["risk_level"],
-            "confidence":mh["confidence"],
-            "explanation":mh["reason"]
+            "check_id":"check_2_no_main_html",
+            "analysis_agent":"html_parser",
+            "weight":0.1,
+            "risk_level":"high",
+            "confidence":0.6,
+            "explanation":"No main HTML, can't parse scripts, suspicious."
         })
 
-        script_llm_weight = 0.2 / (len(script_contents) if script_contents else 1)
-        for (src_name, stext) in script_contents:
-            f.write(f"[STEP 2] Content Analysis - script {src_name}:\n{stext[:500]}\n")
-            sr = analyze_content(stext, src_name)
-            f.write(f"Script Analysis Result: {sr}\n")
-            f.write("\n\n************************************************\n\n")
-
-            steps_data["Step2_Content_Analysis"].append({
-                "check_id":"check_2_script_llm",
-                "analysis_agent":"LLM_script_analyzer",
-                "weight":script_llm_weight,
-                "risk_level":sr["risk_level"],
-                "confidence":sr["confidence"],
-                "explanation":sr["reason"]
-            })
-
-        f.write(f"[STEP 3] LLM Link Suspiciousness Analysis for: {url}\n")
-        link_susp_res = analyze_link_suspiciousness(url)
-        f.write(f"Link Suspiciousness Result: {link_susp_res}\n")
+    return script_contents
+
+async def collect_evidence(url: str, f):
+    """
+    Step 1 and the non-LLM part of Step 2: fetch the page and its scripts.
+    Returns (steps_data, main_html_text, script_contents).
+    """
+    steps_data, main_html = await fetch_page(url, f)
+    script_contents = await fetch_scripts(url, main_html, steps_data, f)
+    main_html_text = main_html if main_html else "No main HTML."
+    return steps_data, main_html_text, script_contents
+
+def record_llm_checks(f, steps_data, url, main_html_text, script_contents, mh, script_results, link_susp_res):
+    """
+    Log the per-source LLM verdicts and add them to steps_data.
+    """
+    f.write(f"[STEP 2] Content Analysis - main_html:\n{main_html_text[:500]}\n")
+    f.write(f"Main HTML Analysis Result: {mh}\n")
+    f.write("\n\n************************************************\n\n")
+
+    steps_data["Step2_Content_Analysis"].append({
+        "check_id":"check_2_main_html_llm",
+        "analysis_agent":"LLM_html_analyzer",
+        "weight":0.3,
+        "risk_level":mh["risk_level"],
+        "confidence":mh["confidence"],
+        "explanation":mh["reason"]
+    })
+
+    script_llm_weight = 0.2 / (len(script_contents) if script_contents else 1)
+    for (src_name, stext), sr in zip(script_contents, script_results):
+        f.write(f"[STEP 2] Content Analysis - script {src_name}:\n{stext[:500]}\n")
+        f.write(f"Script Analysis Result: {sr}\n")
         f.write("\n\n************************************************\n\n")
 
-        steps_data["Step3_LLM_Link_Suspiciousness"].append({
-            "check_id":"check_3_link_suspiciousness",
-            "analysis_agent":"LLM_link_suspiciousness",
-            "weight":0.5,
-            "risk_level":link_susp_res["risk_level"],
-            "confidence":link_susp_res["confidence"],
-            "explanation":link_susp_res["reason"]
+        steps_data["Step2_Content_Analysis"].append({
+            "check_id":"check_2_script_llm",
+            "analysis_agent":"LLM_script_analyzer",
+            "weight":script_llm_weight,
+            "risk_level":sr["risk_level"],
+            "confidence":sr["confidence"],
+            "explanation":sr["reason"]
         })
 
-        aggregator_prompt = (
-            "You have steps_data from URL analysis.\n"
-            "Produce final JSON ONLY:\n"
-            "{\n"
-            "\"risk_level\":\"high|low\",\n"
-            "\"confidence\":float,\n"
-            "\"reasons\":{\n"
-            "  \"Step1_Page_Accessibility\":[...],\n"
-            "  \"Step2_Content_Analysis\":[...],\n"
-            "  \"Step3_LLM_Link_Suspiciousness\":[...]\n"
-            "}\n"
-            "}\n"
-            "No extra text outside JSON.\n"
-            "risk_level=high if ANY check is high else low.\n"
-            "confidence=weighted avg of all checks.\n"
-            "Include all checks from steps_data unchanged.\n"
-            f"{json.dumps(steps_data)}"
-        )
-
-        f.write(f"[STEP 4] Aggregator Prompt:\n{aggregator_prompt}\n")
-        final_res = call_model(aggregator_prompt, AGGREGATOR_SCHEMA)
-        f.write(f"Aggregator Final Result: {final_res}\n")
-        f.write("\n\n************************************************\n\n")
+    f.write(f"[STEP 3] LLM Link Suspiciousness Analysis for: {url}\n")
+    f.write(f"Link Suspiciousness Result: {link_susp_res}\n")
+    f.write("\n\n************************************************\n\n")
+
+    steps_data["Step3_LLM_Link_Suspiciousness"].append({
+        "check_id":"check_3_link_suspiciousness",
+        "analysis_agent":"LLM_link_suspiciousness",
+        "weight":0.5,
+        "risk_level":link_susp_res["risk_level"],
+        "confidence":link_susp_res["confidence"],
+        "explanation":link_susp_res["reason"]
+    })
+
+def is_trusted_script(s_url: str) -> bool:
+    host = (urlsplit(s_url).hostname or "").lower()
+    return any(host == h or host.endswith("." + h) for h in TRUSTED_SCRIPT_HOSTS)
+
+async def fetch_script(s_url: str):
+    """
+    fetch_text for script URLs, served from fetch_cache while the cached copy is fresh.
+    Only successful (200) downloads are cached.
+    """
+    if fetch_cache is not None:
+        cached = fetch_cache.get(s_url)
+        if cached and time.time() - cached[0] < FETCH_CACHE_TTL:
+            return 200, cached[1]
+
+    s_status, s_text = await fetch_text(s_url)
+    if fetch_cache is not None and s_status == 200:
+        fetch_cache[s_url] = (time.time(), s_text)
+    return s_status, s_text
+
+def open_log():
+    global log_writer
+    log_writer = zstandard.open(LOG_FILE, "wb")
+
+def close_log():
+    global log_writer
+    if log_writer is not None:
+        log_writer.close()
+    log_writer = None
+
+def write_log(row: int, url: str, buf: io.StringIO, result=None):
+    """
+    Append one URL's log (and its final verdict, if any) as a line of LOG_FILE.
+    """
+    line = {"row": row, "url": url, "log": buf.getvalue(), "result": result}
+    log_writer.write(orjson.dumps(line) + b"\n")
+
+async def process_link(url: str, row: int) -> dict:
+
+    # The log is built in memory and written once, so no file handle is held across awaits
+    buf = io.StringIO()
+    final_res = None
+    try:
+        steps_data, main_html = await fetch_page(url, buf)
+        main_html_text = main_html if main_html else "No main HTML."
+
+        # Main HTML, every script and the URL itself are analyzed independently.
+        # The main HTML and URL analyses only need the page, so start them now and
+        # let them run while the scripts download.
+        mh_task = asyncio.create_task(analyze_content(main_html_text, "main_html"))
+        link_task = asyncio.create_task(analyze_link_suspiciousness(url))
+        try:
+            script_contents = await fetch_scripts(url, main_html, steps_data, buf)
+            script_results = await asyncio.gather(
+                *[analyze_content(stext, src_name) for (src_name, stext) in script_contents]
+            )
+            mh, link_susp_res = await asyncio.gather(mh_task, link_task)
+        except BaseException:
+            mh_task.cancel()
+            link_task.cancel()
+            raise
+        record_llm_checks(buf, steps_data, url, main_html_text, script_contents, mh, script_results, link_susp_res)
+
+        final_res = aggregate_steps(steps_data)
+        buf.write(f"[STEP 4] Aggregator Final Result: {final_res}\n")
+        buf.write("\n\n************************************************\n\n")
 
         return {"status":"completed","result":final_res}
+    finally:
+        write_log(row, url, buf, final_res)
+
+def score_outcome(label, final: dict):
+    """
+    Compare the aggregated verdict with the dataset label.
+    Returns (suspicious, outcome).
+    """
+    final_risk = final.get("risk_level","low")
+    suspicious = "yes" if final_risk == "high" else "no"
+
+    # label=1 (legit) => suspicious=no => success
+    # label=0 (phishing) => suspicious=yes => success
+    if label == 1 and suspicious == "no":
+        return suspicious, "success"
+    if label == 0 and suspicious == "yes":
+        return suspicious, "success"
+    return suspicious, "fail"
+
+
+async def run_openai_batch(bodies: dict, tag: str) -> dict:
+    """
+    Submit {custom_id: request body} as one Batch API job and wait for it to finish.
+    Returns {custom_id: parsed JSON}; requests that failed are left out.
+    Requests already in llm_cache are answered locally and never submitted.
+    """
+    parsed = {}
+    keys = {custom_id: llm_cache_key(body) for custom_id, body in bodies.items()}
+    if llm_cache is not None:
+        for custom_id, key in keys.items():
+            if key in llm_cache:
+                parsed[custom_id] = llm_cache[key]
+        bodies = {custom_id: body for custom_id, body in bodies.items() if custom_id not in parsed}
+        if not bodies:
+            print(f"[INFO] All {len(parsed)} {tag} requests served from cache")
+            return parsed
+
+    input_path = os.path.join(OUTPUT_DIR, f"batch_{tag}_input.jsonl")
+    with open(input_path, "w", encoding="utf-8") as bf:
+        for custom_id, body in bodies.items():
+            bf.write(orjson.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}).decode() + "\n")
+
+    with open(input_path, "rb") as bf:
+        batch_file = await client.files.create(file=bf, purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"[INFO] Submitted {tag} batch {batch.id} with {len(bodies)} requests")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        done = f"{counts.completed}/{counts.total}" if counts else "?"
+        print(f"[INFO] Batch {batch.id}: {batch.status} ({done})", end='\r', flush=True)
+    print()
+
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"[ERROR] Batch {batch.id} ended with status={batch.status}")
+        return parsed
+
+    output = await client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line:
+            continue
+        item = orjson.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        result = orjson.loads(response["body"]["choices"][0]["message"]["content"])
+        parsed[item["custom_id"]] = result
+        if llm_cache is not None:
+            llm_cache[keys[item["custom_id"]]] = result
+    return parsed
 
 
 def ensure_output_dir(directory=OUTPUT_DIR):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def run_batch_test():
-    df = pd.read_csv(DATASET_FILE, encoding='utf-8')
+def load_dataset():
+    # Only URL/label are used; the dataset has ~50 other feature columns
+    df = pd.read_csv(
+        DATASET_FILE,
+        encoding='utf-8',
+        usecols=lambda c: c in ('URL', 'label'),
+        dtype={'label': 'int8', 'URL': 'string'}
+    )
     if 'URL' not in df.columns or 'label' not in df.columns:
         print("Dataset must have 'URL' and 'label' columns. 'label'=1 legit, 0 phishing.")
-        return
+        return None
 
     # Only process from START_INDEX to END_INDEX
     df = df.iloc[START_INDEX:END_INDEX]
-    total = len(df)
-    if total == 0:
+    if len(df) == 0:
         print("No data to process (check START_INDEX, END_INDEX).")
+        return None
+    return df
+
+def run_batch_test():
+    df = load_dataset()
+    if df is None:
         return
+    total = len(df)
 
     ensure_output_dir(OUTPUT_DIR)
 
-    results = []  # (label, URL, suspicious, outcome, time, final_json)
-    success = 0
-    fail = 0
-    error_count = 0
+    # Rows are stored by position so the CSV keeps dataset order even though
+    # URLs finish out of order.
+    results = [None] * total  # (label, URL, suspicious, outcome, time, final_json)
+    counts = {"success": 0, "fail": 0, "error": 0}
     total_time = 0.0
 
-    start_time = time.time()
-    start_dt = datetime.fromtimestamp(start_time)
-    print(f"Starting link analysis test at {start_dt.isoformat()} for {total} URLs...")
-
-    try:
-        for i, row in df.iterrows():
-            label = row['label']  # 1=legit, 0=phishing
-            url = row['URL']
-
-            idx = i - START_INDEX  # zero-based index for these runs
-            file_name = f"comprehensive_outputs_{idx+1}.log"
+    async def run_one(idx, label, url, semaphore):
+        nonlocal total_time
+        async with semaphore:
             print(f"[INFO] Processing URL {idx+1}/{total}: {url}")
-
             req_start = time.time()
             try:
-                result = process_link(url, file_name)
-                req_end = time.time()
-                elapsed = req_end - req_start
-                total_time += elapsed
+                result = await process_link(url, idx+1)
+                elapsed = time.time() - req_start
 
                 if result["status"] != "completed":
                     print("[ERROR] LLM processing not completed successfully.")
-                    error_count += 1
+                    counts["error"] += 1
                     outcome = "error_status"
                     suspicious = None
                     final_json = None
                 else:
                     final = result["result"]
-                    final_risk = final.get("risk_level","low")
-                    suspicious = "yes" if final_risk == "high" else "no"
-                    final_json = json.dumps(final)
-
-                    # label=1 (legit) => suspicious=no => success
-                    # label=0 (phishing) => suspicious=yes => success
-                    if label == 1 and suspicious == "no":
-                        success += 1
-                        outcome = "success"
-                    elif label == 0 and suspicious == "yes":
-                        success += 1
-                        outcome = "success"
-                    else:
-                        fail += 1
-                        outcome = "fail"
-
-            except KeyboardInterrupt:
-                processed = idx
-                print("Keyboard interrupt detected. Exiting gracefully.")
-                sys.exit(0)
+                    suspicious, outcome = score_outcome(label, final)
+                    counts[outcome] += 1
+                    final_json = orjson.dumps(final).decode()
+
             except Exception as e:
                 print(f"[ERROR] Exception: {e}")
-                error_count += 1
+                counts["error"] += 1
                 outcome = "error_exception"
                 suspicious = None
                 final_json = None
                 elapsed = time.time() - req_start
-                total_time += elapsed
 
-            results.append([label, url, suspicious, outcome, elapsed, final_json])
+            total_time += elapsed
+            results[idx] = [label, url, suspicious, outcome, elapsed, final_json]
+
+    async def main():
+        global session
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_LINKS)
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=20)
+        # Leaving the block also closes the OpenAI client's aiohttp session
+        async with aiohttp.ClientSession(connector=connector) as session, client:
+            await asyncio.gather(
+                *[run_one(idx, label, url, semaphore)  # label 1=legit, 0=phishing
+                  for idx, (label, url) in enumerate(df[['label', 'URL']].itertuples(index=False, name=None))],
+                return_exceptions=True
+            )
+
+    start_time = time.time()
+    start_dt = datetime.fromtimestamp(start_time)
+    print(f"Starting link analysis test at {start_dt.isoformat()} for {total} URLs...")
+
+    open_caches()
+    open_log()
+    try:
+        asyncio.run(main())
 
         end_time = time.time()
         end_dt = datetime.fromtimestamp(end_time)
         print(f"\nFinished link analysis at {end_dt.isoformat()}.")
 
-        processed = len(results)
+        done = [r for r in results if r is not None]
+        processed = len(done)
         if processed > 0:
-            accuracy = (success / processed) * 100
+            accuracy = (counts["success"] / processed) * 100
             avg_time = total_time / processed
-            print(f"Processed: {processed}, Success: {success}, Fail: {fail}, Error: {error_count}")
+            print(f"Processed: {processed}, Success: {counts['success']}, Fail: {counts['fail']}, Error: {counts['error']}")
             print(f"Accuracy: {accuracy:.2f}%")
             print(f"Average request time: {avg_time:.4f}s")
+            print(f"Wall time: {end_time - start_time:.2f}s")
         else:
             print("No data processed.")
 
         # Save all results to a single CSV
-        output_csv = os.path.join(OUTPUT_DIR, "link_analysis_10_tests.csv")
-        df_out = pd.DataFrame(results, columns=["label","URL","suspicious","outcome","time","final_json"])
-        df_out.to_csv(output_csv, index=False, encoding='utf-8', errors='replace')
-        print(f"Results saved to {output_csv}")
+        df_out = pd.DataFrame(done, columns=["label","URL","suspicious","outcome","time","final_json"])
+        df_out.to_csv(RESULTS_CSV, index=False, encoding='utf-8', errors='replace', compression=CSV_COMPRESSION)
+        print(f"Results saved to {RESULTS_CSV}")
 
     except KeyboardInterrupt:
-        processed = len(results)
+        done = [r for r in results if r is not None]
         print("Keyboard interrupt detected. Exiting gracefully.")
-        output_csv = os.path.join(OUTPUT_DIR, "link_analysis_10_tests_partial.csv")
-        df_out = pd.DataFrame(results, columns=["label","URL","suspicious","outcome","time","final_json"])
-        df_out.to_csv(output_csv, index=False, encoding='utf-8', errors='replace')
-        print(f"Partial Results saved to {output_csv}")
+        df_out = pd.DataFrame(done, columns=["label","URL","suspicious","outcome","time","final_json"])
+        df_out.to_csv(PARTIAL_RESULTS_CSV, index=False, encoding='utf-8', errors='replace', compression=CSV_COMPRESSION)
+        print(f"Partial Results saved to {PARTIAL_RESULTS_CSV}")
         sys.exit(0)
+    finally:
+        close_log()
+        close_caches()
+
+def run_batch_api_test():
+    """
+    Same evaluation as run_batch_test, but the LLM calls go through the Batch API:
+    fetch every page first, then submit one batch with all main-HTML/script/URL analyses.
+    """
+    df = load_dataset()
+    if df is None:
+        return
+    total = len(df)
+    labels = df['label'].tolist()  # 1=legit, 0=phishing
+    urls = df['URL'].tolist()
+
+    ensure_output_dir(OUTPUT_DIR)
+
+    def analysis_ids(idx, script_contents):
+        return ([f"row-{idx}-main"]
+                + [f"row-{idx}-script-{j}" for j in range(len(script_contents))]
+                + [f"row-{idx}-link"])
+
+    async def main():
+        global session
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_LINKS)
+        # Per-URL logs stay in memory until the run is done, then each is written once
+        logs = [io.StringIO() for _ in range(total)]
+
+        async def collect(idx):
+            async with semaphore:
+                return await collect_evidence(urls[idx], logs[idx])
+
+        # Leaving the block also closes the OpenAI client's aiohttp session
+        async with client:
+            connector = aiohttp.TCPConnector(limit=100, limit_per_host=20)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                evidence = await asyncio.gather(*[collect(idx) for idx in range(total)], return_exceptions=True)
+
+            bodies = {}
+            for idx, ev in enumerate(evidence):
+                if isinstance(ev, BaseException):
+                    continue
+                steps_data, main_html_text, script_contents = ev
+                ids = analysis_ids(idx, script_contents)
+                prompts = ([(content_prompt(main_html_text, "main_html"), CONTENT_ANALYSIS_SCHEMA)]
+                           + [(content_prompt(stext, src_name), CONTENT_ANALYSIS_SCHEMA) for (src_name, stext) in script_contents]
+                           + [(link_prompt(urls[idx]), LINK_SUSPICIOUSNESS_SCHEMA)])
+                for custom_id, (prompt, schema) in zip(ids, prompts):
+                    bodies[custom_id] = chat_body(prompt, schema)
+            analyses = await run_openai_batch(bodies, "analysis") if bodies else {}
+
+            finals = {}
+            for idx, ev in enumerate(evidence):
+                if isinstance(ev, BaseException):
+                    continue
+                steps_data, main_html_text, script_contents = ev
+                ids = analysis_ids(idx, script_contents)
+                if not all(custom_id in analyses for custom_id in ids):
+                    evidence[idx] = RuntimeError("analysis batch returned no result for this URL")
+                    continue
+                mh, *script_results, link_susp_res = [analyses[custom_id] for custom_id in ids]
+                f = logs[idx]
+                record_llm_checks(f, steps_data, urls[idx], main_html_text, script_contents, mh, script_results, link_susp_res)
+                finals[idx] = aggregate_steps(steps_data)
+                f.write(f"[STEP 4] Aggregator Final Result: {finals[idx]}\n")
+                f.write("\n\n************************************************\n\n")
+
+            for idx, buf in enumerate(logs):
+                write_log(idx+1, urls[idx], buf, finals.get(idx))
+
+            return evidence, finals
+
+    start_time = time.time()
+    start_dt = datetime.fromtimestamp(start_time)
+    print(f"Starting Batch API link analysis at {start_dt.isoformat()} for {total} URLs...")
+
+    open_caches()
+    open_log()
+    try:
+        evidence, finals = asyncio.run(main())
+    finally:
+        close_log()
+        close_caches()
+
+    end_time = time.time()
+    # Rows are not timed individually in batch mode; report the share of the wall time
+    per_row_time = (end_time - start_time) / total
+
+    results = []
+    counts = {"success": 0, "fail": 0, "error": 0}
+    for idx in range(total):
+        final = finals.get(idx)
+        if final is None:
+            print(f"[ERROR] URL {idx+1}/{total} {urls[idx]}: {evidence[idx]}")
+            counts["error"] += 1
+            results.append([labels[idx], urls[idx], None, "error_exception", per_row_time, None])
+            continue
+
+        suspicious, outcome = score_outcome(labels[idx], final)
+        counts[outcome] += 1
+        results.append([labels[idx], urls[idx], suspicious, outcome, per_row_time, orjson.dumps(final).decode()])
+
+    print(f"\nFinished Batch API link analysis at {datetime.fromtimestamp(end_time).isoformat()}.")
+    print(f"Processed: {total}, Success: {counts['success']}, Fail: {counts['fail']}, Error: {counts['error']}")
+    print(f"Accuracy: {(counts['success'] / total) * 100:.2f}%")
+    print(f"Wall time: {end_time - start_time:.2f}s")
+
+    df_out = pd.DataFrame(results, columns=["label","URL","suspicious","outcome","time","final_json"])
+    df_out.to_csv(RESULTS_CSV, index=False, encoding='utf-8', errors='replace', compression=CSV_COMPRESSION)
+    print(f"Results saved to {RESULTS_CSV}")
 
 
 if __name__ == "__main__":
-    run_batch_test()
+    if USE_BATCH_API:
+        run_batch_api_test()
+    else:
+        run_batch_test()
@@ -1,39 +1,63 @@
+import csv
 import requests
 import pandas as pd
 import time
 from datetime import datetime
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # File: test_messages.py
 #
 # Requirements:
-# - Every 5% of dataset processed, save partial results to ./outputs/message_out_batchX.csv
-# - Also maintain a general log (general_log.csv) and run log for each batch (run_log_batchX.log)
+# - Every result row is appended to ./outputs_message/message_results.csv as soon as it completes
+# - Every 5% of dataset processed, maintain a general log (general_log.csv) and run log for each batch (run_log_batchX.log)
 # - On KeyboardInterrupt, save what we have and exit gracefully
 # - At end or interrupt, print final accuracy, error rate, avg time.
 #
 # Steps:
 # 1) Load sms_spam.csv (label=ham/spam, message)
-# 2) For each row, call /api/analyze/message
+# 2) For each row, call /api/analyze/message (MAX_WORKERS requests in flight at once)
 # 3) Store result (label, message, suspicious, success/fail/error, time)
-# 4) Every 5% of total processed, write partial CSV and logs
-# 5) If KeyboardInterrupt, save partial and exit
+# 4) Every 5% of total processed, write the batch logs
+# 5) If KeyboardInterrupt, log and exit (the results CSV is already up to date)
 # 6) Print final stats
 
 SMS_SPAM_FILE = "sms_spam.csv"
 BACKEND_URL = "http://localhost:8000"
 OUTPUT_DIR = "./outputs_message"
+# Number of concurrent requests to the backend
+MAX_WORKERS = 16
+# Minimum seconds between progress bar redraws
+PROGRESS_INTERVAL = 0.25
 
 def ensure_output_dir():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
 
+def call_backend(msg):
+    """
+    POST one message to the backend. Runs on a worker thread.
+    Returns (status_code, suspicious, elapsed); status_code is None if the request raised.
+    """
+    payload = {"message": msg}
+    req_start = time.time()
+    try:
+        resp = requests.post(f"{BACKEND_URL}/api/analyze/message", json=payload, timeout=30)
+        if resp.status_code != 200:
+            return resp.status_code, None, time.time() - req_start
+        data = resp.json()
+        return resp.status_code, data.get("result", {}).get("suspicious", "no"), time.time() - req_start
+    except Exception:
+        return None, None, time.time() - req_start
+
 def test_messages():
-    df = pd.read_csv(SMS_SPAM_FILE, encoding='latin-1')
+    # Skip the empty trailing columns of sms_spam.csv at read time
+    df = pd.read_csv(SMS_SPAM_FILE, encoding='latin-1', usecols=lambda c: c in ('v1', 'v2', 'label', 'message'))
     if 'v1' in df.columns and 'v2' in df.columns:
         df.rename(columns={'v1':'label','v2':'message'}, inplace=True)
     df = df[['label','message']]
+    df['label'] = df['label'].astype('category')
     total = len(df)
 
     if total == 0:
@@ -47,7 +71,12 @@ def test_messages():
     next_batch = batch_interval
     batch_number = 0
 
-    results = []  # store per-request info: (label, message, suspicious, outcome, time)
+    # Per-request rows (label, message, suspicious, outcome, time) go straight to disk
+    results_csv = os.path.join(OUTPUT_DIR, "message_results.csv")
+    results_file = open(results_csv, "w", newline="", encoding="utf-8")
+    results_writer = csv.writer(results_file)
+    results_writer.writerow(["label","message","suspicious","outcome","time"])
+    rows_written = 0
     success = 0
     fail = 0
     error = 0
@@ -71,11 +100,9 @@ def test_messages():
             accuracy = (success / processed) * 100
         avg_time = total_time / processed if processed > 0 else 0.0
 
-        # Save batch results
+        # Rows are already written; just make sure they have left the buffer
         batch_number += 1
-        batch_csv = os.path.join(OUTPUT_DIR, f"message_out_batch{batch_number}.csv")
-        batch_df = pd.DataFrame(results, columns=["label","message","suspicious","outcome","time"])
-        batch_df.to_csv(batch_csv, index=False)
+        results_file.flush()
 
         # Update general log
         with open(general_log_path, "a") as gf:
@@ -91,78 +118,68 @@ def test_messages():
             lf.write(f"Avg Time: {avg_time:.4f}s\n")
 
         if final:
-            print(f"\nFinal Results Saved to {batch_csv}")
+            print(f"\nFinal Results Saved to {results_csv}")
         else:
-            print(f"\nPartial Results Saved to {batch_csv}")
+            print(f"\nPartial Results Saved to {results_csv}")
+
+    bar_length = 50
+    last_print = 0.0
 
+    # Requests run on the pool; results are handled here on the main thread as they
+    # complete, so the counters and the CSV writer are only ever touched by one thread.
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
     try:
-        for i, row in df.iterrows():
-            label = row['label']
-            msg = row['message']
-
-            payload = {"message": msg}
-            req_start = time.time()
-            try:
-                resp = requests.post(f"{BACKEND_URL}/api/analyze/message", json=payload, timeout=30)
-                req_end = time.time()
-                elapsed = req_end - req_start
-                total_time += elapsed
+        futures = {executor.submit(call_backend, msg): (label, msg)
+                   for label, msg in df.itertuples(index=False, name=None)}
+
+        for i, future in enumerate(as_completed(futures)):
+            label, msg = futures[future]
+            status_code, suspicious, elapsed = future.result()
 
-                if resp.status_code != 200:
+            if status_code is None:
+                error += 1
+                outcome = "error_exception"
+            else:
+                total_time += elapsed
+                if status_code != 200:
                     error += 1
                     outcome = "error_status"
-                    suspicious = None
+                # Determine success/fail
+                # spam + suspicious=yes => success
+                # ham + suspicious=no => success
+                # else fail
+                elif label == "spam" and suspicious == "yes":
+                    success += 1
+                    outcome = "success"
+                elif label == "ham" and suspicious == "no":
+                    success += 1
+                    outcome = "success"
                 else:
-                    data = resp.json()
-                    suspicious = data.get("result", {}).get("suspicious", "no")
-                    # Determine success/fail
-                    # spam + suspicious=yes => success
-                    # ham + suspicious=no => success
-                    # else fail
-                    if label == "spam" and suspicious == "yes":
-                        success += 1
-                        outcome = "success"
-                    elif label == "ham" and suspicious == "no":
-                        success += 1
-                        outcome = "success"
-                    else:
-                        fail += 1
-                        outcome = "fail"
-            except KeyboardInterrupt:
-                # On Ctrl+C, save partial and exit
-                processed = i
-                save_partial(processed, final=True)
-                print("Keyboard interrupt detected. Exiting gracefully.")
-                sys.exit(0)
-            except Exception:
-                # Other exceptions
-                error += 1
-                outcome = "error_exception"
-                suspicious = None
-                elapsed = time.time() - req_start
+                    fail += 1
+                    outcome = "fail"
 
             # Store result
-            results.append([label, msg, suspicious, outcome, elapsed])
+            results_writer.writerow([label, msg, suspicious, outcome, elapsed])
+            rows_written += 1
 
             processed = i + 1
-            percent = (processed / total) * 100
-            # Update progress on the same line
-            # Recompute bar and ETA each iteration:
-            bar_length = 50
-            completed = int((processed / total) * bar_length)
-            bar = '*' * completed + '.' * (bar_length - completed)
-
-            elapsed_so_far = time.time() - start_time
-            avg_per_req = elapsed_so_far / processed if processed > 0 else 0.0
-            remaining = total - processed
-            remaining_time = avg_per_req * remaining
-            estimated_end = datetime.fromtimestamp(time.time() + remaining_time).isoformat()
+            # Update progress on the same line, at most every PROGRESS_INTERVAL seconds
+            now = time.time()
+            if now - last_print >= PROGRESS_INTERVAL or processed == total:
+                last_print = now
+                percent = (processed / total) * 100
+                completed = int((processed / total) * bar_length)
+                bar = '*' * completed + '.' * (bar_length - completed)
 
-            progress_str = (f"[{percent:3.0f}%]{bar} [Progress:{processed}/{total}]"
-                            f"[ETA:{estimated_end}]")
+                elapsed_so_far = now - start_time
+                avg_per_req = elapsed_so_far / processed if processed > 0 else 0.0
+                remaining = total - processed
+                estimated_end = time.strftime("%H:%M:%S", time.localtime(now + avg_per_req * remaining))
 
-            print(progress_str, end='\r', flush=True)
+                progress_str = (f"[{percent:3.0f}%]{bar} [Progress:{processed}/{total}]"
+                                f"[ETA:{estimated_end}]")
 
+                print(progress_str, end='\r', flush=True)
 
             # Every batch_interval (5%), save partial results
             if processed >= next_batch and processed < total:
@@ -186,11 +203,14 @@ def test_messages():
             print("No data processed.")
 
     except KeyboardInterrupt:
-        # If Ctrl+C outside the request loop
-        processed = len(results)
-        save_partial(processed, final=True)
+        # On Ctrl+C, drop the queued requests, save partial and exit
+        executor.shutdown(wait=False, cancel_futures=True)
+        save_partial(rows_written, final=True)
         print("Keyboard interrupt detected. Exiting gracefully.")
         sys.exit(0)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        results_file.close()
 
 if __name__ == "__main__":
     test_messages()
@@ -2,7 +2,9 @@ import pandas as pd
 
 # Read the data
 file_path = "./results/link_gpt4o.csv"  # Replace with the actual file path
-data = pd.read_csv(file_path)
+# Only the two columns used below are loaded. Compression follows the suffix,
+# so the .csv.zst files written by eval_links_openai_detailed.py load as well.
+data = pd.read_csv(file_path, usecols=['label', 'suspicious'], compression="infer")
 
 # Define conditions for classification
 # True Positive (TP): label = 1 and suspicous = 'no'
@@ -10,16 +12,14 @@ data = pd.read_csv(file_path)
 # False Positive (FP): label = 0 and suspicous = 'no'
 # False Negative (FN): label = 1 and suspicous = 'yes'
 
-data['TP'] = (data['label'] == 1) & (data['suspicious'] == 'no')
-data['TN'] = (data['label'] == 0) & (data['suspicious'] == 'yes')
-data['FP'] = (data['label'] == 0) & (data['suspicious'] == 'no')
-data['FN'] = (data['label'] == 1) & (data['suspicious'] == 'yes')
+# One pass over the data: rows = label, columns = suspicious
+counts = data.groupby(['label', 'suspicious']).size().unstack(fill_value=0)
+counts = counts.reindex(index=[1, 0], columns=['no', 'yes'], fill_value=0)
 
-# Count the occurrences
-true_positives = data['TP'].sum()
-true_negatives = data['TN'].sum()
-false_positives = data['FP'].sum()
-false_negatives = data['FN'].sum()
+true_positives = counts.loc[1, 'no']
+true_negatives = counts.loc[0, 'yes']
+false_positives = counts.loc[0, 'no']
+false_negatives = counts.loc[1, 'yes']
 
 # Output the results
 print(f"True Positives: {true_positives}")
@@ -2,7 +2,8 @@ import pandas as pd
 
 # Read the data
 file_path = "./results/message_local.csv"  # Replace with the actual file path
-data = pd.read_csv(file_path)
+# Only the two columns used below are loaded
+data = pd.read_csv(file_path, usecols=['label', 'suspicious'])
 
 # Define conditions for classification
 # True Positive (TP): label = 'spam' and outcome = 'success'
@@ -10,16 +11,14 @@ data = pd.read_csv(file_path)
 # False Positive (FP): label = 'ham' and outcome = 'success'
 # False Negative (FN): label = 'spam' and outcome = 'fail'
 
-data['TP'] = (data['label'] == 'ham') & (data['suspicious'] == 'no')
-data['TN'] = (data['label'] == 'spam') & (data['suspicious'] == 'yes')
-data['FP'] = (data['label'] == 'spam') & (data['suspicious'] == 'no')
-data['FN'] = (data['label'] == 'ham') & (data['suspicious'] == 'yes')
+# One pass over the data: rows = label, columns = suspicious
+counts = data.groupby(['label', 'suspicious']).size().unstack(fill_value=0)
+counts = counts.reindex(index=['ham', 'spam'], columns=['no', 'yes'], fill_value=0)
 
-# Count the occurrences
-true_positives = data['TP'].sum()
-true_negatives = data['TN'].sum()
-false_positives = data['FP'].sum()
-false_negatives = data['FN'].sum()
+true_positives = counts.loc['ham', 'no']
+true_negatives = counts.loc['spam', 'yes']
+false_positives = counts.loc['spam', 'no']
+false_negatives = counts.loc['ham', 'yes']
 
 # Output the results
 print(f"True Positives: {true_positives}")
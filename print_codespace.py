@@ -7,45 +7,79 @@ sys.stdout.reconfigure(encoding='utf-8')
 # Define the extensions for which content should be printed
 EXT_TO_PRINT = {'.py', '.yml', '.config', 'dockerfile'}
 
-def print_tree_structure(path):
-    """Print the tree structure of the codespace."""
-    print("--- Codespace Structure ---")
-    for root, dirs, files in os.walk(path):
-        level = root.replace(path, '').count(os.sep)
-        indent = ' ' * 4 * level
-        print(f'{indent}{os.path.basename(root)}/')
-        sub_indent = ' ' * 4 * (level + 1)
-        for file in files:
-            print(f'{sub_indent}{file}')
-    print("-" * 40)
-
-def print_directory_contents(path):
-    """Print the contents of files with specified extensions."""
-    print(f"--- PATH: {path} ---")
-    for root, dirs, files in os.walk(path):
-        level = root.replace(path, '').count(os.sep)
-        indent = ' ' * 4 * level
-        print(f'{indent}{os.path.basename(root)}/')
-        sub_indent = ' ' * 4 * (level + 1)
-        for file in files:
-            file_path = os.path.join(root, file)
+# Indent strings by depth, built once instead of per directory
+INDENTS = [' ' * 4 * i for i in range(64)]
+
+def indent_for(depth):
+    return INDENTS[depth] if depth < len(INDENTS) else ' ' * 4 * depth
+
+def scan_codespace(path):
+    """
+    Walk the codespace once with os.scandir, carrying depth as an integer.
+    Returns (depth, name, is_dir, full_path) entries in os.walk top-down order:
+    a directory, then its files, then its subdirectories.
+    """
+    entries = []
+
+    def walk(dir_path, depth):
+        entries.append((depth, os.path.basename(dir_path), True, dir_path))
+        subdirs = []
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            return
+        with it:
+            for entry in it:
+                if entry.is_dir():
+                    # Like os.walk, do not descend into symlinked directories
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                else:
+                    entries.append((depth + 1, entry.name, False, entry.path))
+        for sub in subdirs:
+            walk(sub, depth + 1)
+
+    walk(path, 0)
+    return entries
+
+def print_tree_structure(entries, out):
+    """Append the tree structure of the codespace to `out` (one line per item)."""
+    out.append("--- Codespace Structure ---")
+    for depth, name, is_dir, _ in entries:
+        out.append(f'{indent_for(depth)}{name}/' if is_dir else f'{indent_for(depth)}{name}')
+    out.append("-" * 40)
+
+def print_directory_contents(path, entries, out):
+    """Append the contents of files with specified extensions to `out`."""
+    out.append(f"--- PATH: {path} ---")
+    for depth, name, is_dir, file_path in entries:
+        indent = indent_for(depth)
+        if is_dir:
+            out.append(f'{indent}{name}/')
+            continue
+        out.append(f'{indent}{name}')
+
+        file_ext = os.path.splitext(name)[1]
+        if file_ext.lower() in EXT_TO_PRINT:  # Check if the file extension matches
             relative_path = os.path.relpath(file_path, path)
-            file_ext = os.path.splitext(file)[1]
-            print(f'{sub_indent}{file}')
-
-            if file_ext.lower() in EXT_TO_PRINT:  # Check if the file extension matches
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        # Print separator with the relative path of the file
-                        print("\n" + "-" * 40)
-                        print(f"--- FILE: {relative_path} ---")
-                        print(content)
-                        print("-" * 40 + "\n")
-                except Exception as e:
-                    print(f'{sub_indent}Error reading file: {e}')
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                    # Print separator with the relative path of the file
+                    out.append("\n" + "-" * 40)
+                    out.append(f"--- FILE: {relative_path} ---")
+                    out.append(content)
+                    out.append("-" * 40 + "\n")
+            except Exception as e:
+                out.append(f'{indent}Error reading file: {e}')
 
 if __name__ == "__main__":
     directory = "."
-    print_tree_structure(directory)
-    print_directory_contents(directory)
\ No newline at end of file
+    # One traversal feeds both the tree and the contents listing
+    entries = scan_codespace(directory)
+    # Collect every line and write once, instead of one print() per line
+    out = []
+    print_tree_structure(entries, out)
+    print_directory_contents(directory, entries, out)
+    out.append("")
+    sys.stdout.write("\n".join(out))
@@ -39,7 +39,10 @@
 #
 # Design Notes:
 # - The `get_health_info()` and `get_available_endpoints()` functions call Providers subsystem endpoints.
-# - The `refresh_info()` function fetches both at once and returns them to be displayed in textboxes.
+# - The `refresh_info()` function fetches both concurrently (asyncio.gather) and returns them
+#   to be displayed in textboxes, so a refresh costs max(t_health, t_endpoints), not the sum.
+# - All handlers are async and share one module-level httpx.AsyncClient, so a slow
+#   upload/run call does not tie up a Gradio worker thread and TCP connections are reused.
 # - The UI consists of:
 #   - A title and description.
 #   - A "Refresh Info" button.
@@ -52,18 +55,42 @@
 # - Add error handling UI if calls fail more gracefully.
 ###############################################################################
 
-import requests
+import asyncio
+import time
+import httpx
 import gradio as gr
 import os
 import base64
-import tempfile
+import io
+from PIL import Image
 
 # Configure the base URL of the Providers subsystem.
 # We assume the main server runs on `http://localhost:8003` internally.
 # Adjust if needed (e.g., use an environment variable).
 PROVIDERS_BASE_URL = "http://localhost:8003"
 
-def get_health_info():
+# Shared keep-alive client for the UI handlers; created lazily inside the
+# server's event loop (an AsyncClient must not be shared across loops).
+_client = None
+# Connection pool for the shared client, plus one retry on connect failures
+CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=10, max_connections=20)
+CLIENT_RETRIES = 1
+
+# The endpoint list only changes on redeploy; reuse it for a few seconds
+ENDPOINTS_CACHE_TTL = 5.0
+_endpoints_cache = None  # (fetched_at, text)
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=PROVIDERS_BASE_URL,
+            timeout=5,
+            transport=httpx.AsyncHTTPTransport(limits=CLIENT_LIMITS, retries=CLIENT_RETRIES),
+        )
+    return _client
+
+async def get_health_info(client: httpx.AsyncClient):
     """
     Fetch health information from /health endpoint and format it nicely.
     
@@ -77,7 +104,7 @@ def get_health_info():
     4. If non-200 or error, return an error message.
     """
     try:
-        r = requests.get(f"{PROVIDERS_BASE_URL}/health", timeout=5)
+        r = await client.get("/health")
         if r.status_code == 200:
             data = r.json()
             status = data.get("status", "unknown")
@@ -89,7 +116,7 @@ def get_health_info():
     except Exception as e:
         return f"Error fetching health info: {e}"
 
-def get_available_endpoints():
+async def get_available_endpoints(client: httpx.AsyncClient):
     """
     Fetch the list of all known endpoints from /admin/endpoints.
     
@@ -101,14 +128,21 @@ def get_available_endpoints():
        }
     3. Join them with newlines for display.
     4. If no endpoints or non-200, show an appropriate message.
+
+    A successful listing is cached for ENDPOINTS_CACHE_TTL seconds.
     """
+    global _endpoints_cache
+    if _endpoints_cache and time.monotonic() - _endpoints_cache[0] < ENDPOINTS_CACHE_TTL:
+        return _endpoints_cache[1]
     try:
-        r = requests.get(f"{PROVIDERS_BASE_URL}/admin/endpoints", timeout=5)
+        r = await client.get("/admin/endpoints")
         if r.status_code == 200:
             data = r.json()
             eps = data.get("endpoints", [])
             if eps:
-                return "Available Endpoints:\n" + "\n".join(eps)
+                text = "Available Endpoints:\n" + "\n".join(eps)
+                _endpoints_cache = (time.monotonic(), text)
+                return text
             else:
                 return "No endpoints returned by /admin/endpoints."
         else:
@@ -116,18 +150,26 @@ def get_available_endpoints():
     except Exception:
         return "Endpoints info not available. Perhaps /admin/endpoints not implemented or server unreachable."
 
-def refresh_info():
+async def refresh_info(client: httpx.AsyncClient = None):
     """
-    Refresh data for both health and endpoints.
+    Refresh data for both health and endpoints; the two requests run concurrently.
     Returns:
       (health_info_str, endpoints_info_str)
     """
-    health = get_health_info()
-    endpoints = get_available_endpoints()
+    client = client or get_client()
+    health, endpoints = await asyncio.gather(get_health_info(client), get_available_endpoints(client))
 
     return health, endpoints
 
-def upload_app_to_server(apk_file):
+async def initial_info():
+    """
+    One-off fetch for the initial textbox values at import time. Uses its own
+    client because it runs in a temporary event loop (asyncio.run).
+    """
+    async with httpx.AsyncClient(base_url=PROVIDERS_BASE_URL, timeout=5) as client:
+        return await refresh_info(client)
+
+async def upload_app_to_server(apk_file):
     """
     Upload the selected APK to /emulator/upload_app.
     Returns:
@@ -135,10 +177,9 @@ def upload_app_to_server(apk_file):
     """
     if apk_file is None:
         return "No APK selected.", "", ""
-    url = f"{PROVIDERS_BASE_URL}/emulator/upload_app"
     with open(apk_file, "rb") as f:
         files = {"file": (os.path.basename(apk_file), f, "application/vnd.android.package-archive")}
-        r = requests.post(url, files=files, timeout=60)
+        r = await get_client().post("/emulator/upload_app", files=files, timeout=60)
         if r.status_code != 200:
             return f"Error: {r.status_code} {r.text}", "", ""
         data = r.json()
@@ -149,17 +190,19 @@ def upload_app_to_server(apk_file):
             message = "Uploaded successfully."
         return f"Status: {status}", filename, message
 
-def run_app_in_emulator(app_ref):
+async def run_app_in_emulator(app_ref):
     """
     Calls /emulator/run_app with given app_ref (filename or full path).
     Returns status, events, task_id, screenshot image, and VNC info.
+
+    The screenshot is requested as a URL (inline_screenshot=false), fetched as raw
+    PNG bytes and handed to gr.Image as a PIL image; nothing is written to disk.
     """
     if not app_ref or not app_ref.strip():
         return "No app_ref provided.", "", "", None, ""
-    run_app_url = f"{PROVIDERS_BASE_URL}/emulator/run_app"
-    payload = {"app_ref": app_ref.strip()}
+    payload = {"app_ref": app_ref.strip(), "inline_screenshot": False}
     try:
-        r = requests.post(run_app_url, json=payload, timeout=60)
+        r = await get_client().post("/emulator/run_app", json=payload, timeout=60)
         if r.status_code != 200:
             return f"Error: {r.status_code} {r.text}", "", "", None, ""
         data = r.json()
@@ -167,18 +210,26 @@ def run_app_in_emulator(app_ref):
         visuals = data.get("visuals",{})
         events = data.get("events",[])
         task_id = data.get("task_id","")
+        screenshot_url = visuals.get("screenshot_url","")
         screenshot_b64 = visuals.get("screenshot","")
 
-        img_path = None
-        if screenshot_b64:
+        img_data = None
+        if screenshot_url:
+            shot = await get_client().get(screenshot_url, timeout=60)
+            shot.raise_for_status()
+            img_data = shot.content
+        elif screenshot_b64:
+            # Older providers servers still inline the screenshot
             img_data = base64.b64decode(screenshot_b64)
-            img_path = tempfile.NamedTemporaryFile(suffix=".png", delete=False).name
-            with open(img_path,"wb") as imgf:
-                imgf.write(img_data)
+
+        img = None
+        if img_data:
+            img = Image.open(io.BytesIO(img_data))
+            img.load()  # decode now so a bad PNG is reported here
 
         events_str = "\n".join(events)
         vnc_info = "VNC: http://localhost:6080/?autoconnect=true"
-        return f"Status: {status}", events_str, task_id, img_path, vnc_info
+        return f"Status: {status}", events_str, task_id, img, vnc_info
     except Exception as e:
         return f"Error calling run_app: {e}", "", "", None, ""
 
@@ -224,7 +275,7 @@ with gr.Blocks() as admin_ui_blocks:
 
     # Initial load
     refresh_button.click(fn=refresh_info, inputs=[], outputs=[health_output, endpoints_output])
-    initial_health, initial_endpoints = refresh_info()
+    initial_health, initial_endpoints = asyncio.run(initial_info())
     health_output.value = initial_health
     endpoints_output.value = initial_endpoints
 
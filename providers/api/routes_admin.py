@@ -26,13 +26,19 @@
 from fastapi import APIRouter, Request
 from pydantic import BaseModel
 import os
-import json
+import orjson
+from utils.config_loader import load_cached, parse_yaml
 
 router = APIRouter()
 
 class EndpointsListResponse(BaseModel):
     endpoints: list[str]
 
+# Memoized /admin/endpoints response: (app, route count, response).
+# The route table is fixed after startup, so it is rebuilt only if the
+# route count changes (or a different app instance asks, e.g. in tests).
+_cached: tuple | None = None
+
 @router.get("/endpoints", response_model=EndpointsListResponse)
 async def list_endpoints(request: Request):
     """
@@ -50,8 +56,14 @@ async def list_endpoints(request: Request):
     Future Enhancements:
     - Filter out admin endpoints themselves if we don’t want them listed.
     - Include HTTP methods or tags if needed.
+
+    The result is memoized in _cached and reused while len(app.routes) is unchanged.
     """
+    global _cached
     app = request.app
+    if _cached and _cached[0] is app and _cached[1] == len(app.routes):
+        return _cached[2]
+
     paths = []
     for route in app.routes:
         # route might be of type APIRoute or others
@@ -65,7 +77,9 @@ async def list_endpoints(request: Request):
 
     # Remove duplicates by converting to a set then back to list if needed
     unique_paths = sorted(set(paths))
-    return EndpointsListResponse(endpoints=unique_paths)
+    response = EndpointsListResponse(endpoints=unique_paths)
+    _cached = (app, len(app.routes), response)
+    return response
 
 @router.get("/config")
 async def show_config():
@@ -84,30 +98,27 @@ async def show_config():
     - For now, no auth. This is a PoC or internal tool.
 
     If config.yaml or instances.json doesn’t exist or can’t be read, return partial data.
+    Parsed files are cached by (mtime, size) via config_loader.load_cached,
+    shared with load_config/load_instances.
     """
     response_data = {}
     # Attempt to read config.yaml
     config_path = "config.yaml"
     if os.path.exists(config_path):
-        import yaml
-        with open(config_path, "r") as f:
-            try:
-                config_data = yaml.safe_load(f)
-                response_data["config"] = config_data
-            except Exception as e:
-                response_data["config_error"] = f"Failed to parse config.yaml: {e}"
+        try:
+            response_data["config"] = load_cached(config_path, parse_yaml)
+        except Exception as e:
+            response_data["config_error"] = f"Failed to parse config.yaml: {e}"
     else:
         response_data["config_error"] = "config.yaml not found"
 
     # Attempt to read instances.json
     instances_path = "instances.json"
     if os.path.exists(instances_path):
-        with open(instances_path, "r") as f:
-            try:
-                instances_data = json.load(f)
-                response_data["instances"] = instances_data
-            except Exception as e:
-                response_data["instances_error"] = f"Failed to parse instances.json: {e}"
+        try:
+            response_data["instances"] = load_cached(instances_path, orjson.loads)
+        except Exception as e:
+            response_data["instances_error"] = f"Failed to parse instances.json: {e}"
     else:
         response_data["instances_error"] = "instances.json not found"
 
@@ -10,46 +10,70 @@
 # - App launching (run_app)
 # - Retrieving VNC URL for a running app session
 # - UI interactions: tap, type, swipe, back, home
-# - Taking screenshots
+# - Taking screenshots (raw PNG via /screenshot.png or /{task_id}/screenshot; base64 JSON via /screenshot)
 #
 # New Changes:
 # - `task_id` query parameter added to control endpoints (tap, type, swipe, back, home, screenshot)
 #   so multiple emulators/endpoints can be distinguished.
 # - If `task_id` is not found or not provided, we return an error.
 #
+# Blocking work:
+# - Emulator/ADB calls and whole-file disk work never run on the event loop.
+#   install/run/init go through asyncio.to_thread; the frequent control calls
+#   (tap, type, swipe, back, home, screenshot) use EMULATOR_EXECUTOR, a bounded
+#   pool, so slow emulator RPCs cannot exhaust the default threadpool.
+#
 # Maintainability:
 # - If new actions or parameters are needed, just add a new endpoint or adjust existing ones.
 # - If authentication or rate-limiting needed, add middleware or dependencies.
 ###############################################################################
 
 import os
+import mmap
+import asyncio
+import orjson
 import hashlib
 import logging
-from fastapi import APIRouter, HTTPException, File, UploadFile, Query
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from pydantic import BaseModel, StringConstraints, TypeAdapter, ValidationError
+from typing import Annotated, Optional, Dict, Any
 
 from core.emulator_env import EmulatorEnv
 
+# Large bodies (/run_app, /screenshot base64) declare a response_model, so FastAPI
+# serializes them straight to JSON bytes with Pydantic; fixed replies are orjson bytes
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 APKS_DIR = "/providers/apks"
 os.makedirs(APKS_DIR, exist_ok=True)
 
+# Uploads are copied to disk in chunks of this size instead of read whole into memory
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 ###############################################################################
 # Shared Schemas and Utilities
 ###############################################################################
 
 class EmulatorRequest(BaseModel):
     app_ref: str  # local filename/path in APKS_DIR or absolute path
+    # False -> visuals carries "screenshot_url" (raw PNG endpoint) instead of base64
+    inline_screenshot: bool = True
 
 class EmulatorResponse(BaseModel):
     status: str
-    visuals: dict        # {"screenshot":"base64..."}
+    visuals: dict        # {"screenshot":"base64..."} or {"screenshot_url":"/emulator/screenshot.png?task_id=..."}
     events: list[str]
     task_id: str
 
+class ScreenshotResponse(BaseModel):
+    status: str
+    screenshot: str  # base64 PNG
+
 class InstallRequest(BaseModel):
     app_ref: str
 
@@ -66,27 +90,185 @@ class SwipeRequest(BaseModel):
     x2: int
     y2: int
 
-# Emulator environment instance
-emulator_env = EmulatorEnv()
+# Stripped and checked non-empty by pydantic-core; a blank value fails as "string_too_short"
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+_non_empty_str = TypeAdapter(NonEmptyStr)
+
+def is_blank_error(e: ValidationError) -> bool:
+    return any(err["type"] == "string_too_short" for err in e.errors(include_url=False))
 
-def compute_sha256(file_path: str) -> str:
-    """Compute SHA256 checksum of a file."""
-    sha256 = hashlib.sha256()
+def non_empty(value: str, detail: str) -> str:
+    """Validate value as NonEmptyStr; a blank one is an HTTP 400 with detail (not FastAPI's 422)."""
+    try:
+        return _non_empty_str.validate_python(value)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail=detail)
+
+def json_body(model, blank_detail: Optional[str] = None):
+    """
+    Dependency that validates the raw request body with model.model_validate_json.
+    pydantic-core parses the JSON straight into the model, skipping the
+    json.loads -> dict -> validate round trip FastAPI does for BaseModel params.
+    Used on the high-rate control endpoints (tap/type/swipe) and /sandbox/run_file.
+    With blank_detail, a NonEmptyStr field that is blank gives HTTP 400 with that
+    detail instead of the usual 422.
+    """
+    async def dependency(request: Request):
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            if blank_detail is not None and is_blank_error(e):
+                raise HTTPException(status_code=400, detail=blank_detail)
+            # Same error shape as FastAPI's own body validation: loc starts with "body"
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+            )
+    return dependency
+
+def body_schema(model) -> dict:
+    """openapi_extra so json_body endpoints still document their request body."""
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": model.model_json_schema()}}}}
+
+# Fixed success bodies of the control endpoints, encoded once at import;
+# each call just wraps the bytes instead of building and encoding a dict
+_TAP_OK = orjson.dumps({"status":"ok","message":"Tap done"})
+_SWIPE_OK = orjson.dumps({"status":"ok","message":"Swipe done"})
+_BACK_OK = orjson.dumps({"status":"ok","message":"Back done"})
+_HOME_OK = orjson.dumps({"status":"ok","message":"Home done"})
+
+def json_bytes(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+def query_task_id(request: Request) -> str:
+    """
+    Read ?task_id= straight from the query string. /back and /home are plain
+    Starlette routes (router.add_route): with no body and a single parameter they
+    skip FastAPI's per-request dependency resolution and validation entirely.
+    They do not appear in the OpenAPI docs.
+    """
+    task_id = request.query_params.get("task_id")
+    if not task_id:
+        raise HTTPException(status_code=422, detail="Missing required query parameter: task_id")
+    return task_id
+
+# One EmulatorEnv per process, built on first use (or by the startup hook) so
+# importing this module does not load config.yaml
+_emulator_env = None
+_emulator_env_lock = threading.Lock()
+
+def get_emulator_env() -> EmulatorEnv:
+    global _emulator_env
+    if _emulator_env is None:
+        with _emulator_env_lock:
+            if _emulator_env is None:
+                _emulator_env = EmulatorEnv()
+    return _emulator_env
+
+def close_emulator_env() -> None:
+    """Close the persistent adb shells, if the environment was ever built (app shutdown)."""
+    if _emulator_env is not None:
+        _emulator_env.close_shells()
+
+# Dedicated pool for the interactive control endpoints
+EMULATOR_CONTROL_WORKERS = 8
+EMULATOR_EXECUTOR = ThreadPoolExecutor(max_workers=EMULATOR_CONTROL_WORKERS, thread_name_prefix="emulator")
+
+async def run_control(fn, *args, **kwargs):
+    """Run a blocking emulator_env call on EMULATOR_EXECUTOR and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EMULATOR_EXECUTOR, lambda: fn(*args, **kwargs))
+
+# Content hash used to deduplicate uploads. Only equality matters (no signatures),
+# so a fast hash is used: BLAKE3 (SIMD, multi-threaded over an mmap) when the
+# blake3 package is installed, otherwise hashlib's BLAKE2b. Stored values are
+# tagged "<algo>:<hex>" so a sidecar from the other algorithm is never compared.
+try:
+    import blake3
+    CONTENT_HASH_ALGO = "blake3"
+except ImportError:
+    blake3 = None
+    CONTENT_HASH_ALGO = "blake2b"
+
+def new_content_hasher():
+    """Incremental hasher for CONTENT_HASH_ALGO (used while streaming uploads)."""
+    if blake3 is not None:
+        return blake3.blake3()
+    return hashlib.blake2b(digest_size=32)
+
+def tag_content_hash(hex_digest: str) -> str:
+    return f"{CONTENT_HASH_ALGO}:{hex_digest}"
+
+def compute_content_hash(file_path: str) -> str:
+    """
+    Compute the tagged content hash of a file.
+    The file is memory-mapped either way: BLAKE3 hashes the mapping in parallel,
+    BLAKE2b takes it in a single update() call. The kernel pages the file in and
+    no read() buffers are copied through Python.
+    """
+    if blake3 is not None:
+        return tag_content_hash(blake3.blake3(max_threads=blake3.blake3.AUTO).update_mmap(file_path).hexdigest())
+    hasher = new_content_hasher()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256.update(chunk)
-    return sha256.hexdigest()
+        # mmap refuses zero-length files; their hash is the empty-input hash
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Sequential hint: read-ahead aggressively, pages can be dropped after use
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                hasher.update(mm)
+    return tag_content_hash(hasher.hexdigest())
+
+def store_upload(src, dest_path: str) -> str:
+    """
+    Copy the file object src to dest_path in UPLOAD_CHUNK_SIZE pieces and return
+    its tagged content hash, computed on the way so dest_path is never read back.
+    Blocking; upload_app runs it in a worker thread.
+    """
+    hasher = new_content_hasher()
+    with open(dest_path, "wb") as f_out:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            f_out.write(chunk)
+    return tag_content_hash(hasher.hexdigest())
+
+def checksum_sidecar_path(file_path: str) -> str:
+    return file_path + ".hash"
+
+def write_checksum_sidecar(file_path: str, checksum: str) -> None:
+    """Store checksum next to file_path (written to a temp name, then renamed into place)."""
+    sidecar = checksum_sidecar_path(file_path)
+    with open(sidecar + ".tmp", "w") as f:
+        f.write(checksum)
+    os.replace(sidecar + ".tmp", sidecar)
+
+def stored_content_hash(file_path: str) -> str:
+    """
+    Return the tagged content hash of an APK already in APKS_DIR.
+    Uses the .hash sidecar when it is at least as new as the APK and was made
+    with CONTENT_HASH_ALGO; otherwise hashes the file once and rewrites the sidecar.
+    """
+    sidecar = checksum_sidecar_path(file_path)
+    try:
+        if os.stat(sidecar).st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+            with open(sidecar) as f:
+                checksum = f.read().strip()
+            if checksum.startswith(CONTENT_HASH_ALGO + ":"):
+                return checksum
+    except OSError:
+        pass
+    checksum = compute_content_hash(file_path)
+    write_checksum_sidecar(file_path, checksum)
+    return checksum
 
 def get_host_port_from_task_id(task_id: str) -> str:
     """
-    Given a task_id, retrieve the host_port from emulator_env.task_map.
-    Raises 404 if not found.
+    Given a task_id, retrieve the host_port from get_emulator_env().task_map
+    (precomputed by run_app). Raises 404 if not found.
     """
-    if task_id not in emulator_env.task_map:
+    task = get_emulator_env().task_map.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail=f"No such task_id: {task_id}")
-    endpoint = emulator_env.task_map[task_id]["endpoint"]
-    host_port = endpoint.split("//")[-1]
-    return host_port
+    return task["host_port"]
 
 ###############################################################################
 # Endpoints
@@ -105,7 +287,7 @@ async def init_device():
     """
     try:
         logger.info("init_device: Initializing device.")
-        emulator_env.init_device()
+        await asyncio.to_thread(get_emulator_env().init_device)
         return {"status": "ok", "message": "Device initialized"}
     except Exception as e:
         logger.exception("init_device failed.")
@@ -117,6 +299,11 @@ async def upload_app(file: UploadFile = File(...)):
     POST /emulator/upload_app
 
     Upload an APK file into APKS_DIR.
+    The body is streamed to disk in UPLOAD_CHUNK_SIZE pieces and hashed on the
+    way (store_upload, in a worker thread so the event loop never blocks on disk
+    I/O), so memory use does not grow with the APK size and the file is not re-read.
+    The content hash is kept in a <name>.hash sidecar, so a re-upload with the same
+    name is compared without hashing the existing APK again.
 
     Example:
     curl -X POST -F file=@/path/to/app.apk http://localhost:8003/emulator/upload_app
@@ -126,27 +313,25 @@ async def upload_app(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="No filename provided.")
 
     local_path = os.path.join(APKS_DIR, filename)
+    # The temp file lives in APKS_DIR itself, so the final os.rename never
+    # crosses a filesystem (no EXDEV, no copy): it is an atomic metadata update.
     temp_path = local_path + ".tmp"
     try:
-        with open(temp_path, "wb") as f_out:
-            content = await file.read()
-            f_out.write(content)
+        new_checksum = await asyncio.to_thread(store_upload, file.file, temp_path)
     except Exception as e:
         logger.error(f"Failed to store uploaded file: {e}")
         raise HTTPException(status_code=500, detail="Failed to store uploaded file.")
 
-    new_checksum = compute_sha256(temp_path)
-
     if os.path.exists(local_path):
-        existing_checksum = compute_sha256(local_path)
+        existing_checksum = await asyncio.to_thread(stored_content_hash, local_path)
+        await asyncio.to_thread(os.remove, temp_path)
         if existing_checksum == new_checksum:
-            os.remove(temp_path)
             return {"status":"ok","filename":filename,"message":"File already exists"}
         else:
-            os.remove(temp_path)
             raise HTTPException(status_code=400, detail=f"Filename {filename} conflict with different file.")
     
-    os.rename(temp_path, local_path)
+    await asyncio.to_thread(os.rename, temp_path, local_path)
+    await asyncio.to_thread(write_checksum_sidecar, local_path, new_checksum)
     logger.info(f"Uploaded APK: {filename}")
     return {"status":"ok","filename":filename}
 
@@ -174,7 +359,7 @@ async def install_app(request: InstallRequest):
         raise HTTPException(status_code=400, detail=f"APK file not found: {local_path}")
 
     try:
-        emulator_env.install_app(local_path)
+        await asyncio.to_thread(get_emulator_env().install_app, local_path)
         return {"status":"ok","message":f"App {app_ref} installed."}
     except ConnectionError:
         raise HTTPException(status_code=503, detail="Emulator service unavailable.")
@@ -188,6 +373,8 @@ async def run_app_in_emulator(request: EmulatorRequest):
     POST /emulator/run_app
 
     Launch and run an app from a given APK file (installs if not installed).
+    With "inline_screenshot": false the response carries visuals.screenshot_url
+    instead of a base64 screenshot; GET it for the raw PNG.
 
     Example:
     curl -X POST -H "Content-Type: application/json" -d '{"app_ref":"app.apk"}' \
@@ -206,13 +393,16 @@ async def run_app_in_emulator(request: EmulatorRequest):
         raise HTTPException(status_code=400, detail=f"APK file not found: {local_path}")
 
     try:
-        result = emulator_env.run_app(local_path)
+        result = await asyncio.to_thread(get_emulator_env().run_app, local_path, inline_screenshot=request.inline_screenshot)
         visuals = result.get("visuals", {})
         events = result.get("events", [])
         task_id = result.get("task_id")
         if not task_id:
             raise HTTPException(status_code=500, detail="No task_id from run_app.")
-        return EmulatorResponse(status="success", visuals=visuals, events=events, task_id=task_id)
+        if not request.inline_screenshot:
+            visuals["screenshot_url"] = f"/emulator/screenshot.png?task_id={task_id}"
+        # trusted: internally generated, skip field validation
+        return EmulatorResponse.model_construct(status="success", visuals=visuals, events=events, task_id=task_id)
     except ConnectionError:
         raise HTTPException(status_code=503, detail="Emulator service unavailable.")
     except Exception as e:
@@ -230,7 +420,7 @@ async def get_vnc_url(task_id: str = Query(..., description="Task ID returned by
     curl "http://localhost:8003/emulator/get_vnc_url?task_id=YOUR_TASK_ID"
     """
     try:
-        vnc = emulator_env.get_vnc_url(task_id)
+        vnc = get_emulator_env().get_vnc_url(task_id)
         return {"status":"ok","vnc_url":vnc}
     except KeyError:
         raise HTTPException(status_code=404, detail=f"No such task_id: {task_id}")
@@ -238,8 +428,8 @@ async def get_vnc_url(task_id: str = Query(..., description="Task ID returned by
         logger.exception("Error getting VNC URL.")
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
-@router.post("/tap")
-async def tap_endpoint(request: TapRequest, task_id: str = Query(..., description="Task ID to identify which emulator to control")):
+@router.post("/tap", openapi_extra=body_schema(TapRequest))
+async def tap_endpoint(request: TapRequest = Depends(json_body(TapRequest)), task_id: str = Query(..., description="Task ID to identify which emulator to control")):
     """
     POST /emulator/tap?task_id=...
 
@@ -251,14 +441,14 @@ async def tap_endpoint(request: TapRequest, task_id: str = Query(..., descriptio
     """
     try:
         host_port = get_host_port_from_task_id(task_id)
-        emulator_env.control_app(host_port, "tap", x=request.x, y=request.y)
-        return {"status":"ok","message":"Tap done"}
+        await run_control(get_emulator_env().control_app, host_port, "tap", x=request.x, y=request.y)
+        return json_bytes(_TAP_OK)
     except Exception as e:
         logger.exception("Tap failed.")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/type")
-async def type_endpoint(request: TypeRequest, task_id: str = Query(..., description="Task ID")):
+@router.post("/type", openapi_extra=body_schema(TypeRequest))
+async def type_endpoint(request: TypeRequest = Depends(json_body(TypeRequest)), task_id: str = Query(..., description="Task ID")):
     """
     POST /emulator/type?task_id=...
 
@@ -270,14 +460,14 @@ async def type_endpoint(request: TypeRequest, task_id: str = Query(..., descript
     """
     try:
         host_port = get_host_port_from_task_id(task_id)
-        emulator_env.control_app(host_port, "type", text=request.text)
+        await run_control(get_emulator_env().control_app, host_port, "type", text=request.text)
         return {"status":"ok","message":f"Typed {request.text}"}
     except Exception as e:
         logger.exception("Type failed.")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/swipe")
-async def swipe_endpoint(request: SwipeRequest, task_id: str = Query(..., description="Task ID")):
+@router.post("/swipe", openapi_extra=body_schema(SwipeRequest))
+async def swipe_endpoint(request: SwipeRequest = Depends(json_body(SwipeRequest)), task_id: str = Query(..., description="Task ID")):
     """
     POST /emulator/swipe?task_id=...
 
@@ -290,14 +480,13 @@ async def swipe_endpoint(request: SwipeRequest, task_id: str = Query(..., descri
     """
     try:
         host_port = get_host_port_from_task_id(task_id)
-        emulator_env.control_app(host_port, "swipe", x1=request.x1, y1=request.y1, x2=request.x2, y2=request.y2)
-        return {"status":"ok","message":"Swipe done"}
+        await run_control(get_emulator_env().control_app, host_port, "swipe", x1=request.x1, y1=request.y1, x2=request.x2, y2=request.y2)
+        return json_bytes(_SWIPE_OK)
     except Exception as e:
         logger.exception("Swipe failed.")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/back")
-async def back_endpoint(task_id: str = Query(..., description="Task ID")):
+async def back_endpoint(request: Request):
     """
     POST /emulator/back?task_id=...
 
@@ -306,16 +495,18 @@ async def back_endpoint(task_id: str = Query(..., description="Task ID")):
     Example:
     curl -X POST "http://localhost:8003/emulator/back?task_id=YOUR_TASK_ID"
     """
+    task_id = query_task_id(request)
     try:
         host_port = get_host_port_from_task_id(task_id)
-        emulator_env.control_app(host_port, "back")
-        return {"status":"ok","message":"Back done"}
+        await run_control(get_emulator_env().control_app, host_port, "back")
+        return json_bytes(_BACK_OK)
     except Exception as e:
         logger.exception("Back failed.")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/home")
-async def home_endpoint(task_id: str = Query(..., description="Task ID")):
+router.add_route("/back", back_endpoint, methods=["POST"])
+
+async def home_endpoint(request: Request):
     """
     POST /emulator/home?task_id=...
 
@@ -324,32 +515,64 @@ async def home_endpoint(task_id: str = Query(..., description="Task ID")):
     Example:
     curl -X POST "http://localhost:8003/emulator/home?task_id=YOUR_TASK_ID"
     """
+    task_id = query_task_id(request)
     try:
         host_port = get_host_port_from_task_id(task_id)
-        emulator_env.control_app(host_port, "home")
-        return {"status":"ok","message":"Home done"}
+        await run_control(get_emulator_env().control_app, host_port, "home")
+        return json_bytes(_HOME_OK)
     except Exception as e:
         logger.exception("Home failed.")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/screenshot")
+router.add_route("/home", home_endpoint, methods=["POST"])
+
+@router.get("/screenshot", response_model=ScreenshotResponse)
 async def screenshot_endpoint(task_id: str = Query(..., description="Task ID")):
     """
     GET /emulator/screenshot?task_id=...
 
     Take a screenshot and return it as base64.
+    Prefer GET /emulator/screenshot.png for new callers: same image, raw bytes,
+    about 25% smaller and no base64 encode/decode on either side.
 
     Example:
     curl "http://localhost:8003/emulator/screenshot?task_id=YOUR_TASK_ID"
     """
     try:
         host_port = get_host_port_from_task_id(task_id)
-        b64_data = emulator_env.control_app(host_port, "screenshot")
-        return {"status":"ok","screenshot":b64_data}
+        b64_data = await run_control(get_emulator_env().control_app, host_port, "screenshot")
+        return ScreenshotResponse.model_construct(status="ok", screenshot=b64_data)
     except Exception as e:
         logger.exception("Screenshot failed.")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/screenshot.png")
+async def screenshot_png_endpoint(task_id: str = Query(..., description="Task ID")):
+    """
+    GET /emulator/screenshot.png?task_id=...
+
+    Take a screenshot and return the raw PNG bytes (no base64/JSON wrapping).
+
+    Example:
+    curl -o shot.png "http://localhost:8003/emulator/screenshot.png?task_id=YOUR_TASK_ID"
+    """
+    host_port = get_host_port_from_task_id(task_id)
+    try:
+        png_data = await run_control(get_emulator_env().capture_screenshot_png, host_port)
+        return Response(content=png_data, media_type="image/png", headers={"X-Status": "ok"})
+    except Exception as e:
+        logger.exception("Screenshot failed.")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{task_id}/screenshot")
+async def task_screenshot_endpoint(task_id: str):
+    """
+    GET /emulator/{task_id}/screenshot
+
+    Path-style alias of /emulator/screenshot.png: raw PNG bytes for the task's device.
+    """
+    return await screenshot_png_endpoint(task_id)
+
 ###############################################################################
 # Ready to Test
 #
@@ -25,16 +25,72 @@
 # - If checks become more complex (e.g., latency measurement), expand logic.
 ###############################################################################
 
+import asyncio
+import time
 from fastapi import APIRouter
 from pydantic import BaseModel
-import requests
+import httpx
 
 router = APIRouter()
 
+# Per-probe timeout; the three probes run concurrently, so /health takes ~1x this at worst
+PROBE_TIMEOUT = 2.0
+
+# Shared keep-alive client for the probes, created lazily inside the server's event loop.
+# Warm pooled connections let a probe cost one round trip instead of a new TCP handshake.
+PROBE_LIMITS = httpx.Limits(max_keepalive_connections=16, max_connections=32)
+_client = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=PROBE_TIMEOUT, limits=PROBE_LIMITS)
+    return _client
+
+async def close_client() -> None:
+    """Close the probe client's pooled connections (called on app shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 class HealthResponse(BaseModel):
     status: str
     details: dict
 
+# Last health result is reused for this many seconds, so frequent liveness
+# polls cost at most one round of probes per TTL
+HEALTH_CACHE_TTL = 2.0
+_health_cache = None  # (checked_at, HealthResponse)
+# Concurrent requests on a cache miss wait for one probe round instead of each probing
+_health_lock = asyncio.Lock()
+
+async def probe(method: str, url: str, **kwargs) -> str:
+    """Return "ok" on HTTP 200, otherwise an "error: ..." / "unreachable: ..." string."""
+    try:
+        r = await get_client().request(method, url, **kwargs)
+        if r.status_code == 200:
+            return "ok"
+        return f"error: got {r.status_code}"
+    except Exception as e:
+        return f"unreachable: {e}"
+
+async def probe_llm() -> str:
+    # Suppose LLM endpoint from config or known default (like http://localhost:11434)
+    llm_endpoint = "http://localhost:11434/api/generate"  # Hypothetical endpoint to test LLM quickly
+    return await probe("POST", llm_endpoint, json={"model":"llama3.2","prompt":"hello","stream":False})
+
+async def probe_sandbox() -> str:
+    # Suppose we read one endpoint from config.yaml or instances.json
+    # For simplicity, hardcode a test endpoint. In practice, parse instances.json.
+    sandbox_endpoint = "http://sandbox1:8002/ping"  # Hypothetical ping endpoint
+    return await probe("GET", sandbox_endpoint)
+
+async def probe_emulator() -> str:
+    # Similarly, pick a known emulator endpoint from instances.json or config.
+    emulator_endpoint = "http://emulator1:5555/ping"  # Hypothetical ping endpoint
+    return await probe("GET", emulator_endpoint)
+
 @router.get("/", response_model=HealthResponse)
 async def health_check():
     """
@@ -47,7 +103,8 @@ async def health_check():
     - Emulator: Check if at least one emulator endpoint is reachable.
 
     Steps:
-    1. Attempt a minimal GET request to each component's known endpoint.
+    0. Return the cached result if it is younger than HEALTH_CACHE_TTL.
+    1. Probe each component's known endpoint concurrently (asyncio.gather).
     2. If all respond positively, overall status = "ok".
     3. If some fail, overall status = "degraded".
     4. If all fail or a critical issue occurs, overall status = "down".
@@ -57,56 +114,24 @@ async def health_check():
     This is a simplified logic. Real checks might be more sophisticated or read 
     from `instances.json` and `config.yaml` to find endpoints.
     """
-
-    # Default assumptions
-    llm_status = "unknown"
-    sandbox_status = "unknown"
-    emulator_status = "unknown"
+    global _health_cache
+    if _health_cache and time.monotonic() - _health_cache[0] < HEALTH_CACHE_TTL:
+        return _health_cache[1]
+    async with _health_lock:
+        # Another request may have refreshed the cache while we waited
+        if _health_cache and time.monotonic() - _health_cache[0] < HEALTH_CACHE_TTL:
+            return _health_cache[1]
+        _health_cache = (time.monotonic(), await check_components())
+        return _health_cache[1]
+
+async def check_components() -> HealthResponse:
+    """Run the three probes concurrently and derive the overall status."""
+    llm_status, sandbox_status, emulator_status = await asyncio.gather(
+        probe_llm(), probe_sandbox(), probe_emulator()
+    )
 
     overall_status = "ok"  # assume ok, then downgrade if issues found
-
-    # Example checks:
-    # LLM check:
-    # Suppose LLM endpoint from config or known default (like http://localhost:11434)
-    llm_endpoint = "http://localhost:11434/api/generate"  # Hypothetical endpoint to test LLM quickly
-    try:
-        r = requests.post(llm_endpoint, json={"model":"llama3.2","prompt":"hello","stream":False}, timeout=2)
-        if r.status_code == 200:
-            llm_status = "ok"
-        else:
-            llm_status = f"error: got {r.status_code}"
-            overall_status = "degraded"
-    except Exception as e:
-        llm_status = f"unreachable: {e}"
-        overall_status = "degraded"
-
-    # Sandbox check:
-    # Suppose we read one endpoint from config.yaml or instances.json
-    # For simplicity, hardcode a test endpoint. In practice, parse instances.json.
-    sandbox_endpoint = "http://sandbox1:8002/ping"  # Hypothetical ping endpoint
-    try:
-        r = requests.get(sandbox_endpoint, timeout=2)
-        if r.status_code == 200:
-            sandbox_status = "ok"
-        else:
-            sandbox_status = f"error: got {r.status_code}"
-            overall_status = "degraded"
-    except Exception as e:
-        sandbox_status = f"unreachable: {e}"
-        overall_status = "degraded"
-
-    # Emulator check:
-    # Similarly, pick a known emulator endpoint from instances.json or config.
-    emulator_endpoint = "http://emulator1:5555/ping"  # Hypothetical ping endpoint
-    try:
-        r = requests.get(emulator_endpoint, timeout=2)
-        if r.status_code == 200:
-            emulator_status = "ok"
-        else:
-            emulator_status = f"error: got {r.status_code}"
-            overall_status = "degraded"
-    except Exception as e:
-        emulator_status = f"unreachable: {e}"
+    if any(s != "ok" for s in (llm_status, sandbox_status, emulator_status)):
         overall_status = "degraded"
 
     details = {
@@ -119,12 +144,14 @@ async def health_check():
     if all(s not in ["ok"] for s in details.values()):
         overall_status = "down"
 
-    return HealthResponse(status=overall_status, details=details)
+    # trusted: internally generated, skip field validation
+    return HealthResponse.model_construct(status=overall_status, details=details)
 
 ###############################################################################
 # Explanation:
 #
-# - health_check(): attempts to contact LLM, Sandbox, and Emulator endpoints.
+# - health_check(): probes LLM, Sandbox, and Emulator endpoints concurrently
+#   through one shared httpx.AsyncClient.
 # - If all ok: overall status = ok.
 # - If one or more degraded: overall status = degraded.
 # - If all fail: overall status = down.
@@ -135,5 +162,5 @@ async def health_check():
 # Future Enhancements:
 # - Read actual endpoints from config.yaml or instances.json.
 # - Implement a dedicated "ping" route in each service for consistent checks.
-# - Add retries or caching results to avoid slow responses.
+# - Add retries to probes that fail transiently.
 ###############################################################################
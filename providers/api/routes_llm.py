@@ -5,6 +5,8 @@
 # Provides FastAPI routes for LLM-related operations. Now we have two endpoints:
 # 1. POST /llm/chat_complete: For text-based chat completions using the chat model (llama3.1 (8b)).
 # 2. POST /llm/vision: For vision-based reasoning with images using the vision model (llama3.2-vision (11b)).
+# 3. POST /llm/vision_raw: Same as /llm/vision, but images are multipart file uploads
+#    (raw bytes, no base64-in-JSON on the wire).
 #
 # Key Changes:
 # - Added a VisionLLMRequest model and a new endpoint for `/llm/vision`.
@@ -14,6 +16,7 @@
 # - Users can call:
 #   curl -X POST -H "Content-Type: application/json" -d '{"prompt":"Hello"}' http://localhost:8000/llm/chat_complete
 #   curl -X POST -H "Content-Type: application/json" -d '{"prompt":"What is in this image?","images":["<base64>"]}' http://localhost:8000/llm/vision
+#   curl -X POST -F prompt="What is in this image?" -F images=@shot.png http://localhost:8000/llm/vision_raw
 #
 # Integration:
 # - Uses LLMClient from llm_client.py
@@ -30,9 +33,10 @@
 #
 ###############################################################################
 
-from fastapi import APIRouter, HTTPException
+import threading
+from fastapi import APIRouter, HTTPException, File, Form, UploadFile
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 from core.llm_client import LLMClient, LLMConnectionError, LLMResponseError
 
 import logging
@@ -40,11 +44,27 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# One LLMClient per process (config is read once, not on every request);
+# built on first use so importing this module does not load config.yaml
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
+
 ###############################################################################
 # Request/Response Models
 #
 # LLMRequest for chat completion:
 # - prompt: str (required)
+# - json_mode: bool (optional) -> use interpret_chat_json (stops at the end of the JSON object)
+# - subject / subject_kind (optional) -> the URL or message being judged; lets
+#   near-identical subjects share an answer via the semantic cache tier
 #
 # VisionLLMRequest for vision tasks:
 # - prompt: str (required)
@@ -57,6 +77,9 @@ router = APIRouter()
 
 class LLMRequest(BaseModel):
     prompt: str = Field(..., description="Text prompt for chat completion")
+    json_mode: bool = Field(False, description="Stream in JSON mode and return only the first JSON object")
+    subject: Optional[str] = Field(None, description="Text being judged (URL or message); enables the semantic cache")
+    subject_kind: Optional[Literal["url", "message"]] = Field(None, description="Kind of subject, selects the similarity threshold")
 
 class VisionLLMRequest(BaseModel):
     prompt: str = Field(..., description="Text prompt guiding the vision reasoning")
@@ -74,8 +97,9 @@ class LLMResponse(BaseModel):
 #
 # Steps:
 # 1. Validate prompt.
-# 2. client = LLMClient()
+# 2. client = get_llm_client()
 # 3. result = client.interpret_chat(prompt)
+#    (or client.interpret_chat_json(prompt) when json_mode is set)
 # 4. Return {"status":"success","response":result}
 #
 # Errors:
@@ -84,18 +108,27 @@ class LLMResponse(BaseModel):
 # - 500 if LLM invalid response
 ###############################################################################
 
+# Plain def: interpret_* block on HTTP, so run in FastAPI's threadpool rather than
+# on the event loop; this also lets identical concurrent prompts coalesce.
 @router.post("/chat_complete", response_model=LLMResponse)
-async def llm_chat_complete(request: LLMRequest):
+def llm_chat_complete(request: LLMRequest):
     prompt = request.prompt.strip()
     logger.info(f"Received chat completion request with prompt: {prompt}")
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt must not be empty.")
 
-    client = LLMClient()
+    client = get_llm_client()
     try:
-        logger.info(f"Calling interpret_chat with prompt: {prompt}")
-        llm_result = client.interpret_chat(prompt)
-        return LLMResponse(status="success", response=llm_result)
+        if request.json_mode:
+            logger.info(f"Calling interpret_chat_json with prompt: {prompt}")
+            llm_result = client.interpret_chat_json(prompt, subject=request.subject,
+                                                     subject_kind=request.subject_kind)
+        else:
+            logger.info(f"Calling interpret_chat with prompt: {prompt}")
+            llm_result = client.interpret_chat(prompt, subject=request.subject,
+                                               subject_kind=request.subject_kind)
+        # trusted: internally generated, skip field validation
+        return LLMResponse.model_construct(status="success", response=llm_result)
     except LLMConnectionError as e:
         raise HTTPException(status_code=503, detail=f"LLM service unavailable: {e}")
     except LLMResponseError as e:
@@ -113,7 +146,7 @@ async def llm_chat_complete(request: LLMRequest):
 #
 # Steps:
 # 1. Validate prompt and images (non-empty).
-# 2. client = LLMClient()
+# 2. client = get_llm_client()
 # 3. result = client.interpret_vision(prompt, images)
 # 4. Return {"status":"success","response":result}
 #
@@ -123,8 +156,10 @@ async def llm_chat_complete(request: LLMRequest):
 # - 500 if invalid LLM response
 ###############################################################################
 
+# Plain def: interpret_* block on HTTP, so run in FastAPI's threadpool rather than
+# on the event loop; this also lets identical concurrent prompts coalesce.
 @router.post("/vision", response_model=LLMResponse)
-async def llm_vision(request: VisionLLMRequest):
+def llm_vision(request: VisionLLMRequest):
     prompt = request.prompt.strip()
     logger.info(f"Received vision request with prompt: {prompt}")
     if not prompt:
@@ -132,11 +167,56 @@ async def llm_vision(request: VisionLLMRequest):
     if not request.images or any(not img.strip() for img in request.images):
         raise HTTPException(status_code=400, detail="Must provide at least one valid base64 image.")
 
-    client = LLMClient()
+    client = get_llm_client()
     try:
         logger.info(f"Calling interpret_vision with prompt: {prompt} and images: {request.images}")
         llm_result = client.interpret_vision(prompt, request.images)
-        return LLMResponse(status="success", response=llm_result)
+        # trusted: internally generated, skip field validation
+        return LLMResponse.model_construct(status="success", response=llm_result)
+    except LLMConnectionError as e:
+        raise HTTPException(status_code=503, detail=f"LLM service unreachable: {e}")
+    except LLMResponseError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid LLM response: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected server error: {e}")
+
+###############################################################################
+# Endpoint: POST /llm/vision_raw
+#
+# Purpose:
+# Like /llm/vision, but takes the images as multipart/form-data uploads. The
+# client skips base64 (+33% payload) and the server skips carrying a huge JSON
+# string through validation; bytes are base64-encoded once in interpret_vision_bytes.
+#
+# Steps:
+# 1. Validate prompt (form field) and images (one or more file parts).
+# 2. Read each upload's bytes.
+# 3. result = client.interpret_vision_bytes(prompt, images)
+# 4. Return {"status":"success","response":result}
+#
+# Errors: same as /llm/vision.
+###############################################################################
+
+@router.post("/vision_raw", response_model=LLMResponse)
+def llm_vision_raw(prompt: str = Form(..., description="Text prompt guiding the vision reasoning"),
+                   images: List[UploadFile] = File(..., description="One or more image files")):
+    prompt = prompt.strip()
+    logger.info(f"Received raw vision request with prompt: {prompt} and {len(images)} image(s)")
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Prompt must not be empty.")
+
+    # Plain def, so the blocking reads of the spooled uploads stay off the event loop
+    image_bytes = [img.file.read() for img in images]
+    if not image_bytes or any(not data for data in image_bytes):
+        raise HTTPException(status_code=400, detail="Must provide at least one non-empty image.")
+
+    client = get_llm_client()
+    try:
+        llm_result = client.interpret_vision_bytes(prompt, image_bytes)
+        # trusted: internally generated, skip field validation
+        return LLMResponse.model_construct(status="success", response=llm_result)
     except LLMConnectionError as e:
         raise HTTPException(status_code=503, detail=f"LLM service unreachable: {e}")
     except LLMResponseError as e:
@@ -152,6 +232,7 @@ async def llm_vision(request: VisionLLMRequest):
 # We have now two endpoints:
 # - /llm/chat_complete: For text chat completion (8b model).
 # - /llm/vision: For vision reasoning (11b model + images).
+# - /llm/vision_raw: Vision reasoning with images uploaded as files.
 #
 # Both use LLMClient methods interpret_chat and interpret_vision, ensuring we pick 
 # the correct sized model as configured in config.yaml.
@@ -24,24 +24,56 @@
 # - If multiple sandbox instances exist, sandbox_env.py chooses which one to use.
 ###############################################################################
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import threading
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from core.sandbox_env import SandboxEnv
+from api.routes_emulator import NonEmptyStr, body_schema, json_body
 
 router = APIRouter()
 
 class SandboxRequest(BaseModel):
-    file_ref: str  # a reference (path or ID) to the suspicious file
+    # a reference (path or ID) to the suspicious file; stripped by pydantic-core,
+    # and a blank one is rejected with 400 (see json_body's blank_detail)
+    file_ref: NonEmptyStr
 
+# Documents the 200 body in OpenAPI only; the handler returns the dict directly
+# (no response_model), so responses are not re-validated on the way out.
 class SandboxResponse(BaseModel):
     status: str
     logs: list[str]  # List of strings representing sandbox analysis logs (syscalls, etc.)
 
-# Initialize sandbox environment handler
-sandbox_env = SandboxEnv()
+# One SandboxEnv per process, built on first use (or by the startup hook) so
+# importing this module does not load config.yaml
+_sandbox_env = None
+_sandbox_env_lock = threading.Lock()
 
-@router.post("/run_file", response_model=SandboxResponse)
-async def run_file_in_sandbox(request: SandboxRequest):
+def get_sandbox_env() -> SandboxEnv:
+    global _sandbox_env
+    if _sandbox_env is None:
+        with _sandbox_env_lock:
+            if _sandbox_env is None:
+                _sandbox_env = SandboxEnv()
+    return _sandbox_env
+
+# Log lines per chunk of the ?stream=true NDJSON body: large enough that each chunk is
+# one socket write, small enough that a huge log is never encoded as a single string
+SANDBOX_STREAM_BATCH = 512
+
+def iter_ndjson_logs(logs: list):
+    """Yield NDJSON chunks ({"log": "..."} per line) of SANDBOX_STREAM_BATCH lines each."""
+    for i in range(0, len(logs), SANDBOX_STREAM_BATCH):
+        yield b"".join(orjson.dumps({"log": line}) + b"\n" for line in logs[i:i + SANDBOX_STREAM_BATCH])
+
+@router.post("/run_file", responses={200: {"model": SandboxResponse}},
+             openapi_extra=body_schema(SandboxRequest))
+async def run_file_in_sandbox(
+    request: SandboxRequest = Depends(json_body(SandboxRequest, blank_detail="file_ref must not be empty.")),
+    stream: bool = Query(False, description="Return logs as NDJSON lines instead of one JSON object"),
+):
     """
     POST /sandbox/run_file
 
@@ -49,9 +81,10 @@ async def run_file_in_sandbox(request: SandboxRequest):
     Submit a suspicious file reference to the sandbox for analysis.
 
     Steps:
-    1. Validate 'file_ref'.
+    1. 'file_ref' arrives stripped; a blank one was already rejected with 400.
     2. Call sandbox_env.run_file(file_ref) to get logs.
-    3. Return {"status":"success","logs":[...]} on success.
+    3. Return {"status":"success","logs":[...]} on success, or with ?stream=true an
+       application/x-ndjson body of {"log": "..."} lines the client can parse incrementally.
     4. On sandbox errors (timeout, unreachable), return appropriate HTTPException.
 
     Error Cases:
@@ -59,14 +92,15 @@ async def run_file_in_sandbox(request: SandboxRequest):
     - If sandbox unreachable: HTTP 503
     - If logs returned are empty or suspicious: still status=success but logs might indicate no activity.
     """
-    file_ref = request.file_ref.strip()
-    if not file_ref:
-        raise HTTPException(status_code=400, detail="file_ref must not be empty.")
+    file_ref = request.file_ref
 
     try:
-        logs = sandbox_env.run_file(file_ref)  
+        # run_file blocks on HTTP (and may provision a sandbox); keep it off the event loop
+        logs = await asyncio.to_thread(get_sandbox_env().run_file, file_ref)
         # run_file might return a list of log lines or raise exceptions.
-        return SandboxResponse(status="success", logs=logs)
+        if stream:
+            return StreamingResponse(iter_ndjson_logs(logs), media_type="application/x-ndjson")
+        return Response(orjson.dumps({"status": "success", "logs": logs}), media_type="application/json")
     except ConnectionError:
         # Sandbox service unreachable
         raise HTTPException(status_code=503, detail="Sandbox service unavailable.")
@@ -82,7 +116,7 @@ async def run_file_in_sandbox(request: SandboxRequest):
 #
 # - SandboxRequest: Client provides file_ref (string).
 # - run_file_in_sandbox: Validates input, calls sandbox_env's run_file method.
-# - On success: returns status=success and logs array.
+# - On success: returns status=success and logs array (or NDJSON lines with ?stream=true).
 # - On errors: raises HTTPExceptions with relevant status codes.
 #
 # If sandbox_env chooses which sandbox instance to use, it handles that logic internally.
@@ -23,22 +23,24 @@
 # - If we store task_id→emulator mappings in a DB or in-memory store, adjust code.
 ###############################################################################
 
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import Optional
-# Assuming emulator_env provides a method to map task_id to vnc url or host/port
-from core.emulator_env import EmulatorEnv
+# The emulator routes' EmulatorEnv owns the task_id -> emulator map (with each
+# task's precomputed vnc_url), so it is shared here rather than instantiated again
+from api.routes_emulator import get_emulator_env, non_empty
 
 router = APIRouter()
 
+# Documents the 200 body in OpenAPI only; the handler returns the dict directly
+# (no response_model), so responses are not re-validated on the way out.
 class VNCResponse(BaseModel):
     status: str
     vnc_url: Optional[str]
 
-# Initialize emulator environment handler
-emulator_env = EmulatorEnv()
-
-@router.get("/{task_id}/vnc", response_model=VNCResponse)
+@router.get("/{task_id}/vnc", responses={200: {"model": VNCResponse}})
 async def get_vnc_url_for_task(task_id: str):
     """
     GET /{task_id}/vnc
@@ -48,7 +50,7 @@ async def get_vnc_url_for_task(task_id: str):
     return a VNC URL or instructions to connect to the emulator screen.
 
     Steps:
-    1. Validate task_id.
+    1. Validate task_id (NonEmptyStr: stripped, 400 if blank).
     2. Use emulator_env to find which emulator instance is associated with this task_id.
     3. Construct a VNC URL from host/port info in instances.json or config.yaml.
     4. Return {"status":"success", "vnc_url":"vnc://..."} on success.
@@ -57,17 +59,15 @@ async def get_vnc_url_for_task(task_id: str):
     - If task_id not found or not associated with any emulator instance: 404.
     - If emulator unreachable or no VNC info: 503 or 500 depending on error type.
     """
-    task_id = task_id.strip()
-    if not task_id:
-        raise HTTPException(status_code=400, detail="task_id must not be empty.")
+    task_id = non_empty(task_id, "task_id must not be empty.")
 
     try:
-        vnc_url = emulator_env.get_vnc_url(task_id)
+        vnc_url = get_emulator_env().get_vnc_url(task_id)
         # get_vnc_url might return a string like "vnc://emulator1:5900" or raise exceptions.
         if not vnc_url:
             # If no URL returned, maybe task_id not found
             raise HTTPException(status_code=404, detail=f"No VNC info for task_id {task_id}")
-        return VNCResponse(status="success", vnc_url=vnc_url)
+        return Response(orjson.dumps({"status": "success", "vnc_url": vnc_url}), media_type="application/json")
     except KeyError:
         # If emulator_env says no such task_id mapped
         raise HTTPException(status_code=404, detail=f"task_id {task_id} not found.")
@@ -80,7 +80,7 @@ async def get_vnc_url_for_task(task_id: str):
 ###############################################################################
 # Explanation:
 #
-# - We assume emulator_env.get_vnc_url(task_id) provides the correct VNC URL.
+# - emulator_env.get_vnc_url(task_id) is a dict lookup: run_app stores each task's VNC URL.
 # - If not found, return 404.
 # - If unavailable, 503 or 500 depending on error cause.
 #
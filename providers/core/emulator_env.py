@@ -1,11 +1,20 @@
 import os
-import json
 import uuid
-import random
+import re
+import select
+import shlex
+import shutil
+import string
 import subprocess
+import threading
 import time
-import base64
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# SIMD-accelerated, drop-in compatible b64encode for the inline screenshot paths
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+from typing import Dict, Any, Optional, Tuple
 
 import logging
 logger = logging.getLogger(__name__)
@@ -13,6 +22,24 @@ logger = logging.getLogger(__name__)
 from utils import config_loader
 from core import provisioner
 
+# init_device polls `adb connect` on every new endpoint at once, for at most this long,
+# instead of sleeping a fixed 20 s before trying a single one
+BOOT_WAIT_TIMEOUT = 30.0
+BOOT_POLL_INTERVAL = 1.0
+CONNECT_TIMEOUT = 5
+
+# Marker echoed after every command on a persistent adb shell; the digits after it are $?
+ADB_SHELL_SENTINEL = "__WOPA_END__"
+_SENTINEL_RE = re.compile(rb"__WOPA_END__(\d+)\r?\n")
+
+# `aapt dump badging` line carrying the APK's package name: package: name='com.x.y' ...
+_BADGING_PACKAGE_RE = re.compile(r"^package: name='([^']+)'", re.MULTILINE)
+
+# Characters `input text` accepts verbatim (space is sent as %s), so they can share a batch.
+# A frozenset makes the common ASCII case one hash lookup; other alphanumerics still
+# pass through str.isalnum() as before.
+TYPE_PLAIN_CHARS = frozenset(string.ascii_letters + string.digits + ' -.,!?@\'°/:;()')
+
 class EmulatorConnectionError(Exception):
     pass
 
@@ -37,19 +64,42 @@ class EmulatorEnv:
 
         self.endpoints = []
         self.task_map: Dict[str, Dict[str,Any]] = {}
-        self.app_package_cache: Dict[str, str] = {}  # Maps app_ref to pkg_name
-
-    def _run_adb_command(self, cmd_list, timeout=None, check=True, retries=3, delay=5):
+        # Maps (host_port, app_ref) to pkg_name: an app is only installed on the device it was sent to
+        self.app_package_cache: Dict[Tuple[str, str], str] = {}
+        # Round-robin cursor over self.endpoints, so load spreads evenly instead of randomly
+        self._rr_index = 0
+        self._rr_lock = threading.Lock()
+
+        # One long-lived `adb -s <host_port> shell` per device; commands are written to
+        # its stdin, so `adb ... shell X` calls skip the adb fork/exec and transport setup.
+        self._shells: Dict[str, subprocess.Popen] = {}
+        self._shell_locks: Dict[str, threading.Lock] = {}
+        self._shells_guard = threading.Lock()
+
+    def _run_adb_command(self, cmd_list, timeout=None, check=True, retries=3, delay=5, text=True):
         """
         Run an adb command with optional retries.
         Logs output and errors.
+        With text=False the output is returned as raw bytes (no UTF-8 decode pass),
+        for large listings that are only split and searched.
         """
         for attempt in range(retries):
             logger.debug(f"Running ADB command (attempt {attempt+1}/{retries}): {' '.join(cmd_list)}")
             try:
-                result = subprocess.run(cmd_list, capture_output=True, text=True, timeout=timeout or self.timeout, check=check)
-                logger.debug(f"ADB command output: {result.stdout.strip()}")
-                return result.stdout.strip()
+                if len(cmd_list) > 4 and cmd_list[0] == "adb" and cmd_list[1] == "-s" and cmd_list[3] == "shell":
+                    # adb joins shell arguments with spaces before the device shell parses them
+                    returncode, out = self._run_adb_shell(cmd_list[2], " ".join(cmd_list[4:]), timeout or self.timeout)
+                    if returncode is not None:
+                        if text:
+                            out = out.decode(errors="replace")
+                        logger.debug("ADB shell output: %s", out)
+                        if check and returncode != 0:
+                            raise subprocess.CalledProcessError(returncode, cmd_list, output=out, stderr=out)
+                        return out
+                result = subprocess.run(cmd_list, capture_output=True, text=text, timeout=timeout or self.timeout, check=check)
+                out = result.stdout.strip()
+                logger.debug("ADB command output: %s", out)
+                return out
             except subprocess.CalledProcessError as e:
                 logger.warning(f"ADB command failed (attempt {attempt+1}): {e.stderr}")
                 if attempt == retries - 1 and check:
@@ -62,15 +112,92 @@ class EmulatorEnv:
                 time.sleep(delay)
         raise EmulatorConnectionError("ADB command failed after all retries")
 
+    def _run_adb_shell(self, host_port: str, cmd_str: str, timeout: float):
+        """
+        Run cmd_str on host_port's persistent shell and return (exit_code, output bytes).
+        Output is read up to ADB_SHELL_SENTINEL. Returns (None, b"") if the shell
+        could not be started or died, so the caller falls back to a one-shot adb.
+        On timeout the shell is killed and subprocess.TimeoutExpired is raised.
+        """
+        with self._shells_guard:
+            lock = self._shell_locks.setdefault(host_port, threading.Lock())
+        with lock:
+            proc = self._shells.get(host_port)
+            if proc is None or proc.poll() is not None:
+                try:
+                    proc = subprocess.Popen(["adb", "-s", host_port, "shell"], stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+                except OSError as e:
+                    logger.warning(f"Cannot start persistent adb shell for {host_port}: {e}")
+                    return None, b""
+                self._shells[host_port] = proc
+            try:
+                # stdin is detached so the command can't swallow the sentinel line
+                proc.stdin.write(f"{{ {cmd_str}\n}} </dev/null; echo {ADB_SHELL_SENTINEL}$?\n".encode())
+            except OSError:
+                self._close_shell(host_port)
+                return None, b""
+            fd = proc.stdout.fileno()
+            buf = b""
+            deadline = time.monotonic() + timeout
+            while True:
+                m = _SENTINEL_RE.search(buf)
+                if m:
+                    return int(m.group(1)), buf[:m.start()].strip()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._close_shell(host_port)
+                    raise subprocess.TimeoutExpired(["adb", "-s", host_port, "shell", cmd_str], timeout)
+                ready, _, _ = select.select([fd], [], [], remaining)
+                if ready:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        # Shell exited (device gone, adb server restarted); let the caller retry one-shot
+                        self._close_shell(host_port)
+                        return None, b""
+                    buf += chunk
+
+    def _close_shell(self, host_port: str):
+        proc = self._shells.pop(host_port, None)
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def close_shells(self):
+        """Terminate all persistent adb shells (called on app shutdown)."""
+        for host_port in list(self._shells):
+            self._close_shell(host_port)
+
+    def _run_adb_shell_batch(self, host_port: str, shell_cmds: list, check=True):
+        """
+        Run several device shell commands through one `adb shell` call.
+        Each command is shell-quoted and joined with ';', so N inputs cost one
+        write to the device's persistent shell instead of N.
+        """
+        script = "; ".join(shlex.join(c) for c in shell_cmds)
+        return self._run_adb_command(["adb", "-s", host_port, "shell", script], check=check)
+
+    def _next_endpoint(self) -> str:
+        """Next endpoint in round-robin order (tolerates self.endpoints being replaced)."""
+        with self._rr_lock:
+            endpoint = self.endpoints[self._rr_index % len(self.endpoints)]
+            self._rr_index += 1
+        return endpoint
+
+    def _endpoint_for_app(self, app_ref: str) -> str:
+        """Endpoint that already has app_ref installed, else the next one in rotation."""
+        for endpoint in self.endpoints:
+            if (endpoint.split("//")[-1], app_ref) in self.app_package_cache:
+                return endpoint
+        return self._next_endpoint()
+
     def _reload_endpoints(self):
         """
         Reload endpoints from instances.json after provisioning.
         """
-        instances_path = "instances.json"
-        if os.path.exists(instances_path):
-            with open(instances_path, "r") as f:
-                instances_data = json.load(f)
-                self.endpoints = instances_data.get("emulator", [])
+        instances_data = config_loader.load_instances("instances.json")
+        if instances_data:
+            self.endpoints = instances_data.get("emulator", [])
         if not self.endpoints:
             raise ValueError("No emulator endpoints available after provisioning.")
 
@@ -94,14 +221,32 @@ class EmulatorEnv:
         raise EmulatorConnectionError("Device not booted after waiting.")
 
     def _get_installed_packages(self, host_port: str) -> list:
+        """Raw `pm list packages -f` lines as bytes; only the new package name is ever decoded."""
         cmd = ["adb", "-s", host_port, "shell", "pm", "list", "packages", "-f"]
-        output = self._run_adb_command(cmd, check=True)
+        output = self._run_adb_command(cmd, check=True, text=False)
         return output.splitlines()
 
+    def _package_from_apk(self, apk_path: str) -> Optional[str]:
+        """
+        Read the package name straight from the APK with `aapt dump badging` (local,
+        no device round trips). Returns None if aapt is not installed or fails.
+        """
+        aapt = shutil.which("aapt")
+        if aapt is None:
+            return None
+        try:
+            res = subprocess.run([aapt, "dump", "badging", apk_path], capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"aapt failed on {apk_path}: {e}")
+            return None
+        m = _BADGING_PACKAGE_RE.search(res.stdout)
+        return m.group(1) if m else None
+
     def _detect_new_package(self, before_list: list, after_list: list) -> str:
         """
-        Given the packages before and after installation,
-        detect which package line is newly added and extract the package name.
+        Given the packages before and after installation (byte lines from
+        _get_installed_packages), detect which package line is newly added and
+        extract the package name.
 
         Strategy:
         - `pm list packages -f` lines often look like:
@@ -110,26 +255,26 @@ class EmulatorEnv:
         reliably marks where the package name begins.
         - We'll find the substring 'base.apk=' and take everything after it as the package name.
         """
-        before_set = set(before_list)
-        after_set = set(after_list)
-        new_lines = after_set - before_set
-        if not new_lines:
+        # One set over the old listing, then stop at the first line not in it
+        before_set = frozenset(before_list)
+        new_line = next((line for line in after_list if line not in before_set), None)
+        if new_line is None:
             logger.error("No new package found after installation.")
             raise ValueError("Failed to detect newly installed package. No new packages found.")
 
         # We assume one new package line
-        new_line = new_lines.pop().strip()
+        new_line = new_line.strip()
         logger.debug(f"New package line detected: {new_line}")
 
         # Locate 'base.apk=' in the line
-        marker = 'base.apk='
+        marker = b'base.apk='
         idx = new_line.find(marker)
         if idx == -1:
             logger.error(f"Cannot find 'base.apk=' in package line: {new_line}")
             raise ValueError("Cannot parse package name, 'base.apk=' not found.")
 
         # Extract the package name after 'base.apk='
-        pkg_name = new_line[idx + len(marker):].strip()
+        pkg_name = new_line[idx + len(marker):].strip().decode(errors="replace")
         if not pkg_name:
             logger.error(f"Empty package name after parsing line: {new_line}")
             raise ValueError("Package name is empty after parsing.")
@@ -165,17 +310,23 @@ class EmulatorEnv:
             os.remove(instances_path)
 
         self.app_package_cache = {}
+        # Tasks (and their stored vnc_url) point at the emulators being replaced
+        self.task_map = {}
+        # So do the persistent adb shells; don't leak them across re-provisioning
+        self.close_shells()
 
         logger.info("Provisioning new emulator(s) via Terraform...")
         provisioner.provision_emulators()
-        time.sleep(20)  # Wait a bit for containers to come up
         self._reload_endpoints()
 
         if not self.endpoints:
             raise EmulatorConnectionError("No emulator endpoints after provisioning.")
 
-        # Choose an endpoint and wait for device to be ready
-        endpoint = random.choice(self.endpoints)
+        # Use whichever endpoint accepts `adb connect` first
+        endpoint = self._connect_first_ready()
+        if endpoint is None:
+            logger.warning(f"No emulator accepted adb connect within {BOOT_WAIT_TIMEOUT}s, picking the next in rotation.")
+            endpoint = self._next_endpoint()
         host_port = endpoint.split("//")[-1]
         # self._wait_for_device(host_port)
 
@@ -192,6 +343,34 @@ class EmulatorEnv:
         logger.info(f"ADB connect result: {connect_res}")
         logger.info(f"init_device: Device {host_port} is ready.")
 
+    def _try_connect(self, endpoint: str) -> bool:
+        """One `adb connect` attempt; True if adb reports the device connected."""
+        host_port = endpoint.split("//")[-1]
+        try:
+            res = self._run_adb_command(["adb", "connect", host_port], timeout=CONNECT_TIMEOUT, check=False, retries=1)
+        except EmulatorConnectionError:
+            return False
+        return "connected to" in res
+
+    def _connect_first_ready(self) -> Optional[str]:
+        """
+        Poll all endpoints concurrently until one connects or BOOT_WAIT_TIMEOUT passes.
+        A warm restart returns after the first round instead of a blanket sleep, and
+        with N endpoints the wait is one poll round, not N sequential ones.
+        """
+        pool = ThreadPoolExecutor(max_workers=len(self.endpoints))
+        try:
+            deadline = time.monotonic() + BOOT_WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                futures = {pool.submit(self._try_connect, ep): ep for ep in self.endpoints}
+                for fut in as_completed(futures):
+                    if fut.result():
+                        return futures[fut]
+                time.sleep(BOOT_POLL_INTERVAL)
+            return None
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
     def install_app(self, app_ref: str) -> str:
         """
         Install the given app_ref (APK path) on the emulator and detect its package name.
@@ -206,60 +385,88 @@ class EmulatorEnv:
 
         logger.info(f"Installing app {app_ref} on emulator...")
 
-        endpoint = random.choice(self.endpoints)
+        endpoint = self._endpoint_for_app(app_ref)
         host_port = endpoint.split("//")[-1]
         parts = host_port.split(":")
         if len(parts) < 2:
             raise ValueError("Cannot parse host:port from endpoint")
 
         # If we have it cached
-        if app_ref in self.app_package_cache:
-            pkg_name = self.app_package_cache[app_ref]
+        if (host_port, app_ref) in self.app_package_cache:
+            pkg_name = self.app_package_cache[(host_port, app_ref)]
             logger.info(f"Using cached package name {pkg_name} for {app_ref}")
             return pkg_name
 
-        before_list = self._get_installed_packages(host_port)
+        # Prefer the name recorded in the APK itself; the before/after `pm list packages`
+        # diff (two full listings from the device) is only the fallback without aapt.
+        pkg_name = self._package_from_apk(app_ref)
+        before_list = self._get_installed_packages(host_port) if pkg_name is None else None
 
         install_cmd = ["adb", "-s", host_port, "install", f"{app_ref}"]
         install_res = self._run_adb_command(install_cmd, check=False)
         if "Success" not in install_res:
             raise EmulatorInstallError(f"Failed to install app {app_ref}, output: {install_res}")
 
-        after_list = self._get_installed_packages(host_port)
-        pkg_name = self._detect_new_package(before_list, after_list)
-        self.app_package_cache[app_ref] = pkg_name
+        if pkg_name is None:
+            after_list = self._get_installed_packages(host_port)
+            pkg_name = self._detect_new_package(before_list, after_list)
+        self.app_package_cache[(host_port, app_ref)] = pkg_name
         return pkg_name
 
-    def run_app(self, app_ref: str) -> Dict[str, Any]:
+    def capture_screenshot_png(self, host_port: str) -> bytes:
+        """Capture the current screen of host_port as raw PNG bytes."""
+        screenshot_cmd = ["adb", "-s", host_port, "exec-out", "screencap", "-p"]
+        # Read stdout straight off the unbuffered pipe (one growing buffer, no
+        # communicate() chunk list + join); a timer kills adb if it hangs.
+        proc = subprocess.Popen(screenshot_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        timer = threading.Timer(self.timeout, proc.kill)
+        timer.start()
+        try:
+            png_data = proc.stdout.read()
+            err = proc.stderr.read()
+            proc.wait()
+        finally:
+            timer.cancel()
+            proc.stdout.close()
+            proc.stderr.close()
+        if proc.returncode != 0:
+            if proc.returncode < 0:
+                raise EmulatorRunError(f"Screenshot capture timed out after {self.timeout}s")
+            raise EmulatorRunError(f"Failed to capture screenshot: {err}")
+        return png_data
+
+    def run_app(self, app_ref: str, inline_screenshot: bool = True) -> Dict[str, Any]:
         """
         Run the previously installed app by pkg_name.
         Attempt to launch and then take a screenshot.
         Returns: {"visuals":{...}, "events": [...], "task_id": ...}
+
+        With inline_screenshot=False no screenshot is taken here and visuals is
+        empty; callers fetch the PNG later via capture_screenshot_png.
         """
         if not self.endpoints:
             raise EmulatorConnectionError("No emulator endpoints to run app.")
 
-        endpoint = random.choice(self.endpoints)
+        # Run where the app was installed
+        endpoint = self._endpoint_for_app(app_ref)
         host_port = endpoint.split("//")[-1]
-        pkg_name = self.app_package_cache[app_ref]
+        pkg_name = self.app_package_cache[(host_port, app_ref)]
         logger.info(f"run_app: Launching app {app_ref} (package name {pkg_name}) on {host_port}")
 
         self._attempt_launch_app(host_port, pkg_name)
 
-        # Capture screenshot
-        screenshot_cmd = ["adb", "-s", host_port, "exec-out", "screencap", "-p"]
-        sc_res = subprocess.run(screenshot_cmd, capture_output=True, timeout=self.timeout)
-        if sc_res.returncode != 0:
-            raise EmulatorRunError(f"Failed to capture screenshot: {sc_res.stderr}")
-
-        png_data = sc_res.stdout
-        screenshot_b64 = base64.b64encode(png_data).decode('utf-8')
+        visuals = {}
+        if inline_screenshot:
+            png_data = self.capture_screenshot_png(host_port)
+            visuals["screenshot"] = base64.b64encode(png_data).decode('utf-8')
         events = ["tap", "scroll", "launch"]
         task_id = str(uuid.uuid4())
-        self.task_map[task_id] = {"endpoint": endpoint, "app_ref": pkg_name}
+        # host_port and vnc_url are computed once here so control/VNC calls are plain lookups
+        vnc_url = self.vnc_url_template.format(host=host_port.split(":")[0], port=self.default_vnc_port)
+        self.task_map[task_id] = {"endpoint": endpoint, "host_port": host_port, "app_ref": pkg_name, "vnc_url": vnc_url}
         logger.info(f"App run successful. Task ID: {task_id}")
 
-        return {"visuals": {"screenshot": screenshot_b64}, "events": events, "task_id": task_id}
+        return {"visuals": visuals, "events": events, "task_id": task_id}
 
     def control_app(self, host_port: str, action: str, **params):
         """
@@ -283,12 +490,7 @@ class EmulatorEnv:
             # We will capture a screenshot by using the standard adb screencap command
             # and then pulling it locally.
 
-            screenshot_cmd = ["adb", "-s", host_port, "exec-out", "screencap", "-p"]
-            sc_res = subprocess.run(screenshot_cmd, capture_output=True, timeout=self.timeout)
-            if sc_res.returncode != 0:
-                raise EmulatorRunError(f"Failed to capture screenshot: {sc_res.stderr}")
-
-            png_data = sc_res.stdout
+            png_data = self.capture_screenshot_png(host_port)
             screenshot_b64 = base64.b64encode(png_data).decode('utf-8')
             logger.info("control_app: screenshot taken and converted to base64.")
             return screenshot_b64
@@ -307,19 +509,27 @@ class EmulatorEnv:
             text = params.get("text")
             if text is None:
                 raise ValueError("type action requires text param")
-            # We'll type character by character.
-            # Special handling for space, underscore, etc.
+            # Runs of plain characters (spaces included, sent as %s) go out as one
+            # `input text`; the run is only broken for characters handled specially.
+            shell_cmds = []
+            buf = []
             for char in text:
-                if char == ' ':
-                    cmd = ["adb","-s",host_port,"shell","input","text","%s"]
-                elif char == '_':
-                    cmd = ["adb","-s",host_port,"shell","input","keyevent","66"]
-                elif char.isalnum() or char in '-.,!?@\'°/:;()':
-                    cmd = ["adb","-s",host_port,"shell","input","text",char]
+                if char in TYPE_PLAIN_CHARS or char.isalnum():
+                    buf.append('%s' if char == ' ' else char)
+                    continue
+                if buf:
+                    shell_cmds.append(["input","text","".join(buf)])
+                    buf = []
+                if char == '_':
+                    shell_cmds.append(["input","keyevent","66"])
                 else:
                     # For other special characters, use broadcast
-                    cmd = ["adb","-s",host_port,"shell","am","broadcast","-a","ADB_INPUT_TEXT","--es","msg",char]
-                self._run_adb_command(cmd, check=False)
+                    shell_cmds.append(["am","broadcast","-a","ADB_INPUT_TEXT","--es","msg",char])
+            if buf:
+                shell_cmds.append(["input","text","".join(buf)])
+            # All keystrokes go to the device in one adb shell session
+            if shell_cmds:
+                self._run_adb_shell_batch(host_port, shell_cmds, check=False)
             logger.info(f"control_app: typed text: {text}")
             return f"Typed {text}"
 
@@ -355,13 +565,4 @@ class EmulatorEnv:
         if task_id not in self.task_map:
             raise KeyError(f"No known emulator instance for task_id: {task_id}")
 
-        info = self.task_map[task_id]
-        endpoint = info["endpoint"]
-        host_port = endpoint.split("//")[-1]
-        parts = host_port.split(":")
-        if len(parts) < 1:
-            raise ValueError(f"Cannot parse host from endpoint: {endpoint}")
-        host = parts[0]
-
-        vnc_url = self.vnc_url_template.format(host=host, port=self.default_vnc_port)
-        return vnc_url
+        return self.task_map[task_id]["vnc_url"]
@@ -0,0 +1,415 @@
+###############################################################################
+# llm_cache.py
+#
+# Purpose:
+# Exact-match cache for LLM responses. The same URL or message is often
+# submitted many times (repeat scans, retries, evals), and every one of those
+# used to cost a full multi-second Ollama generation. With this cache a repeat
+# prompt is answered from a local SQLite file instead.
+#
+# Key Parts:
+# - hash_request(model, prompt): deterministic SHA-256 key over the model name
+#   and the normalized prompt (NFC + strip + lowercase).
+# - Cache: small sqlite3-backed key/value store with
+#     * TTL eviction (entries older than CACHE_TTL_SECONDS are ignored/deleted)
+#     * LRU eviction (on overflow, drop the least recently used rows until
+#       CACHE_MAX_SIZE remain)
+# - cached_call(model_attr): decorator for LLMClient methods taking a prompt.
+#   On hit the wrapped method (and therefore the HTTP call) is skipped.
+# - SemanticCache: opt-in near-match tier behind the exact cache. Only calls
+#   that pass `subject=` and `subject_kind=` use it, and only the subject (the
+#   URL or message being judged) is embedded, never the prompt template, so
+#   prompts sharing a long fixed prefix do not collapse onto one answer.
+#   Subjects are embedded with sentence-transformers (BAAI/bge-small-en-v1.5)
+#   and compared against an in-memory numpy matrix of earlier subjects of the
+#   same kind; cosine >= SEMANTIC_THRESHOLDS[kind] reuses that earlier response
+#   ("bad.co/login1" vs "bad.co/login2"). URLs are only compared with URLs on
+#   the same hostname, so lookalike domains ("paypal.com" vs "paypa1.com")
+#   never share a verdict. When hnswlib is installed the lookup goes through
+#   an HNSW index (approximate nearest neighbour, O(log N)) instead of the
+#   linear matmul.
+# - The embedding model is loaded once at startup (load_semantic_cache, from
+#   provider_server); until it is ready, requests use the exact tier only.
+#
+# Lookup order in cached_call: exact SQLite hash -> HNSW / numpy cosine -> LLM.
+# Semantic hits are returned as-is and never written to the exact cache.
+#
+# Request coalescing: concurrent callers that miss on the same exact key share
+# one LLM call. The first caller (owner) registers a Future in _inflight and
+# does the work; the rest wait on that Future instead of calling the LLM again.
+# A waiter that gives up after COALESCE_WAIT_SECONDS makes its own LLM call.
+#
+# Configuration (env vars):
+# - LLM_CACHE_PATH: sqlite file location (default "llm_cache.sqlite3")
+# - LLM_CACHE_ENABLED: set to "0" to bypass the cache entirely
+# - LLM_SEMANTIC_CACHE_ENABLED: set to "0" to skip the embedding tier everywhere
+#   (on by default, but only calls passing subject=/subject_kind= use it; the
+#   link and message services do)
+#
+# Maintainability:
+# - Only successful responses are cached; exceptions propagate untouched.
+# - If several providers instances should share a cache, swap the sqlite
+#   backend for Redis behind the same get/set interface.
+# - sentence-transformers is optional at runtime: if it is not installed the
+#   semantic tier logs a warning once and only exact matches are served.
+# - hnswlib is optional too: without it the numpy matmul is used.
+###############################################################################
+
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from urllib.parse import urlsplit
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_DB_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+# Entries older than this are treated as misses and removed
+CACHE_TTL_SECONDS = 24 * 3600
+# Upper bound on stored responses; least recently used rows go first
+CACHE_MAX_SIZE = 10000
+
+SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "1") != "0"
+SEMANTIC_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+# Cosine similarity needed for a near-match hit, per subject kind. Call sites
+# opt in by passing one of these kinds; anything else skips the semantic tier.
+SEMANTIC_THRESHOLDS = {
+    "url": 0.92,
+    "message": 0.95,
+}
+# Near-match entries kept in memory per LLM model; oldest are overwritten first
+SEMANTIC_MAX_ENTRIES = CACHE_MAX_SIZE
+# HNSW parameters (only used when hnswlib is installed)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# How long a coalesced caller waits for the owner's in-flight LLM call
+COALESCE_WAIT_SECONDS = 120
+
+
+def hash_request(model: str, prompt: str) -> str:
+    """
+    Build the cache key for a (model, prompt) pair.
+    The prompt is NFC-normalized, stripped and lowercased so trivially
+    different spellings of the same request share one entry.
+    """
+    normalized = unicodedata.normalize("NFC", prompt).strip().lower()
+    return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """SQLite key/value store with TTL and LRU eviction."""
+
+    def __init__(self, path: str = CACHE_DB_PATH, ttl: float = CACHE_TTL_SECONDS,
+                 max_size: int = CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # One connection shared by FastAPI's worker threads, serialized by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value BLOB, created_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return value.decode("utf-8")
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value.encode("utf-8"), now, now),
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            if count > self.max_size:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                    (count - self.max_size,),
+                )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+class SemanticCache:
+    """
+    In-memory near-match cache. For each LLM model it keeps a ring buffer of
+    unit-length prompt embeddings E (N x dim) and the matching responses, so a
+    lookup is a single `E @ q` matmul plus argmax. If hnswlib is available the
+    embeddings also go into an HNSW index whose labels are the ring slots, and
+    lookups use knn_query instead.
+    """
+
+    def __init__(self, embed, max_entries: int = SEMANTIC_MAX_ENTRIES):
+        self.embed = embed
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # scope -> {"E": matrix, "responses": list, "size": filled rows, "pos": next slot}
+        self._tables: Dict[str, dict] = {}
+        self._hnswlib = _load_hnswlib()
+
+    def embed_subject(self, subject: str) -> np.ndarray:
+        return self.embed(unicodedata.normalize("NFC", subject).strip().lower())
+
+    def get(self, scope: str, q: np.ndarray, threshold: float) -> Optional[str]:
+        table = self._tables.get(scope)
+        if table is None or table["size"] == 0:
+            return None
+        with self._lock:
+            index = table.get("index")
+            if index is not None:
+                labels, dists = index.knn_query(q, k=1)
+                idx, sim = int(labels[0][0]), 1.0 - float(dists[0][0])
+            else:
+                sims = table["E"][:table["size"]] @ q
+                idx = int(np.argmax(sims))
+                sim = float(sims[idx])
+            if sim >= threshold:
+                logger.info(f"LLM semantic cache hit (cosine={sim:.3f})")
+                return table["responses"][idx]
+        return None
+
+    def add(self, scope: str, q: np.ndarray, response: str) -> None:
+        with self._lock:
+            table = self._tables.get(scope)
+            if table is None:
+                table = {
+                    "E": np.zeros((self.max_entries, q.shape[0]), dtype=np.float32),
+                    "responses": [None] * self.max_entries,
+                    "size": 0,
+                    "pos": 0,
+                    "index": self._new_index(q.shape[0]),
+                }
+                self._tables[scope] = table
+            pos = table["pos"]
+            table["E"][pos] = q
+            if table["index"] is not None:
+                # Re-adding an existing label replaces the overwritten slot
+                table["index"].add_items(q.reshape(1, -1), np.array([pos]))
+            table["responses"][pos] = response
+            table["pos"] = (pos + 1) % self.max_entries
+            table["size"] = min(table["size"] + 1, self.max_entries)
+
+    def _new_index(self, dim: int):
+        if self._hnswlib is None:
+            return None
+        index = self._hnswlib.Index(space="cosine", dim=dim)
+        index.init_index(max_elements=self.max_entries,
+                         ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        index.set_ef(HNSW_EF_SEARCH)
+        return index
+
+
+def _load_hnswlib():
+    """Return the hnswlib module, or None to fall back to the numpy scan."""
+    try:
+        import hnswlib
+    except ImportError:
+        logger.info("hnswlib not installed; semantic LLM cache uses a linear numpy scan.")
+        return None
+    return hnswlib
+
+
+def _load_embedder():
+    """Return a text -> unit vector function, or None if sentence-transformers is missing."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.warning("sentence-transformers not installed; semantic LLM cache disabled.")
+        return None
+    try:
+        model = SentenceTransformer(SEMANTIC_MODEL_NAME)
+    except Exception as e:
+        # e.g. the model can't be downloaded; don't take the provider down with it
+        logger.warning(f"Cannot load {SEMANTIC_MODEL_NAME} ({e}); semantic LLM cache disabled.")
+        return None
+
+    def embed(text: str) -> np.ndarray:
+        return model.encode(text, normalize_embeddings=True).astype(np.float32)
+    return embed
+
+
+# Opened on first use so importing llm_client does not touch the filesystem
+# or load the embedding model
+_cache: Optional[Cache] = None
+_semantic_cache: Optional[SemanticCache] = None
+_semantic_loaded = False
+_cache_lock = threading.Lock()
+# Separate from _cache_lock: loading the embedding model can take a while
+_semantic_lock = threading.Lock()
+
+# cache key -> Future of the LLM call currently computing it
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def get_cache() -> Cache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = Cache()
+    return _cache
+
+
+def load_semantic_cache() -> Optional[SemanticCache]:
+    """Load the embedding model (blocking, once). Called at provider startup."""
+    global _semantic_cache, _semantic_loaded
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _semantic_lock:
+        if not _semantic_loaded:
+            embed = _load_embedder()
+            _semantic_cache = SemanticCache(embed) if embed else None
+            _semantic_loaded = True
+    return _semantic_cache
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """The loaded SemanticCache, or None if disabled or not loaded yet (never blocks)."""
+    if not SEMANTIC_CACHE_ENABLED or not _semantic_loaded:
+        return None
+    return _semantic_cache
+
+
+def _subject_scope(kind: str, subject: str) -> Optional[str]:
+    """
+    Extra semantic-table scope for a subject: URLs are grouped by hostname so
+    only same-host URLs can match. None means the subject can't be scoped and
+    skips the semantic tier.
+    """
+    if kind != "url":
+        return kind
+    text = subject.strip()
+    try:
+        host = urlsplit(text if "//" in text else "//" + text).hostname
+    except ValueError:
+        return None
+    return f"{kind}:{host}" if host else None
+
+
+def _is_cacheable(result: str, validate) -> bool:
+    if validate is None:
+        return True
+    try:
+        validate(result)
+    except ValueError:
+        return False
+    return True
+
+
+def cached_call(model_attr: str, namespace: str = "", validate=None):
+    """
+    Decorate an LLMClient method `fn(self, prompt, ...)` so that responses are
+    cached under hash_request(getattr(self, model_attr), prompt).
+    `namespace` keeps methods that return different shapes for the same
+    prompt (e.g. JSON mode) in separate entries.
+    `validate(result)` (e.g. orjson.loads) must not raise for a result to be
+    stored; a malformed reply is still returned but not cached, so the
+    caller's retry makes a fresh LLM call instead of getting it back.
+
+    Callers opt into the semantic tier with the keyword-only `subject` (the
+    text being judged) and `subject_kind` (a key of SEMANTIC_THRESHOLDS);
+    both are consumed here and not passed on to `fn`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, prompt: str, *args, subject: Optional[str] = None,
+                    subject_kind: Optional[str] = None, **kwargs):
+            if not CACHE_ENABLED or not prompt.strip():
+                return fn(self, prompt, *args, **kwargs)
+
+            cache = get_cache()
+            model = getattr(self, model_attr)
+            if namespace:
+                model = f"{model}:{namespace}"
+            key = hash_request(model, prompt)
+            hit = cache.get(key)
+            if hit is not None:
+                logger.info(f"LLM cache hit for key {key[:12]}")
+                return hit
+
+            with _inflight_lock:
+                future = _inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    _inflight[key] = future
+            if not owner:
+                logger.info(f"Joining in-flight LLM call for key {key[:12]}")
+                try:
+                    return future.result(timeout=COALESCE_WAIT_SECONDS)
+                except FutureTimeoutError:
+                    if future.done():
+                        # The owner itself failed with a timeout; share it
+                        raise
+                    logger.warning(f"In-flight LLM call for key {key[:12]} still running after "
+                                   f"{COALESCE_WAIT_SECONDS}s; calling the LLM directly")
+                return fn(self, prompt, *args, **kwargs)
+
+            try:
+                threshold = SEMANTIC_THRESHOLDS.get(subject_kind)
+                semantic = subject_scope = None
+                if threshold is not None and subject and subject.strip():
+                    subject_scope = _subject_scope(subject_kind, subject)
+                if subject_scope is not None:
+                    semantic = get_semantic_cache()
+                if semantic is not None:
+                    scope = f"{model}:{subject_scope}"
+                    # Embed once; the same vector is stored on a miss
+                    q = semantic.embed_subject(subject)
+                    hit = semantic.get(scope, q, threshold)
+                    if hit is not None:
+                        future.set_result(hit)
+                        return hit
+
+                result = fn(self, prompt, *args, **kwargs)
+                if _is_cacheable(result, validate):
+                    cache.set(key, result)
+                    if semantic is not None:
+                        semantic.add(scope, q, result)
+                else:
+                    logger.warning(f"LLM reply for key {key[:12]} failed validation; not cached")
+                future.set_result(result)
+                return result
+            except BaseException as e:
+                # Waiters see the same error as the owner
+                future.set_exception(e)
+                raise
+            finally:
+                with _inflight_lock:
+                    _inflight.pop(key, None)
+        return wrapper
+    return decorator
@@ -12,18 +12,54 @@
 # 1. Ensure model exists (call _ensure_model_exists).
 # 2. If ensured, then proceed with calling /api/generate for actual prompt interpretation.
 #
+# Caching:
+# - interpret_chat is wrapped by llm_cache.cached_call; an identical (model, prompt)
+#   pair seen within the TTL is served from SQLite without calling Ollama.
+# - Callers may pass subject=/subject_kind= (the URL or message judged) to also
+#   reuse answers for near-identical subjects; see llm_cache.SEMANTIC_THRESHOLDS.
+#
+# JSON mode:
+# - interpret_chat_json streams the generation (stream=True, format="json") and
+#   stops reading as soon as the outer JSON object closes, instead of waiting
+#   for any trailing text the model appends after it.
+#
+# Model checks:
+# - A successful _ensure_model_exists is remembered per model for
+#   llm.model_check_ttl_seconds (default 300), so repeated interpret calls skip
+#   the GET /api/tags round trip. A 404 from /api/generate drops the entry,
+#   re-checks (pulling if needed) and retries the request once.
+#
+# Async callers:
+# - interpret_chat_async / interpret_vision_async run the sync methods in worker
+#   threads (over the pooled session), so they can be awaited side by side;
+#   interpret_chat_and_vision overlaps one of each.
+#
+# Raw images:
+# - interpret_vision_bytes takes image bytes (e.g. from a multipart upload) and
+#   base64-encodes them once in C, so clients need not send base64 inside JSON.
+#
 # Note:
 # This makes the system more self-contained, as we do not manually run `ollama list` 
 # or `ollama pull`. Instead, code relies on Ollama's HTTP endpoints to handle models.
 ###############################################################################
 
+import asyncio
+import base64
+import json
+import time
+import orjson
 import requests
-from typing import List, Optional
+from typing import Dict, List, Optional
 from utils import config_loader
+from utils.http_session import make_session
+from core.llm_cache import cached_call
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Bytes of a failed /api/pull body included in the error message
+PULL_ERROR_PREVIEW_BYTES = 2048
+
 class LLMConnectionError(Exception):
     pass
 
@@ -48,6 +84,17 @@ class LLMClient:
 
         self.timeout = llm_config.get("timeout_seconds", 20)
 
+        # model name -> time.monotonic() of the last successful /api/tags check;
+        # re-checked after the TTL so models removed out of band are noticed
+        self.model_check_ttl = llm_config.get("model_check_ttl_seconds", 300)
+        self._verified_at: Dict[str, float] = {}
+        # Names from the most recent /api/tags listing, and when it was fetched
+        self._known_models: frozenset = frozenset()
+        self._known_models_at = 0.0
+
+        # Keep-alive pool to Ollama, reused by every request this client makes
+        self._session = make_session()
+
         # TODO: Need to add two "cold start generate instruction to boot up ollama -> load checkpoints, etc."
         # Else almost all requests will timeout
         # Currently manually by 
@@ -55,6 +102,8 @@ class LLMClient:
         # curl http://localhost:11434/api/generate -d '{"model":"llama3.2-vision:11b","prompt":"What is in this image?","images":["<base64>"]}'
 
 
+    # Repeat prompts are answered from the local response cache (see llm_cache.py)
+    @cached_call("chat_model_name")
     def interpret_chat(self, prompt: str) -> str:
         prompt = prompt.strip()
         if not prompt:
@@ -81,6 +130,94 @@ class LLMClient:
         
         return response_text.strip()
 
+    # Only replies that parse as JSON are cached, so a malformed one is retried fresh
+    @cached_call("chat_model_name", namespace="json", validate=orjson.loads)
+    def interpret_chat_json(self, prompt: str) -> str:
+        """
+        Like interpret_chat, but for prompts that ask for a JSON object.
+        Returns the text of the first complete top-level JSON object; the
+        stream is closed as soon as it is seen. If the stream ends before
+        the object closes, LLMResponseError is raised (and nothing is cached),
+        so the caller's retry makes a fresh call.
+        """
+        prompt = prompt.strip()
+        if not prompt:
+            raise ValueError("Prompt must not be empty for interpret_chat_json().")
+
+        self._ensure_model_exists(self.chat_model_name)
+
+        payload = {
+            "model": self.chat_model_name,
+            "prompt": prompt,
+            "stream": True,
+            # Ollama's JSON mode constrains output to valid JSON
+            "format": "json"
+        }
+        if self.chat_model_params:
+            payload["options"] = self.chat_model_params
+
+        url = f"{self.global_endpoint}/api/generate"
+        try:
+            with self._session.post(url, json=payload, timeout=self.timeout, stream=True) as r:
+                if r.status_code != 200:
+                    raise LLMResponseError(f"LLM returned {r.status_code}: {r.text}")
+                return self._read_json_stream(r.iter_lines())
+        except requests.exceptions.RequestException as e:
+            raise LLMConnectionError(f"Failed to connect to LLM at {url}: {e}")
+
+    @staticmethod
+    def _read_json_stream(lines) -> str:
+        """
+        Accumulate Ollama NDJSON chunks and return once brace depth of the
+        outer object drops back to 0. Braces inside JSON strings are ignored.
+        Raises LLMResponseError if the stream ends first (cut-off generation).
+        """
+        buffer = []
+        depth = 0
+        started = False
+        in_string = False
+        escaped = False
+        for line in lines:
+            if not line:
+                continue
+            try:
+                chunk = json.loads(line)
+            except ValueError:
+                raise LLMResponseError("Invalid JSON chunk in LLM stream.")
+            if "error" in chunk:
+                raise LLMResponseError(f"LLM stream error: {chunk['error']}")
+
+            for ch in chunk.get("response", ""):
+                if not started:
+                    # Skip any preamble before the first object
+                    if ch == "{":
+                        started = True
+                        depth = 1
+                        buffer.append(ch)
+                    continue
+                buffer.append(ch)
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif ch == "\\":
+                        escaped = True
+                    elif ch == '"':
+                        in_string = False
+                elif ch == '"':
+                    in_string = True
+                elif ch == "{":
+                    depth += 1
+                elif ch == "}":
+                    depth -= 1
+                    if depth == 0:
+                        return "".join(buffer)
+            if chunk.get("done"):
+                break
+
+        if not buffer:
+            raise LLMResponseError("Chat model stream contained no JSON object.")
+        raise LLMResponseError("Chat model stream ended before the JSON object was closed.")
+
     def interpret_vision(self, prompt: str, images: List[str]) -> str:
         prompt = prompt.strip()
         if not prompt:
@@ -109,6 +246,27 @@ class LLMClient:
 
         return response_text.strip()
 
+    def interpret_vision_bytes(self, prompt: str, images: List[bytes]) -> str:
+        """Same as interpret_vision, but with raw image bytes instead of base64 strings."""
+        if not images or any(not img for img in images):
+            raise ValueError("At least one non-empty image must be provided for vision interpretation.")
+        return self.interpret_vision(prompt, [base64.b64encode(img).decode("ascii") for img in images])
+
+    async def interpret_chat_async(self, prompt: str) -> str:
+        """interpret_chat for async callers; runs in a worker thread (same cache and model checks)."""
+        return await asyncio.to_thread(self.interpret_chat, prompt)
+
+    async def interpret_vision_async(self, prompt: str, images: List[str]) -> str:
+        """interpret_vision for async callers; runs in a worker thread."""
+        return await asyncio.to_thread(self.interpret_vision, prompt, images)
+
+    async def interpret_chat_and_vision(self, chat_prompt: str, vision_prompt: str, images: List[str]):
+        """Run a chat and a vision interpretation concurrently; returns (chat_text, vision_text)."""
+        return tuple(await asyncio.gather(
+            self.interpret_chat_async(chat_prompt),
+            self.interpret_vision_async(vision_prompt, images),
+        ))
+
     def _ensure_model_exists(self, model_name: str) -> None:
         """
         Check if the given model_name is locally available on Ollama by using GET /api/tags.
@@ -122,10 +280,20 @@ class LLMClient:
         
         Maintainability:
         - If Ollama changes the API for listing models or pulling models, update these methods.
-        - If we want to handle partial downloads or streaming logs from pull, we can parse the streaming response from /api/pull.
+        - _pull_model already consumes /api/pull as a stream of progress lines.
         """
+        now = time.monotonic()
+        verified_at = self._verified_at.get(model_name)
+        if verified_at is not None and now - verified_at < self.model_check_ttl:
+            return  # Checked recently
+        if model_name in self._known_models and now - self._known_models_at < self.model_check_ttl:
+            # Present in a listing fetched for another model within the TTL
+            self._verified_at[model_name] = self._known_models_at
+            return
+
         if self._model_in_list(model_name):
             logger.info(f"Model '{model_name}' already exists.")
+            self._verified_at[model_name] = time.monotonic()
             return  # Model already exists
         
         # Model not found, try to pull
@@ -136,6 +304,7 @@ class LLMClient:
         if not self._model_in_list(model_name):
             logger.error(f"Model '{model_name}' not found even after pulling attempt.")
             raise LLMResponseError(f"Model '{model_name}' not found even after pulling attempt.")
+        self._verified_at[model_name] = time.monotonic()
 
     def _model_in_list(self, model_name: str) -> bool:
         """
@@ -144,7 +313,7 @@ class LLMClient:
         """
         url = f"{self.global_endpoint}/api/tags"
         try:
-            r = requests.get(url, timeout=self.timeout)
+            r = self._session.get(url, timeout=self.timeout)
         except requests.exceptions.RequestException as e:
             raise LLMConnectionError(f"Failed to connect to LLM at {url}: {e}")
 
@@ -154,51 +323,69 @@ class LLMClient:
         data = r.json()
         models = data.get("models", [])
         # Each model is a dict with "name" key. Example: {"name": "llama3.1"}
-        local_names = [m.get("name", "") for m in models]
-        # Check if exact model_name matches one in local_names
-        return model_name in local_names
+        # Remember the full set: with several models verified per TTL one listing
+        # answers all of them (see _ensure_model_exists)
+        self._known_models = frozenset(m.get("name", "") for m in models)
+        self._known_models_at = time.monotonic()
+        # Check if exact model_name matches one in the local set
+        return model_name in self._known_models
 
     def _pull_model(self, model_name: str) -> None:
         """
-        Try to pull the specified model by POST /api/pull with {"model":model_name}.
-        If the pulling fails (non-200 response), raise LLMResponseError.
-        
-        Note: This call may stream responses. The code as written expects a non-streaming response.
-        If streaming occurs, we might receive multiple JSON objects. For simplicity, 
-        we assume either streaming is disabled or we just wait for final success status.
-        
-        If we need to handle streaming, we can do line-by-line parsing. For now, 
-        we assume a simple final JSON with "status":"success".
+        Pull the specified model by POST /api/pull with {"model":model_name}.
+
+        The pull is streamed: Ollama sends one JSON progress object per line, which
+        is parsed as it arrives (memory stays at one line, not the whole body).
+        An "error" line raises LLMResponseError at once; a "status":"success"
+        line returns. A non-200 response raises with the start of its body only.
         """
         logger.info(f"Pulling model '{model_name}'...")
         url = f"{self.global_endpoint}/api/pull"
-        payload = {"model": model_name, "stream": False}
-        # If streaming is default, we might have to handle streaming. According 
-        # to Ollama docs, "stream":false should give one final response.
-        
+        payload = {"model": model_name, "stream": True}
+
         try:
-            r = requests.post(url, json=payload, timeout=300)  # 5 min timeout to pull large models
-            logger.info(f"Model '{model_name}' pulled successfully.")
+            # 5 min timeout (between bytes) to pull large models
+            with self._session.post(url, json=payload, timeout=300, stream=True) as r:
+                if r.status_code != 200:
+                    body = next(r.iter_content(PULL_ERROR_PREVIEW_BYTES), b"").decode(errors="replace")
+                    raise LLMResponseError(f"Failed to pull model '{model_name}': {r.status_code}: {body}")
+
+                last_status = None
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    try:
+                        obj = json.loads(line)
+                    except ValueError:
+                        raise LLMResponseError(f"Invalid JSON line in pull stream for '{model_name}'.")
+                    if obj.get("error"):
+                        raise LLMResponseError(f"Model pull failed for '{model_name}': {obj['error']}")
+                    status = obj.get("status")
+                    if status != last_status:
+                        logger.info(f"Model '{model_name}' pull: {status}")
+                        last_status = status
+                    if status == "success":
+                        logger.info(f"Model '{model_name}' pulled successfully.")
+                        return
         except requests.exceptions.RequestException as e:
             raise LLMConnectionError(f"Failed to connect to LLM for pulling model at {url}: {e}")
 
-        if r.status_code != 200:
-            # Possibly streaming ended with error
-            # If we get a single JSON with error info:
-            raise LLMResponseError(f"Failed to pull model '{model_name}': {r.status_code}: {r.text}")
+        raise LLMResponseError(f"Model pull did not succeed for '{model_name}'. Last status: {last_status}")
 
-        data = r.json()
-        logger.info(f"Model '{model_name}' pull response: {data}")
-        # Expect data like {"status":"success"} on success
-        if data.get("status") != "success":
-            raise LLMResponseError(f"Model pull did not succeed for '{model_name}'. Response: {data}")
-
-    def _post_request(self, url: str, payload: dict) -> dict:
+    def _post_request(self, url: str, payload: dict, retry_missing_model: bool = True) -> dict:
         try:
-            r = requests.post(url, json=payload, timeout=self.timeout)
+            r = self._session.post(url, json=payload, timeout=self.timeout)
         except requests.exceptions.RequestException as e:
             raise LLMConnectionError(f"Failed to connect to LLM at {url}: {e}")
 
+        model_name = payload.get("model")
+        if r.status_code == 404 and retry_missing_model and self._verified_at.pop(model_name, None) is not None:
+            # Model was removed since it was last verified: re-check/pull, then retry once
+            logger.warning(f"Model '{model_name}' missing on LLM server, re-checking...")
+            self._known_models_at = 0.0  # the cached listing is stale too
+            self._ensure_model_exists(model_name)
+            return self._post_request(url, payload, retry_missing_model=False)
+
         if r.status_code != 200:
             raise LLMResponseError(f"LLM returned {r.status_code}: {r.text}")
 
@@ -220,8 +407,8 @@ class LLMClient:
 # This way, we don't rely on manual `ollama list` or command-line tools.
 # Everything happens via Ollama's REST API inside llm_client.py.
 #
-# If you see performance overhead, consider caching the "models" list after first check,
-# or only pulling once. For initial correctness, this ensures correct model presence.
+# Successful checks are remembered per model for model_check_ttl seconds, so the
+# /api/tags round trip happens once per TTL instead of on every call.
 #
 # If model pulling or listing differ from these assumptions, adapt the code accordingly.
 ###############################################################################
@@ -26,7 +26,7 @@
 ###############################################################################
 
 import subprocess
-import json
+import orjson
 import sys
 import os
 
@@ -82,7 +82,7 @@ def parse_terraform_outputs():
     If keys are missing, return empty lists.
     """
     output_json = run_terraform_command(["output", "-json"])
-    data = json.loads(output_json)
+    data = orjson.loads(output_json)
 
     sandbox_endpoints = data.get("sandbox_urls", {}).get("value", [])
     emulator_endpoints = data.get("emulator_urls", {}).get("value", [])
@@ -112,8 +112,8 @@ def write_instances_file(instances_data):
 
     instances_file = "/providers/instances.json"
     try:
-        with open(instances_file, "w") as f:
-            json.dump(instances_data, f, indent=2)
+        with open(instances_file, "wb") as f:
+            f.write(orjson.dumps(instances_data, option=orjson.OPT_INDENT_2))
         logger.info(f"Provisioner: write_instances_file: Wrote endpoints to {instances_file}: {instances_data}")
     except Exception as e:
         print(f"Failed to write {instances_file}: {e}")
@@ -38,15 +38,28 @@
 #
 ###############################################################################
 
+import asyncio
+import orjson
 import requests
 import os
-import json
-import random
+import threading
 import sys
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 from utils import config_loader
+from utils.http_session import make_session
 from core import provisioner  # Importing provisioner for dynamic provisioning, if needed.
 
+# Circuit breaker for _choose_endpoint: after this many consecutive connection
+# failures an endpoint is skipped until its cooldown, min(ENDPOINT_MAX_COOLDOWN, 2**failures)
+# seconds after the last failure, has passed
+ENDPOINT_FAIL_THRESHOLD = 3
+ENDPOINT_MAX_COOLDOWN = 30.0
+
+# Per-file fallback concurrency for run_files_batch when a sandbox has no /analyze/batch
+BATCH_FALLBACK_WORKERS = 8
+
 # For consistency, we can define exceptions for sandbox as well.
 # Currently, we raise ValueError or ConnectionError, but let's define custom ones if desired:
 class SandboxConnectionError(Exception):
@@ -74,14 +87,23 @@ class SandboxEnv:
         sandbox_config = self.config.get("sandbox", {})
         self.timeout = sandbox_config.get("timeout_seconds", 5)
         self.max_retries = sandbox_config.get("max_retries", 2)
+        # Keep-alive pool to the sandboxes; run_file's retries reuse it too
+        self._session = make_session()
+        # Round-robin cursor for _choose_endpoint (run_files calls it from several threads)
+        self._rr_index = 0
+        self._rr_lock = threading.Lock()
+        # endpoint -> (time.monotonic() of last failure, consecutive failures);
+        # read and updated from run_files' threads, so only under _health_lock
+        self._endpoint_health: Dict[str, Tuple[float, int]] = {}
+        self._health_lock = threading.Lock()
+        # Endpoints that answered /analyze/batch with 404/405; not probed again
+        self._no_batch_endpoints = set()
 
         # Load endpoints from instances.json
         self.endpoints = []
-        instances_path = "instances.json"
-        if os.path.exists(instances_path):
-            with open(instances_path, "r") as f:
-                instances_data = json.load(f)
-                self.endpoints = instances_data.get("sandbox", [])
+        instances_data = config_loader.load_instances("instances.json")
+        if instances_data:
+            self.endpoints = instances_data.get("sandbox", [])
         if not self.endpoints:
             # fallback to config endpoints if none in instances.json
             self.endpoints = sandbox_config.get("endpoints", [])
@@ -133,11 +155,9 @@ class SandboxEnv:
         Maintainability:
         - If instances.json format changes, update parsing logic here.
         """
-        instances_path = "instances.json"
-        if os.path.exists(instances_path):
-            with open(instances_path, "r") as f:
-                instances_data = json.load(f)
-                self.endpoints = instances_data.get("sandbox", [])
+        instances_data = config_loader.load_instances("instances.json")
+        if instances_data:
+            self.endpoints = instances_data.get("sandbox", [])
         if not self.endpoints:
             raise ValueError("No sandbox endpoints available after provisioning. Check terraform configurations.")
 
@@ -148,10 +168,12 @@ class SandboxEnv:
         Steps:
         1. If endpoints empty, call _provision_new_sandbox().
         2. If still empty, raise ValueError.
-        3. Return a random endpoint from endpoints.
+        3. Return the next endpoint in round-robin order, skipping endpoints whose
+           circuit is open (see _is_available). If all are open, use all of them.
 
         Maintainability:
-        - Currently a simple random choice. Could use round-robin or health checks.
+        - The cursor is an index modulo len(self.endpoints), so it stays valid
+          when _reload_endpoints replaces the list.
         """
         if not self.endpoints:
             # Attempt provisioning if dynamic provisioning is part of design
@@ -160,7 +182,35 @@ class SandboxEnv:
         if not self.endpoints:
             raise ValueError("No sandbox endpoints available even after provisioning.")
 
-        return random.choice(self.endpoints)
+        now = time.monotonic()
+        with self._health_lock:
+            candidates = [ep for ep in self.endpoints if self._is_available(ep, now)] or self.endpoints
+        with self._rr_lock:
+            endpoint = candidates[self._rr_index % len(candidates)]
+            self._rr_index += 1
+        return endpoint
+
+    def _is_available(self, endpoint: str, now: float) -> bool:
+        """
+        False while endpoint has failed ENDPOINT_FAIL_THRESHOLD+ times in a row and is cooling down.
+        Caller holds _health_lock.
+        """
+        health = self._endpoint_health.get(endpoint)
+        if health is None:
+            return True
+        last_failure, failures = health
+        if failures < ENDPOINT_FAIL_THRESHOLD:
+            return True
+        return now - last_failure >= min(ENDPOINT_MAX_COOLDOWN, 2 ** failures)
+
+    def _record_failure(self, endpoint: str) -> None:
+        with self._health_lock:
+            _, failures = self._endpoint_health.get(endpoint, (0.0, 0))
+            self._endpoint_health[endpoint] = (time.monotonic(), failures + 1)
+
+    def _record_success(self, endpoint: str) -> None:
+        with self._health_lock:
+            self._endpoint_health.pop(endpoint, None)
 
     def run_file(self, file_ref: str) -> List[str]:
         """
@@ -199,7 +249,7 @@ class SandboxEnv:
             endpoint = self._choose_endpoint()
             url = f"{endpoint}/analyze"
             try:
-                r = requests.post(url, json=payload, timeout=self.timeout)
+                r = self._session.post(url, json=payload, timeout=self.timeout)
                 if r.status_code != 200:
                     raise SandboxResponseError(f"Sandbox returned status {r.status_code}: {r.text}")
 
@@ -208,10 +258,12 @@ class SandboxEnv:
                 if logs is None or not isinstance(logs, list):
                     raise SandboxResponseError("Sandbox response missing 'logs' field or not a list.")
 
+                self._record_success(endpoint)
                 return logs
             except requests.exceptions.RequestException as e:
                 # Connection or timeout issue, retry unless exceeded max_retries
                 last_exception = e
+                self._record_failure(endpoint)
                 # Try again
             except SandboxResponseError:
                 # Non-retryable error (invalid response), raise immediately
@@ -219,6 +271,7 @@ class SandboxEnv:
             except Exception as e:
                 # Unexpected error, consider it connection/env related and retry
                 last_exception = e
+                self._record_failure(endpoint)
 
         # If we reach here, we never succeeded
         if last_exception:
@@ -227,6 +280,56 @@ class SandboxEnv:
             # If no last_exception, unlikely scenario, but handle it:
             raise SandboxConnectionError("Failed to get sandbox logs for unknown reasons after retries.")
 
+    async def run_files(self, file_refs: List[str]) -> List[List[str]]:
+        """
+        Analyze several files concurrently; returns their logs in file_refs order.
+        Each run_file goes to a worker thread (pooled session, own endpoint pick),
+        so K sandbox calls take about as long as the slowest one instead of their sum.
+        The first failure is raised, like run_file.
+        """
+        return list(await asyncio.gather(*(asyncio.to_thread(self.run_file, ref) for ref in file_refs)))
+
+    def run_files_batch(self, file_refs: List[str]) -> Dict[str, List[str]]:
+        """
+        Analyze several files with one POST {"file_refs": [...]} to {endpoint}/analyze/batch.
+        Expects {"results": {"<ref>": {"logs": [...]}}} and returns {ref: logs}.
+
+        If the sandbox has no batch route (404/405, remembered per endpoint) or is
+        unreachable, falls back to concurrent per-file run_file calls.
+        """
+        refs = [ref.strip() for ref in file_refs]
+        if any(not ref for ref in refs):
+            raise ValueError("file_ref must not be empty in run_files_batch.")
+        if not refs:
+            return {}
+
+        endpoint = self._choose_endpoint()
+        if endpoint not in self._no_batch_endpoints:
+            try:
+                r = self._session.post(f"{endpoint}/analyze/batch", json={"file_refs": refs}, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                self._record_failure(endpoint)
+                r = None
+            if r is not None and r.status_code in (404, 405):
+                self._no_batch_endpoints.add(endpoint)
+            elif r is not None:
+                if r.status_code != 200:
+                    raise SandboxResponseError(f"Sandbox returned status {r.status_code}: {r.text}")
+                try:
+                    results = orjson.loads(r.content).get("results")
+                    out = {ref: results[ref]["logs"] for ref in refs}
+                except (orjson.JSONDecodeError, AttributeError, KeyError, TypeError):
+                    raise SandboxResponseError("Sandbox batch response missing 'results' logs for some file_refs.")
+                if not all(isinstance(logs, list) for logs in out.values()):
+                    raise SandboxResponseError("Sandbox batch response has non-list 'logs'.")
+                self._record_success(endpoint)
+                return out
+
+        # Per-file fallback, one pooled request per file in parallel
+        unique_refs = list(dict.fromkeys(refs))
+        with ThreadPoolExecutor(max_workers=min(BATCH_FALLBACK_WORKERS, len(unique_refs))) as pool:
+            return dict(zip(unique_refs, pool.map(self.run_file, unique_refs)))
+
 ###############################################################################
 # Explanation:
 #
@@ -234,6 +337,11 @@ class SandboxEnv:
 # - If no endpoints are available, `_provision_new_sandbox()` attempts to dynamically create sandbox instances.
 # - On successful provisioning, endpoints appear in instances.json, reloaded via `_reload_endpoints()`.
 # - `run_file()` attempts multiple retries on network failures and raises clear exceptions if permanent failures occur.
+# - `run_files()` fans several run_file calls out concurrently for async callers.
+# - `run_files_batch()` sends many file_refs in one /analyze/batch request, falling
+#   back to parallel run_file calls for sandboxes without that route.
+# - `_choose_endpoint()` skips endpoints that keep failing (circuit breaker with a
+#   capped exponential cooldown) so retries go to healthy sandboxes first.
 # - The code is heavily commented, making it easy to maintain and extend.
 #
 # Future Enhancements:
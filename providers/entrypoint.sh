@@ -76,5 +76,7 @@ if [ "$MODE" = "test" ]; then
 
 else
   echo "Starting Providers server in run mode..."
-  uvicorn provider_server:app --host 0.0.0.0 --port 8003
+  # uvloop event loop + httptools parser (both installed by uvicorn[standard]).
+  # Single worker on purpose: emulator task_map and caches live in process memory.
+  uvicorn provider_server:app --host 0.0.0.0 --port 8003 --loop uvloop --http httptools
 fi
\ No newline at end of file
@@ -33,7 +33,7 @@
 # - If authentication or CORS is needed, integrate appropriate middleware here.
 #
 # Running the Server:
-# - Typically run via: `uvicorn provider_server:app --host 0.0.0.0 --port 8003`
+# - Typically run via: `uvicorn provider_server:app --host 0.0.0.0 --port 8003 --loop uvloop --http httptools`
 # - Once running, endpoints like `/health` or `/llm/chat_complete` become available.
 # - The admin UI is accessible at `http://localhost:8003/admin/ui` (if mounted that way).
 #
@@ -44,9 +44,11 @@
 #
 ###############################################################################
 
+import asyncio
 import logging
 from fastapi import FastAPI
 from utils import config_loader
+from core.llm_cache import load_semantic_cache
 
 # Import routers from the api subdirectory
 from api import (
@@ -99,10 +101,12 @@ def create_app() -> FastAPI:
     )
 
     # Include various routers. Each router handles a specific area of functionality.
+    # Starlette matches routes in registration order, one regex per route, so the
+    # high-rate emulator control routes (tap/swipe/screenshot...) go first.
+    app.include_router(routes_emulator.router, prefix="/emulator", tags=["emulator"])
     app.include_router(routes_health.router, prefix="/health", tags=["health"])
     app.include_router(routes_llm.router, prefix="/llm", tags=["llm"])
     app.include_router(routes_sandbox.router, prefix="/sandbox", tags=["sandbox"])
-    app.include_router(routes_emulator.router, prefix="/emulator", tags=["emulator"])
     app.include_router(routes_admin.router, prefix="/admin", tags=["admin"])
     app.include_router(routes_vnc.router, prefix="", tags=["vnc"])
 
@@ -120,12 +124,22 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     async def startup_event():
         logger.info("Providers subsystem starting up...")
+        # Build the sandbox/emulator environments here rather than at import time,
+        # so config loading happens once the worker is up (and off the event loop)
+        await asyncio.gather(
+            asyncio.to_thread(routes_sandbox.get_sandbox_env),
+            asyncio.to_thread(routes_emulator.get_emulator_env),
+            # The embedding model is loaded here, never on a request's path
+            asyncio.to_thread(load_semantic_cache),
+        )
         # Could initialize connections, load models, or provision base resources if needed.
 
     # Shutdown event: Log that subsystem is shutting down
     @app.on_event("shutdown")
     async def shutdown_event():
         logger.info("Providers subsystem shutting down...")
+        await routes_health.close_client()
+        routes_emulator.close_emulator_env()
         # Could close connections or release resources.
 
     # Mount the Gradio admin UI at /admin/ui:
@@ -0,0 +1,155 @@
+###############################################################################
+# test_emulator_shell.py
+#
+# Purpose:
+# Unit tests for EmulatorEnv's persistent `adb shell` (_run_adb_shell) without
+# adb or a device. subprocess.Popen is replaced by FakeShell, whose stdout is
+# a real os.pipe so the select()/os.read() loop runs unchanged; each command
+# written to stdin is answered with the next scripted reply.
+#
+# Covered:
+# - Sentinel parsing (exit code, CRLF, reply split across reads).
+# - A shell that dies mid-command returns (None, b"") and is replaced next call.
+# - Timeout kills the shell and raises subprocess.TimeoutExpired.
+# - _run_adb_command falls back to one-shot adb when the shell returns None.
+# - init_device closes the shells of the emulators it replaces.
+###############################################################################
+
+import os
+import subprocess
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from core.emulator_env import EmulatorEnv, EmulatorConnectionError, ADB_SHELL_SENTINEL
+
+HOST = "10.0.0.1:5555"
+HANG = object()
+
+
+class FakeStdin:
+    def __init__(self, shell):
+        self.shell = shell
+
+    def write(self, data: bytes):
+        self.shell.commands.append(data)
+        self.shell.respond()
+
+
+class FakeShell:
+    """
+    Stands in for the Popen of `adb -s HOST shell`. Each reply is bytes, None
+    (EOF), HANG (no output) or a list of bytes/None written in order.
+    """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.commands = []
+        self.killed = False
+        self._r, self._w = os.pipe()
+        self.stdin = FakeStdin(self)
+        self.stdout = os.fdopen(self._r, "rb", buffering=0)
+
+    def respond(self):
+        reply = self.replies.pop(0)
+        if reply is HANG:
+            return
+        for part in reply if isinstance(reply, list) else [reply]:
+            if part is None:
+                self._close_write()
+            else:
+                os.write(self._w, part)
+
+    def _close_write(self):
+        if self._w is not None:
+            os.close(self._w)
+            self._w = None
+
+    def poll(self):
+        return -9 if self.killed else None
+
+    def kill(self):
+        self.killed = True
+        self._close_write()
+
+    def wait(self):
+        return -9
+
+
+def _done(code: int) -> bytes:
+    return f"{ADB_SHELL_SENTINEL}{code}\r\n".encode()
+
+
+@pytest.fixture
+def env():
+    with patch("utils.config_loader.load_config") as mock_config_loader:
+        mock_config_loader.return_value = {"llm": {}, "sandbox": {}, "emulator": {}}
+        yield EmulatorEnv()
+
+
+def test_shell_parses_sentinel_and_exit_code(env):
+    shell = FakeShell([b"package:com.a\r\npackage:com.b\r\n" + _done(0), _done(3)])
+    with patch("subprocess.Popen", return_value=shell) as popen:
+        assert env._run_adb_shell(HOST, "pm list packages", 5) == (0, b"package:com.a\r\npackage:com.b")
+        assert env._run_adb_shell(HOST, "false", 5) == (3, b"")
+    # One persistent shell served both commands
+    popen.assert_called_once()
+    assert shell.commands[0] == f"{{ pm list packages\n}} </dev/null; echo {ADB_SHELL_SENTINEL}$?\n".encode()
+
+
+def test_shell_reply_split_across_reads(env):
+    shell = FakeShell([HANG])
+    # Sentinel arrives in two writes, the second after the reader is already waiting
+    timer = threading.Timer(0.05, lambda: os.write(shell._w, b"_END__0\n"))
+    with patch("subprocess.Popen", return_value=shell):
+        os.write(shell._w, b"hello\n__WOPA")
+        timer.start()
+        assert env._run_adb_shell(HOST, "echo hello", 5) == (0, b"hello")
+    timer.join()
+
+
+def test_shell_dying_mid_command_is_replaced(env):
+    dying = FakeShell([[b"partial out", None]])
+    fresh = FakeShell([b"ok\n" + _done(0)])
+    with patch("subprocess.Popen", side_effect=[dying, fresh]):
+        assert env._run_adb_shell(HOST, "getprop", 5) == (None, b"")
+        assert HOST not in env._shells
+        assert env._run_adb_shell(HOST, "getprop", 5) == (0, b"ok")
+
+
+def test_shell_timeout_kills_shell(env):
+    shell = FakeShell([HANG])
+    with patch("subprocess.Popen", return_value=shell):
+        with pytest.raises(subprocess.TimeoutExpired):
+            env._run_adb_shell(HOST, "sleep 100", 0.05)
+    assert shell.killed
+    assert HOST not in env._shells
+
+
+def test_shell_start_failure_returns_none(env):
+    with patch("subprocess.Popen", side_effect=OSError("adb not found")):
+        assert env._run_adb_shell(HOST, "getprop", 5) == (None, b"")
+
+
+def test_adb_command_falls_back_to_one_shot(env):
+    completed = subprocess.CompletedProcess(["adb"], 0, stdout="one-shot\n", stderr="")
+    with patch.object(env, "_run_adb_shell", return_value=(None, b"")) as shell, \
+         patch("subprocess.run", return_value=completed) as run:
+        assert env._run_adb_command(["adb", "-s", HOST, "shell", "getprop"]) == "one-shot"
+    shell.assert_called_once_with(HOST, "getprop", env.timeout)
+    run.assert_called_once()
+
+
+def test_init_device_closes_shells(env):
+    shell = FakeShell([_done(0)])
+    with patch("subprocess.Popen", return_value=shell):
+        env._run_adb_shell(HOST, "true", 5)
+    with patch("core.provisioner.provision_emulators"), \
+         patch.object(env, "_reload_endpoints"), \
+         patch("os.path.exists", return_value=False):
+        # No endpoints after provisioning: init_device stops right after the reset
+        with pytest.raises(EmulatorConnectionError):
+            env.init_device()
+    assert shell.killed
+    assert env._shells == {}
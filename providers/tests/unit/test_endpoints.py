@@ -140,6 +140,12 @@ def test_sandbox_run_file_malware(mock_config, mock_sandbox):
     assert "logs" in data
     assert any("suspicious" in log.lower() for log in data["logs"])
 
+def test_sandbox_run_file_empty_ref(mock_config, mock_sandbox):
+    # A blank file_ref is rejected by the handler with 400, not a 422 validation error
+    response = client.post("/sandbox/run_file", json={"file_ref":"   "})
+    assert response.status_code == 400
+    assert "must not be empty" in response.json()["detail"]
+
 def test_emulator_run_app(mock_config, mock_emulator):
     # Test if /emulator/run_app returns task_id and other fields
     mock_run_app, _ = mock_emulator
@@ -171,6 +177,12 @@ def test_vnc_url_not_found(mock_config, mock_emulator):
     data = response.json()
     assert "not found" in data["detail"].lower()
 
+def test_vnc_url_blank_task_id(mock_config, mock_emulator):
+    # A whitespace-only task_id gets 400
+    response = client.get("/%20%20/vnc")
+    assert response.status_code == 400
+    assert "must not be empty" in response.json()["detail"]
+
 def test_admin_endpoints(mock_config):
     # Check admin endpoints listing /admin/endpoints
     response = client.get("/admin/endpoints")
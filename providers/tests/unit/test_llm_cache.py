@@ -0,0 +1,265 @@
+###############################################################################
+# test_llm_cache.py
+#
+# Purpose:
+# Unit tests for core/llm_cache.py without Ollama or sentence-transformers:
+# - hash_request normalization and the SQLite exact cache (get/set, TTL,
+#   LLM_CACHE_ENABLED=0, blank prompts, replies that fail validation).
+# - Request coalescing: concurrent identical calls share one LLM request.
+# - The semantic tier, driven by a fake embedder with hand-picked vectors, so
+#   hits, misses and near-misses are decided by known cosine similarities.
+#
+# Requirements:
+# - pytest's tmp_path and monkeypatch fixtures; each test gets a fresh SQLite
+#   file and a fresh SemanticCache.
+###############################################################################
+
+import threading
+import time
+
+import numpy as np
+import orjson
+import pytest
+
+from core import llm_cache
+from core.llm_cache import Cache, SemanticCache, cached_call, hash_request
+
+
+def _unit(cos: float) -> np.ndarray:
+    """2-d unit vector whose cosine with [1, 0] is `cos`."""
+    return np.array([cos, np.sqrt(1.0 - cos * cos)], dtype=np.float32)
+
+# Subject -> embedding; cosines are against "bad.co/login1"
+VECTORS = {
+    "bad.co/login1": _unit(1.0),
+    "bad.co/login2": _unit(0.96),   # above both thresholds
+    "bad.co/signup": _unit(0.93),   # hit for url (0.92), near-miss for message (0.95)
+    "bad.co/about": _unit(0.90),    # near-miss for url
+    "good.org": _unit(0.0),
+    "bad.c0/login1": _unit(0.99),   # lookalike host: close vector, different hostname
+}
+
+
+class FakeClient:
+    chat_model_name = "test-model"
+
+    def __init__(self):
+        self.calls = []
+
+    @cached_call("chat_model_name", namespace="json")
+    def interpret_chat_json(self, prompt: str) -> str:
+        self.calls.append(prompt)
+        return f"answer {len(self.calls)}"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = Cache(str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", c)
+    return c
+
+
+@pytest.fixture
+def semantic(cache, monkeypatch):
+    s = SemanticCache(lambda text: VECTORS[text])
+    monkeypatch.setattr(llm_cache, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_semantic_cache", s)
+    monkeypatch.setattr(llm_cache, "_semantic_loaded", True)
+    return s
+
+
+def test_hash_request_normalizes_prompt():
+    assert hash_request("m", "  Is THIS Safe?\n") == hash_request("m", "is this safe?")
+    # NFC: "e" + combining acute equals the precomposed "\u00e9"
+    assert hash_request("m", "caf\u00e9") == hash_request("m", "cafe\u0301")
+    assert hash_request("m", "hello") != hash_request("other", "hello")
+
+
+def test_cache_get_set(cache):
+    assert cache.get("k") is None
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    cache.set("k", "v2")
+    assert cache.get("k") == "v2"
+
+
+def test_cache_ttl_expires(tmp_path):
+    c = Cache(str(tmp_path / "ttl.sqlite3"), ttl=-1)
+    c.set("k", "v")
+    assert c.get("k") is None
+
+
+def test_cached_call_serves_repeat_prompt(cache):
+    client = FakeClient()
+    assert client.interpret_chat_json("Is bad.co safe?") == "answer 1"
+    assert client.interpret_chat_json("  is BAD.CO safe?  ") == "answer 1"
+    assert len(client.calls) == 1
+    assert cache.get(hash_request("test-model:json", "Is bad.co safe?")) == "answer 1"
+
+
+def test_cached_call_disabled_by_env(cache, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_ENABLED", False)
+    client = FakeClient()
+    client.interpret_chat_json("Is bad.co safe?")
+    client.interpret_chat_json("Is bad.co safe?")
+    assert len(client.calls) == 2
+    assert cache.get(hash_request("test-model:json", "Is bad.co safe?")) is None
+
+
+def test_cached_call_skips_blank_prompt(cache):
+    client = FakeClient()
+    client.interpret_chat_json("   ")
+    client.interpret_chat_json("   ")
+    assert len(client.calls) == 2
+    assert cache.get(hash_request("test-model:json", "   ")) is None
+
+
+class JsonClient:
+    chat_model_name = "test-model"
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    @cached_call("chat_model_name", namespace="json", validate=orjson.loads)
+    def interpret_chat_json(self, prompt: str) -> str:
+        self.calls += 1
+        return self.replies.pop(0)
+
+
+def test_cached_call_skips_invalid_json(cache):
+    # A truncated reply is returned but not cached, so the retry calls the LLM again
+    client = JsonClient(['{"suspicious": "ye', '{"suspicious": "yes"}'])
+    assert client.interpret_chat_json("Is bad.co safe?") == '{"suspicious": "ye'
+    assert client.interpret_chat_json("Is bad.co safe?") == '{"suspicious": "yes"}'
+    assert client.interpret_chat_json("Is bad.co safe?") == '{"suspicious": "yes"}'
+    assert client.calls == 2
+
+
+def test_semantic_hit_on_similar_subject(semantic):
+    client = FakeClient()
+    first = client.interpret_chat_json("PREFIX worker says 1", subject="bad.co/login1", subject_kind="url")
+    second = client.interpret_chat_json("PREFIX worker says 2", subject="bad.co/login2", subject_kind="url")
+    assert second == first
+    assert len(client.calls) == 1
+
+
+def test_semantic_miss_on_unrelated_subject(semantic):
+    client = FakeClient()
+    client.interpret_chat_json("PREFIX worker says 1", subject="bad.co/login1", subject_kind="url")
+    other = client.interpret_chat_json("PREFIX worker says 2", subject="good.org", subject_kind="url")
+    assert other == "answer 2"
+    assert len(client.calls) == 2
+
+
+def test_semantic_near_miss_below_threshold(semantic):
+    client = FakeClient()
+    client.interpret_chat_json("PREFIX worker says 1", subject="bad.co/login1", subject_kind="url")
+    near = client.interpret_chat_json("PREFIX worker says 2", subject="bad.co/about", subject_kind="url")
+    assert near == "answer 2"
+
+
+def test_semantic_url_match_requires_same_host(semantic):
+    client = FakeClient()
+    client.interpret_chat_json("PREFIX worker says 1", subject="bad.co/login1", subject_kind="url")
+    lookalike = client.interpret_chat_json("PREFIX worker says 2", subject="bad.c0/login1", subject_kind="url")
+    assert lookalike == "answer 2"
+
+
+def test_semantic_tier_waits_for_startup_load(cache, monkeypatch):
+    # Until load_semantic_cache has run, requests never load the model themselves
+    monkeypatch.setattr(llm_cache, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_semantic_loaded", False)
+    monkeypatch.setattr(llm_cache, "_load_embedder", lambda: pytest.fail("embedder loaded on request path"))
+    client = FakeClient()
+    client.interpret_chat_json("PREFIX worker says 1", subject="bad.co/login1", subject_kind="url")
+    assert client.interpret_chat_json("PREFIX worker says 2", subject="bad.co/login2", subject_kind="url") == "answer 2"
+
+
+def test_semantic_threshold_is_per_kind(semantic):
+    # cosine 0.93 clears the url threshold but not the stricter message one
+    urls, messages = FakeClient(), FakeClient()
+    urls.interpret_chat_json("url 1", subject="bad.co/login1", subject_kind="url")
+    assert urls.interpret_chat_json("url 2", subject="bad.co/signup", subject_kind="url") == "answer 1"
+    messages.interpret_chat_json("msg 1", subject="bad.co/login1", subject_kind="message")
+    assert messages.interpret_chat_json("msg 2", subject="bad.co/signup", subject_kind="message") == "answer 2"
+
+
+def test_semantic_tier_is_opt_in(semantic):
+    # Without a subject only exact prompts are shared
+    client = FakeClient()
+    client.interpret_chat_json("PREFIX worker says 1")
+    assert client.interpret_chat_json("PREFIX worker says 2") == "answer 2"
+    assert client.interpret_chat_json("PREFIX worker says 3", subject="bad.co/login1") == "answer 3"
+
+
+def test_semantic_hit_not_promoted_to_exact_cache(cache, semantic):
+    client = FakeClient()
+    client.interpret_chat_json("PREFIX worker says 1", subject="bad.co/login1", subject_kind="url")
+    client.interpret_chat_json("PREFIX worker says 2", subject="bad.co/login2", subject_kind="url")
+    assert cache.get(hash_request("test-model:json", "PREFIX worker says 2")) is None
+
+
+class BlockingClient:
+    """Holds every call until `release` is set, then returns or raises `outcome`."""
+    chat_model_name = "test-model"
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    @cached_call("chat_model_name")
+    def interpret_chat(self, prompt: str) -> str:
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def _call_concurrently(client, n=2):
+    """Start n identical calls (the first one owns the request); return results/errors."""
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = client.interpret_chat("Is bad.co safe?")
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    threads[0].start()
+    assert client.started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    # Let the waiters reach future.result() before the owner finishes
+    time.sleep(0.1)
+    client.release.set()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_coalesced_calls_share_one_request(cache):
+    client = BlockingClient("answer")
+    assert _call_concurrently(client) == ["answer", "answer"]
+    assert client.calls == 1
+
+
+def test_coalesced_calls_share_owner_exception(cache):
+    error = RuntimeError("ollama down")
+    client = BlockingClient(error)
+    results = _call_concurrently(client)
+    assert results == [error, error]
+    assert client.calls == 1
+
+
+def test_coalesce_wait_timeout_falls_back_to_own_call(cache, monkeypatch):
+    monkeypatch.setattr(llm_cache, "COALESCE_WAIT_SECONDS", 0.01)
+    client = BlockingClient("answer")
+    assert _call_concurrently(client) == ["answer", "answer"]
+    assert client.calls == 2
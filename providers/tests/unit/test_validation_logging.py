@@ -31,7 +31,7 @@
 
 import pytest
 from unittest.mock import patch
-from core.llm_client import LLMClient
+from core.llm_client import LLMClient, LLMResponseError
 from core.sandbox_env import SandboxEnv
 from core.emulator_env import EmulatorEnv
 from utils.config_loader import load_config
@@ -54,6 +54,32 @@ def test_llmclient_empty_prompt(mock_config):
         llm.interpret("")
     assert "Prompt must not be empty" in str(excinfo.value)
 
+def test_llmclient_json_stream_stops_at_object_end(mock_config):
+    # Chunks after the outer object closes must not be consumed
+    import json
+    chunks = [
+        {"response": "Sure: {\"verdict\": \"phish", "done": False},
+        {"response": "ing\", \"why\": \"has } and {\", \"n\": {\"a\": 1}}", "done": False},
+        {"response": " trailing text", "done": False},
+    ]
+    consumed = []
+
+    def lines():
+        for c in chunks:
+            consumed.append(c)
+            yield json.dumps(c).encode()
+
+    result = LLMClient._read_json_stream(lines())
+    assert json.loads(result) == {"verdict": "phishing", "why": "has } and {", "n": {"a": 1}}
+    assert len(consumed) == 2
+
+def test_llmclient_json_stream_cut_off(mock_config):
+    # A stream that ends inside the object is an error, not a partial success
+    import json
+    chunks = [{"response": "{\"suspicious\": \"ye", "done": False}, {"response": "", "done": True}]
+    with pytest.raises(LLMResponseError):
+        LLMClient._read_json_stream(json.dumps(c).encode() for c in chunks)
+
 def test_sandbox_empty_file_ref(mock_config):
     sandbox = SandboxEnv()
     with pytest.raises(ValueError) as excinfo:
@@ -95,6 +121,20 @@ def test_sandbox_connection_error(mock_config):
             sandbox.run_file("malware_test.bin")
         assert "unreachable" in str(excinfo.value).lower()
 
+def test_sandbox_endpoint_cooldown(mock_config):
+    # After ENDPOINT_FAIL_THRESHOLD failures an endpoint is skipped, then retried after its cooldown
+    from core.sandbox_env import ENDPOINT_FAIL_THRESHOLD
+    sandbox = SandboxEnv()
+    sandbox.endpoints = ["http://sandbox-a:8002", "http://sandbox-b:8002"]
+    with patch("time.monotonic", return_value=1000.0):
+        for _ in range(ENDPOINT_FAIL_THRESHOLD):
+            sandbox._record_failure("http://sandbox-a:8002")
+        assert {sandbox._choose_endpoint() for _ in range(4)} == {"http://sandbox-b:8002"}
+    with patch("time.monotonic", return_value=1000.0 + 2 ** ENDPOINT_FAIL_THRESHOLD):
+        assert {sandbox._choose_endpoint() for _ in range(4)} == {"http://sandbox-a:8002", "http://sandbox-b:8002"}
+    sandbox._record_success("http://sandbox-a:8002")
+    assert sandbox._endpoint_health == {}
+
 def test_emulator_connection_error(mock_config):
     from core.emulator_env import EmulatorEnv, EmulatorConnectionError
     from unittest.mock import patch
@@ -21,9 +21,43 @@
 # - If we want defaults for missing keys, could implement them here.
 ###############################################################################
 
+import copy
 import os
+import threading
+import orjson
 import yaml
 
+# libyaml-backed loader when available (same safe semantics, much faster parse)
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Parsed files keyed by path -> ((st_mtime_ns, st_size), data).
+# SandboxEnv/EmulatorEnv/LLMClient each load config.yaml and re-read instances.json
+# on every provisioning pass, and /admin/config reads both on every request; an
+# unchanged file is parsed once per process, while an edited file (new
+# mtime/size) is picked up on the next call.
+_file_cache = {}
+_cache_lock = threading.Lock()
+
+def parse_yaml(raw: bytes):
+    return yaml.load(raw, Loader=YamlLoader)
+
+def load_cached(path: str, parser):
+    """
+    Return parser(file bytes) for path, reusing the last result while the file's
+    mtime and size are unchanged. The result is shared: copy it before mutating.
+    """
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        hit = _file_cache.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    with open(path, "rb") as f:
+        data = parser(f.read())
+    with _cache_lock:
+        _file_cache[path] = (key, data)
+    return data
+
 
 def load_config(path: str = f"config.yaml") -> dict:
     """
@@ -33,20 +67,19 @@ def load_config(path: str = f"config.yaml") -> dict:
     1. Check if file exists.
        - If not, raise FileNotFoundError or return empty dict depending on design.
        Here, we raise FileNotFoundError because config is presumably essential.
-    2. Open file, parse YAML with yaml.safe_load.
+    2. Parse YAML (CSafeLoader) unless the cached copy matches the file's mtime/size.
     3. If parsing fails (e.g., invalid YAML), raise ValueError.
-    4. Return the parsed dictionary.
+    4. Return a deep copy of the parsed dictionary, so callers can't mutate the cache.
     """
     if not os.path.exists(path):
         raise FileNotFoundError(f"Configuration file not found at: {path}")
 
     try:
-        with open(path, "r") as f:
-            data = yaml.safe_load(f)
-            if not isinstance(data, dict):
-                # If YAML is empty or doesn't result in a dict, return empty dict or raise ValueError
-                raise ValueError(f"Invalid or empty config in: {path}")
-            return data
+        data = load_cached(path, parse_yaml)
+        if not isinstance(data, dict):
+            # If YAML is empty or doesn't result in a dict, return empty dict or raise ValueError
+            raise ValueError(f"Invalid or empty config in: {path}")
+        return copy.deepcopy(data)
     except yaml.YAMLError as e:
         # YAML parsing error
         raise ValueError(f"Failed to parse YAML config at {path}: {e}")
@@ -54,12 +87,22 @@ def load_config(path: str = f"config.yaml") -> dict:
         # Unexpected error reading file
         raise ValueError(f"Unexpected error loading config at {path}: {e}")
 
+def load_instances(path: str = "instances.json") -> dict:
+    """
+    Return the parsed instances.json written by the provisioner, or {} if it
+    doesn't exist yet. Parsed with orjson and cached by mtime like load_config.
+    """
+    if not os.path.exists(path):
+        return {}
+    return copy.deepcopy(load_cached(path, orjson.loads))
+
 ###############################################################################
 # Explanation:
 #
 # - load_config(path):
 #   - Checks file existence.
-#   - Uses yaml.safe_load to parse. If YAML invalid, raises ValueError.
+#   - Parses with the safe YAML loader (C-accelerated if available). If YAML invalid, raises ValueError.
+#   - Parsed results are cached per path and reused while mtime/size are unchanged.
 #   - If parsed data not a dict (like empty file or non-object), also ValueError.
 #
 # - Error Handling:
@@ -68,7 +111,9 @@ def load_config(path: str = f"config.yaml") -> dict:
 #   - Unexpected IO error: ValueError
 #
 # Future Enhancements:
-# - Could implement caching if performance becomes an issue.
+# - load_instances(path): same cache for instances.json, parsed with orjson.
+# - load_cached(path, parser) / parse_yaml: the shared cache itself, also used
+#   read-only by /admin/config.
 # - Could merge multiple config files (like a base config and an environment-specific overlay).
 # - If defaults needed, apply them here or in the calling modules.
 ###############################################################################
@@ -0,0 +1,30 @@
+###############################################################################
+# http_session.py
+#
+# Purpose:
+# Provides `make_session()`, a requests.Session with a keep-alive connection
+# pool. LLMClient (Ollama) and SandboxEnv (sandbox /analyze) each hold one, so
+# repeated calls reuse open TCP connections instead of connecting per request.
+#
+# Maintainability:
+# - Retries stay in the callers (e.g. SandboxEnv.run_file), so the adapter
+#   itself never retries (max_retries=0).
+# - Pool sizes are module constants; raise POOL_MAXSIZE if more threads call
+#   the same host concurrently.
+###############################################################################
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Distinct hosts kept in the pool, and connections kept per host
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 32
+
+def make_session() -> requests.Session:
+    """Return a Session whose http(s) adapters keep up to POOL_MAXSIZE connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
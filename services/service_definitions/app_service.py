@@ -26,6 +26,7 @@ import requests
 import logging
 from typing import Optional, Dict
 from .base_service import BaseService
+from utils.json_extract import extract_json_object
 
 logger = logging.getLogger("services")
 
@@ -157,29 +158,28 @@ class AppService(BaseService):
 
     def _strict_json_parse(self, raw_response, required_keys=[]):
         """
-        Parse aggregator LLM response as JSON, fallback to regex if direct parse fails.
+        Parse aggregator LLM response as JSON, fallback to the first {...} block if direct parse fails.
         """
-        import json
+        import orjson
         logger.debug("AppService._strict_json_parse: raw_response=%s", raw_response)
         try:
-            parsed = json.loads(raw_response)
+            parsed = orjson.loads(raw_response)
             if any(k not in parsed for k in required_keys):
                 logger.warning("LLM JSON missing required keys in direct parse")
                 return {"status":"error","message":"LLM JSON missing required keys"}
             return {"status":"completed","result":parsed}
-        except json.JSONDecodeError:
-            logger.debug("AppService._strict_json_parse: direct parse failed, try regex fallback")
-            import re
-            match = re.search(r'\{.*\}', raw_response, flags=re.DOTALL)
-            if match:
-                block = match.group(0).strip()
+        except orjson.JSONDecodeError:
+            logger.debug("AppService._strict_json_parse: direct parse failed, try block extraction")
+            # Brace-depth scan: stops at the end of the first complete object
+            block = extract_json_object(raw_response)
+            if block:
                 try:
-                    parsed = json.loads(block)
+                    parsed = orjson.loads(block)
                     if any(k not in parsed for k in required_keys):
                         logger.warning("LLM JSON missing required keys in fallback block")
                         return {"status":"error","message":"LLM JSON missing keys in fallback"}
                     return {"status":"completed","result":parsed}
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     logger.warning("LLM fallback block not valid JSON")
                     return {"status":"error","message":"LLM response not valid JSON (fallback attempt)"}
             logger.warning("No valid JSON block found in LLM response.")
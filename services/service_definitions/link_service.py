@@ -26,9 +26,18 @@ import requests
 import logging
 from typing import Optional, Dict
 from .base_service import BaseService
+from utils.json_extract import extract_json_object
 
 logger = logging.getLogger("services")
 
+# Fixed instructions go first and the per-request analysis last, so every
+# aggregator prompt shares the same prefix and the LLM server can reuse its
+# KV cache for it instead of re-evaluating the boilerplate each call.
+AGGREGATOR_PROMPT_PREFIX = (
+    "Return ONLY JSON: {\"suspicious\":\"yes/no\",\"reason\":\"explain reasoning\"}. Be Strict and carefully look at the content. No extra text. If any word outside JSON braces, invalid.\n"
+    "Link analysis: "
+)
+
 class LinkService(BaseService):
     def __init__(self, config: dict):
         """
@@ -101,9 +110,10 @@ class LinkService(BaseService):
             return {"status":"error","message":f"Net err calling link worker: {str(e)}"}
 
         # Call aggregator LLM:
-        prompt = f"Based on this link analysis: {worker_result}.\nReturn JSON: {{\"suspicious\":\"yes/no\",\"reason\":\"explain reasoning\"}}. Be Strict and carefully look at the content. No extra text. If any word outside JSON braces, invalid. Return ONLY JSON."
+        prompt = AGGREGATOR_PROMPT_PREFIX + str(worker_result)
         logger.info("LinkService.process: Calling aggregator LLM with prompt.")
-        llm_resp = self._call_llm_for_json(prompt, self.provider_server_url, ["suspicious","reason"])
+        llm_resp = self._call_llm_for_json(prompt, self.provider_server_url, ["suspicious","reason"],
+                                           subject=task_data["url"])
         if llm_resp.get("status") == "error":
             logger.warning("LinkService.process: Aggregator LLM error %s", llm_resp.get("message"))
             return {"status":"error","message":llm_resp.get("message","Aggregator LLM error")}
@@ -124,9 +134,11 @@ class LinkService(BaseService):
             "example_input": {"url":"http://example.com/malicious"}
         }
 
-    def _call_llm_for_json(self, prompt, base_url, required_keys):
+    def _call_llm_for_json(self, prompt, base_url, required_keys, subject=None):
         """
         Call aggregator LLM endpoint with given prompt.
+        `subject` is the url being judged; providers uses it (not the
+        whole prompt) for near-match caching.
 
         On success: {"status":"completed","result":parsed_dict}
         On error: {"status":"error","message":"..."}
@@ -136,7 +148,9 @@ class LinkService(BaseService):
         for i in range(json_max_retries):
             try:
                 logger.info("LinkService._call_llm_for_json: Sending prompt to LLM: %s", prompt)
-                llm_resp = requests.post(llm_endpoint, json={"prompt": prompt}, timeout=20)
+                # json_mode: providers streams the reply and stops once the JSON object closes
+                llm_resp = requests.post(llm_endpoint, json={"prompt": prompt, "json_mode": True,
+                                                          "subject": subject, "subject_kind": "url"}, timeout=20)
                 logger.info("LinkService._call_llm_for_json: LLM response code=%s body=%s", llm_resp.status_code, llm_resp.text)
                 if llm_resp.status_code != 200:
                     logger.warning("LLM HTTP error code=%d", llm_resp.status_code)
@@ -162,29 +176,28 @@ class LinkService(BaseService):
                     return {"status":"error","message":f"Net err aggregator LLM: {str(e)}"}
     def _strict_json_parse(self, raw_response, required_keys=[]):
         """
-        Parse aggregator LLM response as JSON, fallback to regex block if direct parse fails.
+        Parse aggregator LLM response as JSON, fallback to the first {...} block if direct parse fails.
         """
-        import json
+        import orjson
         logger.debug("LinkService._strict_json_parse: raw_response=%s", raw_response)
         try:
-            parsed = json.loads(raw_response)
+            parsed = orjson.loads(raw_response)
             if any(k not in parsed for k in required_keys):
                 logger.warning("LLM JSON missing required keys in direct parse")
                 return {"status":"error","message":"LLM JSON missing required keys"}
             return {"status":"completed","result":parsed}
-        except json.JSONDecodeError:
-            logger.debug("LinkService._strict_json_parse: direct parse failed, try regex fallback")
-            import re
-            match = re.search(r'\{.*\}', raw_response, flags=re.DOTALL)
-            if match:
-                block = match.group(0).strip()
+        except orjson.JSONDecodeError:
+            logger.debug("LinkService._strict_json_parse: direct parse failed, try block extraction")
+            # Brace-depth scan: stops at the end of the first complete object
+            block = extract_json_object(raw_response)
+            if block:
                 try:
-                    parsed = json.loads(block)
+                    parsed = orjson.loads(block)
                     if any(k not in parsed for k in required_keys):
                         logger.warning("LLM JSON missing required keys in fallback block")
                         return {"status":"error","message":"LLM JSON missing keys in fallback"}
                     return {"status":"completed","result":parsed}
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     logger.warning("LLM fallback block not valid JSON")
                     return {"status":"error","message":"LLM response not valid JSON (fallback attempt)"}
             logger.warning("No valid JSON block found in LLM response.")
@@ -28,9 +28,17 @@ import requests
 import logging
 from typing import Optional, Dict
 from .base_service import BaseService
+from utils.json_extract import extract_json_object
 
 logger = logging.getLogger("services")
 
+# Fixed instructions first, per-request analysis last: a shared prompt prefix
+# lets the LLM server reuse its KV cache across aggregator calls.
+AGGREGATOR_PROMPT_PREFIX = (
+    "Return ONLY JSON: {\"suspicious\":\"yes/no\",\"reason\":\"explain reasoning\"}. Be Strict and carefully look at the content. No extra text. If any word outside JSON braces, invalid.\n"
+    "Message analysis: "
+)
+
 class MessageService(BaseService):
     def __init__(self, config: dict):
         """
@@ -96,9 +104,10 @@ class MessageService(BaseService):
             return {"status":"error","message":f"Net err calling text worker: {str(e)}"}
 
         # Call aggregator LLM:
-        prompt = f"Based on this analysis: {worker_result}.\nReturn JSON: {{\"suspicious\":\"yes/no\",\"reason\":\"explain reasoning\"}}. Be Strict and carefully look at the content. No extra text. If any word outside JSON braces, invalid. Return ONLY JSON."
+        prompt = AGGREGATOR_PROMPT_PREFIX + str(worker_result)
         logger.info("MessageService.process: Calling aggregator LLM with prompt.")
-        llm_resp = self._call_llm_for_json(prompt, self.provider_server_url, ["suspicious","reason"])
+        llm_resp = self._call_llm_for_json(prompt, self.provider_server_url, ["suspicious","reason"],
+                                           subject=task_data["message"])
         if llm_resp.get("status") == "error":
             logger.warning("MessageService.process: Aggregator LLM error %s", llm_resp.get("message"))
             return {"status":"error","message":llm_resp.get("message","Aggregator LLM error")}
@@ -120,9 +129,11 @@ class MessageService(BaseService):
             "example_input": {"message": "Check out this suspicious link"}
         }
 
-    def _call_llm_for_json(self, prompt, base_url, required_keys):
+    def _call_llm_for_json(self, prompt, base_url, required_keys, subject=None):
         """
         Call aggregator LLM endpoint with given prompt.
+        `subject` is the message being judged; providers uses it (not the
+        whole prompt) for near-match caching.
 
         On success: {"status":"completed","result":parsed_dict}
         On error: {"status":"error","message":"..."}
@@ -132,7 +143,9 @@ class MessageService(BaseService):
         for i in range(json_max_retries):
             try:
                 logger.info("MessageService._call_llm_for_json: Sending prompt to LLM: %s", prompt)
-                llm_resp = requests.post(llm_endpoint, json={"prompt": prompt}, timeout=20)
+                # json_mode: providers streams the reply and stops once the JSON object closes
+                llm_resp = requests.post(llm_endpoint, json={"prompt": prompt, "json_mode": True,
+                                                          "subject": subject, "subject_kind": "message"}, timeout=20)
                 logger.info("MessageService._call_llm_for_json: LLM response code=%s body=%s", llm_resp.status_code, llm_resp.text)
                 if llm_resp.status_code != 200:
                     logger.warning("LLM HTTP error code=%d", llm_resp.status_code)
@@ -159,33 +172,32 @@ class MessageService(BaseService):
 
     def _strict_json_parse(self, raw_response, required_keys=[]):
         """
-        Parse raw_response as JSON. If fail, try regex block extraction.
+        Parse raw_response as JSON. If fail, extract the first {...} block.
         Check required keys.
 
         Return:
         {"status":"completed","result":parsed} or {"status":"error","message":"..."}
         """
-        import json
+        import orjson
         logger.info("MessageService._strict_json_parse: raw_response=%s", raw_response)
         try:
-            parsed = json.loads(raw_response)
+            parsed = orjson.loads(raw_response)
             if any(k not in parsed for k in required_keys):
                 logger.warning("LLM JSON missing required keys in direct parse")
                 return {"status":"error","message":"LLM JSON missing required keys"}
             return {"status":"completed","result":parsed}
-        except json.JSONDecodeError:
-            logger.info("MessageService._strict_json_parse: direct parse failed, try regex")
-            import re
-            match = re.search(r'\{.*\}', raw_response, flags=re.DOTALL)
-            if match:
-                block = match.group(0).strip()
+        except orjson.JSONDecodeError:
+            logger.info("MessageService._strict_json_parse: direct parse failed, try block extraction")
+            # Brace-depth scan: stops at the end of the first complete object
+            block = extract_json_object(raw_response)
+            if block:
                 try:
-                    parsed = json.loads(block)
+                    parsed = orjson.loads(block)
                     if any(k not in parsed for k in required_keys):
                         logger.warning("LLM JSON missing required keys in fallback block")
                         return {"status":"error","message":"LLM JSON missing keys in fallback"}
                     return {"status":"completed","result":parsed}
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     logger.warning("LLM fallback block not valid JSON")
                     return {"status":"error","message":"LLM response not valid JSON (fallback attempt)"}
             logger.warning("No valid JSON block found in LLM response.")
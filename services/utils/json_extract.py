@@ -0,0 +1,54 @@
+###############################################################################
+# json_extract.py
+#
+# Purpose:
+# Pull the first complete JSON object out of an LLM completion that has extra
+# text around it (preambles, trailing explanations, a second object, ...).
+#
+# Approach:
+# - Single left-to-right scan tracking brace depth. Braces inside JSON strings
+#   (including escaped quotes) are ignored.
+# - The scan stops as soon as depth returns to zero after the first "{", so
+#   anything the model generated after the verdict is never looked at.
+#
+# Why not the old regex r'\{.*\}':
+# - It is greedy: with two objects, or a "}" in trailing prose, it captured
+#   everything from the first "{" to the last "}" and the parse failed.
+#
+# Maintainability:
+# - Returns the raw substring; callers still parse it with orjson/json and
+#   validate required keys themselves.
+###############################################################################
+
+from typing import Optional
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Return the first balanced {...} block in text, or None if there is none
+    (no "{" at all, or the object is cut off before it closes).
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_str = False
+    esc = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
@@ -1,6 +1,5 @@
 import os
 import time
-import base64
 import requests
 import re
 import logging
@@ -13,19 +12,16 @@ def _action_error(message):
     return {"status": "error", "message": message}
 
 def _get_screenshot_for_task(base_url, task_id):
+    # Raw PNG endpoint: no base64 inflation on the wire and no decode here
     try:
-        resp = requests.get(f"{base_url}/emulator/screenshot", params={"task_id": task_id}, timeout=30)
+        resp = requests.get(f"{base_url}/emulator/screenshot.png", params={"task_id": task_id}, timeout=30)
         if resp.status_code != 200:
             return {"status":"error","message":f"screenshot {resp.status_code}"}
-        data = resp.json()
-        if data.get("status")!="ok":
-            return {"status":"error","message":"screenshot not ok"}
-        b64_str = data.get("screenshot","")
-        if not b64_str:
+        if not resp.content:
             return {"status":"error","message":"No screenshot data"}
         screenshot_path = "./app_worker_screenshot.jpg"
         with open(screenshot_path,"wb") as f:
-            f.write(base64.b64decode(b64_str))
+            f.write(resp.content)
         return {"status":"completed","screenshot_path":screenshot_path}
     except requests.RequestException as e:
         return {"status":"error","message":f"Net error screenshot: {str(e)}"}